@@ -0,0 +1,193 @@
+import json
+import re
+
+# Streaming parser for the annotated answers produced by qaPrompt:
+#   entities:  [Fish Oil|Dietary Supplement]($N1)   or  [antioxidant]($N2)
+#   relations: [reduce]($R2, $N1, $N3)               or  [slow]($R2, $N3, $N2; $R3, $N4, $N2)
+#   trailer:   ... || ["Fish Oil", "cognitive decline"]
+#
+# Chunks are scanned once; only the unfinished tail of the buffer (an open tag
+# or a possible "||") is carried over to the next chunk.
+
+ENTITY_ID_RX = re.compile(r"^\$N\d+$")
+RELATION_ID_RX = re.compile(r"^\$R\d+$")
+QUOTED_RX = re.compile(r'"([^"]+)"')
+
+SEPARATOR = "||"
+MAX_TAG_LEN = 400  # an unclosed "[" longer than this is treated as plain text
+
+
+class AnnotationStreamParser:
+    def __init__(self):
+        self._buf = ""
+        self._in_question = False
+        self._question = []
+        self.entities = {}          # "$N1" -> {"id", "name", "category"}
+        self._pending_triples = []  # triples whose head/tail entity was not seen yet
+        self.triples = []
+
+    def feed(self, chunk: str):
+        """Consume one chunk of model output and return the events it completes."""
+        if not chunk:
+            return []
+        if self._in_question:
+            self._question.append(chunk)
+            return []
+        self._buf += chunk
+        return self._drain(final=False)
+
+    def close(self):
+        """Flush whatever is left once the model stream has ended."""
+        events = [] if self._in_question else self._drain(final=True)
+        if self._buf:
+            events.append(("text", {"text": self._buf}))
+            self._buf = ""
+
+        # Relations that referenced entities which never appeared
+        for triple in self._pending_triples:
+            events.append(("triple", triple))
+            self.triples.append(triple)
+        self._pending_triples = []
+
+        if self._in_question:
+            events.append(("question_entities", {"entities": _parse_question_entities("".join(self._question))}))
+        return events
+
+    def _drain(self, final: bool):
+        events = []
+        buf = self._buf
+        pos = 0
+        text_start = 0
+        n = len(buf)
+
+        while True:
+            lb = buf.find("[", pos)
+            sep = buf.find(SEPARATOR, pos)
+
+            # 1) " || " comes first → everything after it is the question-entity list
+            if sep != -1 and (lb == -1 or sep < lb):
+                if sep > text_start:
+                    events.append(("text", {"text": buf[text_start:sep]}))
+                self._in_question = True
+                self._question.append(buf[sep + len(SEPARATOR):])
+                self._buf = ""
+                return events
+
+            # 2) No more tags in the buffer; keep a trailing "|" in case it starts "||"
+            if lb == -1:
+                stop = n - 1 if (not final and buf.endswith("|")) else n
+                if stop > text_start:
+                    events.append(("text", {"text": buf[text_start:stop]}))
+                self._buf = buf[stop:]
+                return events
+
+            # 3) Try to close "[label](ids)" starting at lb
+            rb = buf.find("]", lb + 1)
+            if rb == -1 or rb + 1 >= n:
+                if final or n - lb > MAX_TAG_LEN:
+                    pos = lb + 1
+                    continue
+                break
+            if buf[rb + 1] != "(":
+                pos = lb + 1
+                continue
+            rp = buf.find(")", rb + 2)
+            if rp == -1:
+                if final or n - lb > MAX_TAG_LEN:
+                    pos = lb + 1
+                    continue
+                break
+
+            tag_events = self._tag_events(buf[lb + 1:rb], buf[rb + 2:rp])
+            if tag_events is None:
+                # Ordinary markdown link or bracketed text; leave it in the text run
+                pos = rp + 1
+                continue
+
+            if lb > text_start:
+                events.append(("text", {"text": buf[text_start:lb]}))
+            events.extend(tag_events)
+            pos = text_start = rp + 1
+
+        # An open tag is waiting for more input
+        if text_start < lb:
+            events.append(("text", {"text": buf[text_start:lb]}))
+            text_start = lb
+        self._buf = buf[text_start:]
+        return events
+
+    def _tag_events(self, label: str, inner: str):
+        ids = inner.strip()
+        if ENTITY_ID_RX.match(ids):
+            name, _, category = label.partition("|")
+            entity = {"id": ids, "name": name.strip(), "category": category.strip() or None}
+            events = [("entity", entity)]
+            if ids not in self.entities:
+                self.entities[ids] = entity
+                events.extend(self._resolve_pending())
+            return events
+
+        groups = []
+        for part in ids.split(";"):
+            fields = [f.strip() for f in part.split(",")]
+            if len(fields) != 3 or not RELATION_ID_RX.match(fields[0]) \
+                    or not all(ENTITY_ID_RX.match(f) for f in fields[1:]):
+                return None
+            groups.append(fields)
+
+        events = [("relation", {
+            "label": label.strip(),
+            "links": [{"id": r, "head": h, "tail": t} for r, h, t in groups],
+        })]
+        for rel_id, head_id, tail_id in groups:
+            triple = {
+                "relation_id": rel_id,
+                "relation": label.strip(),
+                "head_id": head_id,
+                "tail_id": tail_id,
+                "head": None,
+                "tail": None,
+            }
+            if self._fill(triple):
+                events.append(("triple", triple))
+                self.triples.append(triple)
+            else:
+                self._pending_triples.append(triple)
+        return events
+
+    def _fill(self, triple) -> bool:
+        head = self.entities.get(triple["head_id"])
+        tail = self.entities.get(triple["tail_id"])
+        if head:
+            triple["head"] = head["name"]
+        if tail:
+            triple["tail"] = tail["name"]
+        return bool(head and tail)
+
+    def _resolve_pending(self):
+        events = []
+        still_pending = []
+        for triple in self._pending_triples:
+            if self._fill(triple):
+                events.append(("triple", triple))
+                self.triples.append(triple)
+            else:
+                still_pending.append(triple)
+        self._pending_triples = still_pending
+        return events
+
+
+def _parse_question_entities(text: str):
+    s = text.strip().strip('"').strip()
+    try:
+        arr = json.loads(s)
+        if isinstance(arr, list):
+            return [str(x).strip() for x in arr if str(x).strip()]
+    except ValueError:
+        pass
+    # Not JSON: take the quoted names from the raw text, whose outer quotes strip() removed above
+    return [m.strip() for m in QUOTED_RX.findall(text) if m.strip()]
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Persistent cache of finished /api/chat answers. Entries are keyed on the
+# normalized message history plus model and prompt version, expire after a
+# TTL and are trimmed least-recently-used first once the cache is full.
+# SQLite in WAL mode lets several gunicorn workers share one file.
+#
+# Size limits are checked against the file every CHAT_CACHE_EVICT_EVERY puts,
+# or sooner once this worker's running estimate crosses a limit, so a write
+# does not scan the whole table.
+
+CHAT_CACHE_PATH = os.getenv("CHAT_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "answers.sqlite3"))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", str(7 * 24 * 3600)))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "5000"))
+CHAT_CACHE_MAX_BYTES = int(os.getenv("CHAT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CHAT_CACHE_EVICT_EVERY = int(os.getenv("CHAT_CACHE_EVICT_EVERY", "100"))
+# Replay rate for cache hits; 0 sends the whole answer without pauses
+CHAT_CACHE_REPLAY_CHARS = int(os.getenv("CHAT_CACHE_REPLAY_CHARS", "24"))
+CHAT_CACHE_REPLAY_INTERVAL = float(os.getenv("CHAT_CACHE_REPLAY_INTERVAL", "0.02"))
+
+
+def _normalize_text(text) -> str:
+    return " ".join(str(text or "").split()).lower()
+
+
+def answer_cache_key(messages, model: str, prompt_version: str) -> str:
+    history = [
+        [str(m.get("role", "")), _normalize_text(m.get("content"))]
+        for m in messages if isinstance(m, dict)
+    ]
+    payload = json.dumps([model, prompt_version, history], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, path=CHAT_CACHE_PATH, ttl=CHAT_CACHE_TTL,
+                 max_entries=CHAT_CACHE_MAX_ENTRIES, max_bytes=CHAT_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers(accessed_at)")
+        self._conn.commit()
+        self._puts = 0
+        self._count, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, answer: str):
+        if not answer:
+            return
+        now = time.time()
+        size = len(answer.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, answer, size, now, now),
+            )
+            self._puts += 1
+            self._count += 1
+            self._bytes += size
+            if (self._puts >= CHAT_CACHE_EVICT_EVERY or self._count > self.max_entries
+                    or self._bytes > self.max_bytes):
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        freed = 0
+        drop = []
+        if count > self.max_entries or total > self.max_bytes:
+            # Trim to 90% of the limits so a full cache is not scanned again on the next put
+            for key, size in self._conn.execute("SELECT key, size FROM answers ORDER BY accessed_at ASC"):
+                if count - len(drop) <= 0.9 * self.max_entries and total - freed <= 0.9 * self.max_bytes:
+                    break
+                drop.append((key,))
+                freed += size
+            self._conn.executemany("DELETE FROM answers WHERE key = ?", drop)
+        self._puts = 0
+        self._count, self._bytes = count - len(drop), total - freed
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+
+def replay_answer(answer: str, chunk_chars=CHAT_CACHE_REPLAY_CHARS, interval=CHAT_CACHE_REPLAY_INTERVAL):
+    """Yield a stored answer in small chunks, like a live model stream."""
+    step = max(1, chunk_chars)
+    for i in range(0, len(answer), step):
+        if i and interval > 0:
+            time.sleep(interval)
+        yield answer[i:i + step]
+
+
+async def areplay_answer(answer: str, chunk_chars=CHAT_CACHE_REPLAY_CHARS, interval=CHAT_CACHE_REPLAY_INTERVAL):
+    step = max(1, chunk_chars)
+    for i in range(0, len(answer), step):
+        if i and interval > 0:
+            await asyncio.sleep(interval)
+        yield answer[i:i + step]
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
+
+
+def answer_cache_stats():
+    # The file is opened by the first request that opts into caching, not by /api/stats
+    cache = _answer_cache
+    return cache.stats() if cache is not None else {"enabled": False}
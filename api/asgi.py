@@ -0,0 +1,140 @@
+# ASGI entry point: asyncio-native /api/chat, /api/verify and /api/recommend.
+# Run from api/ with e.g. `hypercorn asgi:app --bind 0.0.0.0:5175`.
+# Every other route (/api/data, ...) is forwarded to the Flask app in index.py.
+# The caches are SQLite files; their reads and writes run in worker threads so
+# a lock held by another worker never stalls the event loop.
+import asyncio
+
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+from asgiref.wsgi import WsgiToAsgi
+
+from index import (
+    app as flask_app,
+    CHAT_MODEL, QA_PROMPT, QA_PROMPT_VERSION,
+    openai_key_from_request, chat_tokens, start_background_tasks,
+)
+from outbound import INTERACTIVE, aoutbound_call
+from openai_pool import get_async_openai_client
+from annotations import AnnotationStreamParser, sse_event
+from answer_cache import get_answer_cache, answer_cache_key, areplay_answer
+from verify_async import verify_abp, AsyncSpeculativeVerifier
+from recommend_async import recommend_abp
+
+quart_app = Quart(__name__)
+quart_app.register_blueprint(verify_abp)
+quart_app.register_blueprint(recommend_abp)
+# Chat streams may legitimately run for minutes
+quart_app.config["RESPONSE_TIMEOUT"] = None
+
+quart_app = cors(
+    quart_app,
+    allow_origin="*",
+    allow_headers=["Content-Type", "x-openai-key", "x-serper-key", "Authorization"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+)
+
+
+@quart_app.before_serving
+async def start_background():
+    # The Flask app starts these on its first request; /api/verify may never send it one
+    await asyncio.to_thread(start_background_tasks)
+
+
+@quart_app.after_request
+async def add_cors_headers(resp):
+    resp.headers['Access-Control-Allow-Origin'] = '*'
+    resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, x-openai-key, x-serper-key, Authorization'
+    resp.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+    return resp
+
+
+@quart_app.route("/api/chat", methods=["POST"])
+async def post_chat():
+    json_data = await request.get_json(force=True) or {}
+    messages = json_data.get('messages', [])
+    stream_mode = json_data.get('stream_mode', 'text')
+    use_cache = bool(json_data.get('cache'))
+    verify_inline = bool(json_data.get('verify'))
+    if verify_inline:
+        stream_mode = 'events'
+
+    api_key = openai_key_from_request(request.headers, json_data)
+    if not api_key:
+        return jsonify({"error": "Missing OpenAI API key"}), 401
+
+    cache = await asyncio.to_thread(get_answer_cache) if use_cache else None
+    cache_key = answer_cache_key(messages, CHAT_MODEL, QA_PROMPT_VERSION) if use_cache else None
+
+    async def generate():
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            if cached is not None:
+                async for part in areplay_answer(cached):
+                    yield part
+                return
+
+        client = get_async_openai_client(api_key)
+        res = await aoutbound_call("openai", api_key, lambda: client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=[
+                {"role": 'assistant', 'content': QA_PROMPT},
+                *messages
+            ],
+            temperature=1,
+            stream=True,
+        ), chat_tokens(messages), INTERACTIVE)
+        parts = []
+        async for chunk in res:
+            content = chunk.choices[0].delta.content
+            if content:
+                parts.append(content)
+                yield content
+
+        if cache is not None:
+            await asyncio.to_thread(cache.put, cache_key, "".join(parts))
+
+    async def generate_events():
+        parser = AnnotationStreamParser()
+        verifier = AsyncSpeculativeVerifier() if verify_inline else None
+
+        def emit(events):
+            out = []
+            for event, data in events:
+                out.append(sse_event(event, data))
+                if verifier is not None and event == "triple":
+                    verifier.submit(data)
+            return out
+
+        async for content in generate():
+            for line in emit(parser.feed(content)):
+                yield line
+            if verifier is not None:
+                for result in verifier.ready():
+                    yield sse_event("verification", result)
+        for line in emit(parser.close()):
+            yield line
+        if verifier is not None:
+            async for result in verifier.adrain():
+                yield sse_event("verification", result)
+
+    return Response(
+        generate_events() if stream_mode == 'events' else generate(),
+        content_type='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+ASYNC_ROUTES = {"/api/chat", "/api/verify", "/api/recommend"}
+_flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def app(scope, receive, send):
+    # Lifespan events go to Quart so its before/after_serving hooks run
+    if scope["type"] == "http" and scope["path"] not in ASYNC_ROUTES:
+        await _flask_asgi(scope, receive, send)
+    else:
+        await quart_app(scope, receive, send)
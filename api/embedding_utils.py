@@ -1,31 +1,62 @@
-import textwrap as tr
+import importlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
 from typing import List, Optional
 
-import matplotlib.pyplot as plt
-import plotly.express as px
-from scipy import spatial
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-from sklearn.metrics import average_precision_score, precision_recall_curve
-from tenacity import retry, stop_after_attempt, wait_random_exponential
-
 import openai
 import numpy as np
-import pandas as pd
+
+from openai_pool import get_async_openai_client
+from outbound import INTERACTIVE, SDK_MAX_RETRIES, aoutbound_call, estimate_tokens, outbound_call
+
+# Serving core: embeddings, their cache and NumPy helpers. The plotting and
+# analysis utilities (matplotlib, plotly, pandas, scipy, scikit-learn) live in
+# embedding_analysis.py and are imported only when one of them is first used,
+# so the request path never pays for them at startup.
+#
+# Embedding requests go through the shared outbound scheduler (outbound.py),
+# which owns rate limiting and retries for every worker.
+
+openai.max_retries = SDK_MAX_RETRIES
+
+_ANALYSIS_NAMES = {
+    "plot_multiclass_precision_recall",
+    "distances_from_embeddings",
+    "indices_of_nearest_neighbors_from_distances",
+    "pca_components_from_embeddings",
+    "tsne_components_from_embeddings",
+    "chart_from_components",
+    "chart_from_components_3D",
+}
+
+
+def __getattr__(name):
+    # embedding_utils.<analysis function> keeps working, loaded on first access
+    if name in _ANALYSIS_NAMES:
+        return getattr(importlib.import_module("embedding_analysis"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _openai_key() -> str:
+    # The module-level client reads OPENAI_API_KEY unless a key was set explicitly
+    return openai.api_key or os.getenv("OPENAI_API_KEY", "")
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 def get_embedding(text: str, model="text-similarity-davinci-001", **kwargs) -> List[float]:
 
     # replace newlines, which can negatively affect performance.
     text = text.replace("\n", " ")
 
-    response = openai.embeddings.create(input=[text], model=model, **kwargs)
+    response = outbound_call("openai", _openai_key(),
+                             lambda: openai.embeddings.create(input=[text], model=model, **kwargs),
+                             estimate_tokens(text), INTERACTIVE)
 
     return response.data[0].embedding
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 async def aget_embedding(
     text: str, model="text-similarity-davinci-001", **kwargs
 ) -> List[float]:
@@ -33,25 +64,162 @@ async def aget_embedding(
     # replace newlines, which can negatively affect performance.
     text = text.replace("\n", " ")
 
-    return (await openai.embeddings.create(input=[text], model=model, **kwargs))["data"][0][
-        "embedding"
-    ]
+    key = _openai_key()
+    client = get_async_openai_client(key)
+    response = await aoutbound_call("openai", key,
+                                    lambda: client.embeddings.create(input=[text], model=model, **kwargs),
+                                    estimate_tokens(text), INTERACTIVE)
+
+    return response.data[0].embedding
+
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE", "1") != "0"
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "embeddings.sqlite3"))
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "20000"))
+
+
+def normalize_embedding_text(text: str) -> str:
+    # replace newlines, which can negatively affect performance.
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store keyed on (model, normalized text).
+
+    An in-memory LRU sits in front of a SQLite table holding raw float32
+    vectors, so repeated entity names are embedded once per deployment.
+    """
+
+    def __init__(self, path=EMBED_CACHE_PATH, memory_items=EMBED_CACHE_MEMORY_ITEMS):
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.api_calls = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text TEXT NOT NULL,
+                vec BLOB NOT NULL,
+                PRIMARY KEY (model, text)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def _remember(self, key, vec):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts):
+        """Return {text: vector} for the texts already cached."""
+        found = {}
+        with self._lock:
+            disk_lookup = []
+            for text in texts:
+                vec = self._memory.get((model, text))
+                if vec is not None:
+                    self._memory.move_to_end((model, text))
+                    found[text] = vec
+                else:
+                    disk_lookup.append(text)
+            self.memory_hits += len(found)
+
+            for start in range(0, len(disk_lookup), 500):
+                batch = disk_lookup[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text, vec FROM embeddings WHERE model = ? AND text IN ({','.join('?' * len(batch))})",
+                    (model, *batch),
+                ).fetchall()
+                for text, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    found[text] = vec
+                    self._remember((model, text), vec)
+                self.disk_hits += len(rows)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model: str, items):
+        """Store freshly embedded (text, vector) pairs from one API call."""
+        with self._lock:
+            self.api_calls += 1
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text, vec) VALUES (?, ?, ?)",
+                [(model, text, np.asarray(vec, dtype=np.float32).tobytes()) for text, vec in items],
+            )
+            self._conn.commit()
+            for text, vec in items:
+                self._remember((model, text), np.asarray(vec, dtype=np.float32))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "api_calls": self.api_calls,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+            }
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _embedding_cache
+    if not EMBED_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
+
+
+def embedding_cache_stats():
+    cache = get_embedding_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+
+def _create_embeddings(list_of_text: List[str], model: str, **kwargs) -> List[List[float]]:
+    data = outbound_call("openai", _openai_key(),
+                         lambda: openai.embeddings.create(input=list_of_text, model=model, **kwargs),
+                         estimate_tokens(*list_of_text), INTERACTIVE).data
+    return [d.embedding for d in data]
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 def get_embeddings(
-    list_of_text: List[str], model="text-similarity-babbage-001", **kwargs
+    list_of_text: List[str], model="text-similarity-babbage-001", use_cache=True, **kwargs
 ) -> List[List[float]]:
     assert len(list_of_text) <= 2048, "The batch size should not be larger than 2048."
 
-    # replace newlines, which can negatively affect performance.
-    list_of_text = [text.replace("\n", " ") for text in list_of_text]
+    # Duplicates within the batch are embedded once; cached texts are not sent at all
+    list_of_text = [normalize_embedding_text(text) for text in list_of_text]
+    unique = list(dict.fromkeys(list_of_text))
 
-    data = openai.embeddings.create(input=list_of_text, model=model, **kwargs).data
-    return [d.embedding for d in data]
+    cache = get_embedding_cache() if use_cache else None
+    found = cache.get_many(model, unique) if cache is not None else {}
+    missing = [text for text in unique if text not in found]
+    if missing:
+        vectors = _create_embeddings(missing, model, **kwargs)
+        if cache is not None:
+            cache.put_many(model, list(zip(missing, vectors)))
+        found.update(zip(missing, vectors))
+
+    return [found[text].tolist() if isinstance(found[text], np.ndarray) else found[text]
+            for text in list_of_text]
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 async def aget_embeddings(
     list_of_text: List[str], model="text-similarity-babbage-001", **kwargs
 ) -> List[List[float]]:
@@ -60,195 +228,13 @@ async def aget_embeddings(
     # replace newlines, which can negatively affect performance.
     list_of_text = [text.replace("\n", " ") for text in list_of_text]
 
-    data = (await openai.embeddings.create(input=list_of_text, model=model, **kwargs)).data
+    key = _openai_key()
+    client = get_async_openai_client(key)
+    data = (await aoutbound_call("openai", key,
+                                 lambda: client.embeddings.create(input=list_of_text, model=model, **kwargs),
+                                 estimate_tokens(*list_of_text), INTERACTIVE)).data
     return [d.embedding for d in data]
 
 
 def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-
-def plot_multiclass_precision_recall(
-    y_score, y_true_untransformed, class_list, classifier_name
-):
-    """
-    Precision-Recall plotting for a multiclass problem. It plots average precision-recall, per class precision recall and reference f1 contours.
-
-    Code slightly modified, but heavily based on https://scikit-learn.org/stable/auto_examples/model_selection/plot_precision_recall.html
-    """
-    n_classes = len(class_list)
-    y_true = pd.concat(
-        [(y_true_untransformed == class_list[i]) for i in range(n_classes)], axis=1
-    ).values
-
-    # For each class
-    precision = dict()
-    recall = dict()
-    average_precision = dict()
-    for i in range(n_classes):
-        precision[i], recall[i], _ = precision_recall_curve(y_true[:, i], y_score[:, i])
-        average_precision[i] = average_precision_score(y_true[:, i], y_score[:, i])
-
-    # A "micro-average": quantifying score on all classes jointly
-    precision_micro, recall_micro, _ = precision_recall_curve(
-        y_true.ravel(), y_score.ravel()
-    )
-    average_precision_micro = average_precision_score(y_true, y_score, average="micro")
-    print(
-        str(classifier_name)
-        + " - Average precision score over all classes: {0:0.2f}".format(
-            average_precision_micro
-        )
-    )
-
-    # setup plot details
-    plt.figure(figsize=(9, 10))
-    f_scores = np.linspace(0.2, 0.8, num=4)
-    lines = []
-    labels = []
-    for f_score in f_scores:
-        x = np.linspace(0.01, 1)
-        y = f_score * x / (2 * x - f_score)
-        (l,) = plt.plot(x[y >= 0], y[y >= 0], color="gray", alpha=0.2)
-        plt.annotate("f1={0:0.1f}".format(f_score), xy=(0.9, y[45] + 0.02))
-
-    lines.append(l)
-    labels.append("iso-f1 curves")
-    (l,) = plt.plot(recall_micro, precision_micro, color="gold", lw=2)
-    lines.append(l)
-    labels.append(
-        "average Precision-recall (auprc = {0:0.2f})" "".format(average_precision_micro)
-    )
-
-    for i in range(n_classes):
-        (l,) = plt.plot(recall[i], precision[i], lw=2)
-        lines.append(l)
-        labels.append(
-            "Precision-recall for class `{0}` (auprc = {1:0.2f})"
-            "".format(class_list[i], average_precision[i])
-        )
-
-    fig = plt.gcf()
-    fig.subplots_adjust(bottom=0.25)
-    plt.xlim([0.0, 1.0])
-    plt.ylim([0.0, 1.05])
-    plt.xlabel("Recall")
-    plt.ylabel("Precision")
-    plt.title(f"{classifier_name}: Precision-Recall curve for each class")
-    plt.legend(lines, labels)
-
-
-def distances_from_embeddings(
-    query_embedding: List[float],
-    embeddings: List[List[float]],
-    distance_metric="cosine",
-) -> List[List]:
-    """Return the distances between a query embedding and a list of embeddings."""
-    distance_metrics = {
-        "cosine": spatial.distance.cosine,
-        "L1": spatial.distance.cityblock,
-        "L2": spatial.distance.euclidean,
-        "Linf": spatial.distance.chebyshev,
-    }
-    distances = [
-        distance_metrics[distance_metric](query_embedding, embedding)
-        for embedding in embeddings
-    ]
-    return distances
-
-
-def indices_of_nearest_neighbors_from_distances(distances) -> np.ndarray:
-    """Return a list of indices of nearest neighbors from a list of distances."""
-    return np.argsort(distances)
-
-
-def pca_components_from_embeddings(
-    embeddings: List[List[float]], n_components=2
-) -> np.ndarray:
-    """Return the PCA components of a list of embeddings."""
-    pca = PCA(n_components=n_components)
-    array_of_embeddings = np.array(embeddings)
-    return pca.fit_transform(array_of_embeddings)
-
-
-def tsne_components_from_embeddings(
-    embeddings: List[List[float]], n_components=2, **kwargs
-) -> np.ndarray:
-    """Returns t-SNE components of a list of embeddings."""
-    # use better defaults if not specified
-    if "init" not in kwargs.keys():
-        kwargs["init"] = "pca"
-    if "learning_rate" not in kwargs.keys():
-        kwargs["learning_rate"] = "auto"
-    tsne = TSNE(n_components=n_components, **kwargs)
-    array_of_embeddings = np.array(embeddings)
-    return tsne.fit_transform(array_of_embeddings)
-
-
-def chart_from_components(
-    components: np.ndarray,
-    labels: Optional[List[str]] = None,
-    strings: Optional[List[str]] = None,
-    x_title="Component 0",
-    y_title="Component 1",
-    mark_size=5,
-    **kwargs,
-):
-    """Return an interactive 2D chart of embedding components."""
-    empty_list = ["" for _ in components]
-    data = pd.DataFrame(
-        {
-            x_title: components[:, 0],
-            y_title: components[:, 1],
-            "label": labels if labels else empty_list,
-            "string": ["<br>".join(tr.wrap(string, width=30)) for string in strings]
-            if strings
-            else empty_list,
-        }
-    )
-    chart = px.scatter(
-        data,
-        x=x_title,
-        y=y_title,
-        color="label" if labels else None,
-        symbol="label" if labels else None,
-        hover_data=["string"] if strings else None,
-        **kwargs,
-    ).update_traces(marker=dict(size=mark_size))
-    return chart
-
-
-def chart_from_components_3D(
-    components: np.ndarray,
-    labels: Optional[List[str]] = None,
-    strings: Optional[List[str]] = None,
-    x_title: str = "Component 0",
-    y_title: str = "Component 1",
-    z_title: str = "Compontent 2",
-    mark_size: int = 5,
-    **kwargs,
-):
-    """Return an interactive 3D chart of embedding components."""
-    empty_list = ["" for _ in components]
-    data = pd.DataFrame(
-        {
-            x_title: components[:, 0],
-            y_title: components[:, 1],
-            z_title: components[:, 2],
-            "label": labels if labels else empty_list,
-            "string": ["<br>".join(tr.wrap(string, width=30)) for string in strings]
-            if strings
-            else empty_list,
-        }
-    )
-    chart = px.scatter_3d(
-        data,
-        x=x_title,
-        y=y_title,
-        z=z_title,
-        color="label" if labels else None,
-        symbol="label" if labels else None,
-        hover_data=["string"] if strings else None,
-        **kwargs,
-    ).update_traces(marker=dict(size=mark_size))
-    return chart
@@ -0,0 +1,281 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from session_store import SESSION_DB_PATH, SESSION_PURGE_INTERVAL, SESSION_TTL
+
+# Versioned per-user conversation graph for /api/data delta mode.
+#
+# Every triple the server has processed is stored with the nodes and edges
+# it contributed; nodes and edges are reference-counted, so dropping a triple
+# removes exactly what no other triple still uses. Each successful update
+# bumps the user's version, and concurrent updates for the same user are
+# serialized by checking the version inside the write transaction. A delta
+# lists whole node and edge objects under added, changed and removed alike.
+#
+# Like the recommendation space, graphs expire: a user's whole graph is
+# dropped once it has not been updated for GRAPH_TTL, and past
+# GRAPH_MAX_TRIPLES the oldest triples are released (and listed as removed)
+# when new ones arrive.
+
+GRAPH_DB_PATH = os.getenv("GRAPH_DB_PATH", SESSION_DB_PATH)
+GRAPH_TTL = float(os.getenv("GRAPH_TTL", str(SESSION_TTL)))
+GRAPH_MAX_TRIPLES = int(os.getenv("GRAPH_MAX_TRIPLES", "1000"))
+
+
+def triple_key(triple) -> str:
+    head, rel, tail = ((x or "").strip().lower() for x in triple)
+    return "\x1f".join((head, rel, tail))
+
+
+def edge_key(edge) -> str:
+    return "\x1f".join((str(edge["source"]), str(edge["target"]), str(edge["category"])))
+
+
+def _empty_delta(version):
+    return {
+        "version": version,
+        "added": {"nodes": [], "edges": []},
+        "changed": {"nodes": [], "edges": []},
+        "removed": {"nodes": [], "edges": []},
+        "node_name_mapping": {},
+    }
+
+
+class ConversationGraphStore:
+    def __init__(self, path=GRAPH_DB_PATH, ttl=GRAPH_TTL, max_triples=GRAPH_MAX_TRIPLES):
+        self.path = path
+        self.ttl = ttl
+        self.max_triples = max_triples
+        self._last_purge = 0.0
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._shared = sqlite3.connect(path, check_same_thread=False, isolation_level=None) if path == ":memory:" else None
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS graph_versions (
+                user_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                last_used REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS graph_triples (
+                user_id TEXT NOT NULL,
+                tkey TEXT NOT NULL,
+                contrib TEXT NOT NULL,
+                seq INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, tkey)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS graph_nodes (
+                user_id TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                refs INTEGER NOT NULL,
+                PRIMARY KEY (user_id, node_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS graph_edges (
+                user_id TEXT NOT NULL,
+                ekey TEXT NOT NULL,
+                data TEXT NOT NULL,
+                refs INTEGER NOT NULL,
+                PRIMARY KEY (user_id, ekey)
+            ) WITHOUT ROWID;
+        """)
+        # Files created before expiry existed lack these columns
+        for table, column, decl in (("graph_versions", "last_used", "REAL NOT NULL DEFAULT 0"),
+                                    ("graph_triples", "seq", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+                if column == "last_used":
+                    # Existing graphs start their TTL now instead of expiring on the first purge
+                    conn.execute("UPDATE graph_versions SET last_used = ?", (time.time(),))
+        conn.execute("CREATE INDEX IF NOT EXISTS graph_versions_last_used ON graph_versions(last_used)")
+
+    def _conn(self):
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; apply() manages its own BEGIN IMMEDIATE transaction
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self, user_id: str) -> int:
+        row = self._conn().execute("SELECT version FROM graph_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def touch(self, user_id: str):
+        """Mark the user's graph as in use without changing it."""
+        self._conn().execute("UPDATE graph_versions SET last_used = ? WHERE user_id = ?", (time.time(), user_id))
+
+    def _maybe_purge(self, conn, now):
+        if now - self._last_purge < SESSION_PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        expired = "SELECT user_id FROM graph_versions WHERE last_used < ?"
+        for table in ("graph_triples", "graph_nodes", "graph_edges"):
+            conn.execute(f"DELETE FROM {table} WHERE user_id IN ({expired})", (now - self.ttl,))
+        conn.execute("DELETE FROM graph_versions WHERE last_used < ?", (now - self.ttl,))
+
+    def known_triples(self, user_id: str, keys):
+        """The subset of `keys` already in the user's graph (one primary-key probe per key)."""
+        keys = list(keys)
+        found = set()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT tkey FROM graph_triples WHERE user_id = ? AND tkey IN ({','.join('?' * len(batch))})",
+                (user_id, *batch),
+            ).fetchall()
+            found.update(r[0] for r in rows)
+        return found
+
+    def reset(self, user_id: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("graph_triples", "graph_nodes", "graph_edges"):
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            # Keep counting up so a stale client version can never match again
+            conn.execute(
+                "INSERT INTO graph_versions (user_id, version, last_used) VALUES (?, 1, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET version = version + 1, last_used = excluded.last_used",
+                (user_id, time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def apply(self, user_id: str, expected_version: int, added, removed_keys):
+        """Apply one turn: `added` is [(tkey, nodes, edges, name_mapping)], `removed_keys` triple keys.
+
+        Returns the delta, or None if another request moved the version first.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._maybe_purge(conn, now)
+            current = conn.execute("SELECT version FROM graph_versions WHERE user_id = ?", (user_id,)).fetchone()
+            current = current[0] if current else 0
+            if current != expected_version:
+                conn.execute("ROLLBACK")
+                return None
+
+            delta = _empty_delta(current + 1)
+            for tkey in removed_keys:
+                self._drop_triple(conn, user_id, tkey, delta)
+
+            for tkey, nodes, edges, mapping in added:
+                if conn.execute("SELECT 1 FROM graph_triples WHERE user_id = ? AND tkey = ?",
+                                (user_id, tkey)).fetchone():
+                    continue
+                node_ids = []
+                for node in nodes:
+                    node_id = str(node["id"])
+                    if node_id in node_ids:
+                        continue
+                    node_ids.append(node_id)
+                    self._retain(conn, "graph_nodes", "node_id", user_id, node_id, node, delta, "nodes")
+                edge_keys = []
+                for edge in edges:
+                    ekey = edge_key(edge)
+                    if ekey in edge_keys:
+                        continue
+                    edge_keys.append(ekey)
+                    self._retain(conn, "graph_edges", "ekey", user_id, ekey, edge, delta, "edges")
+                conn.execute(
+                    "INSERT INTO graph_triples (user_id, tkey, contrib, seq) VALUES (?, ?, ?, ?)",
+                    (user_id, tkey, json.dumps({"nodes": node_ids, "edges": edge_keys, "mapping": mapping}),
+                     delta["version"]),
+                )
+                delta["node_name_mapping"].update(mapping)
+
+            # Keep only the newest max_triples; this turn's own triples are never dropped
+            excess = conn.execute("SELECT COUNT(*) FROM graph_triples WHERE user_id = ?",
+                                  (user_id,)).fetchone()[0] - self.max_triples
+            if excess > 0:
+                oldest = conn.execute(
+                    "SELECT tkey FROM graph_triples WHERE user_id = ? AND seq < ? ORDER BY seq, tkey LIMIT ?",
+                    (user_id, delta["version"], excess),
+                ).fetchall()
+                for (tkey,) in oldest:
+                    self._drop_triple(conn, user_id, tkey, delta)
+
+            conn.execute(
+                "INSERT INTO graph_versions (user_id, version, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET version = excluded.version, last_used = excluded.last_used",
+                (user_id, delta["version"], now),
+            )
+            conn.execute("COMMIT")
+            return delta
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _drop_triple(self, conn, user_id, tkey, delta):
+        row = conn.execute("SELECT contrib FROM graph_triples WHERE user_id = ? AND tkey = ?",
+                           (user_id, tkey)).fetchone()
+        if row is None:
+            return
+        contrib = json.loads(row[0])
+        conn.execute("DELETE FROM graph_triples WHERE user_id = ? AND tkey = ?", (user_id, tkey))
+        for node_id in contrib["nodes"]:
+            data = self._release(conn, "graph_nodes", "node_id", user_id, node_id)
+            if data:
+                delta["removed"]["nodes"].append(json.loads(data))
+        for ekey in contrib["edges"]:
+            data = self._release(conn, "graph_edges", "ekey", user_id, ekey)
+            if data:
+                delta["removed"]["edges"].append(json.loads(data))
+
+    @staticmethod
+    def _retain(conn, table, key_col, user_id, key, item, delta, kind):
+        data = json.dumps(item, sort_keys=True)
+        row = conn.execute(f"SELECT data FROM {table} WHERE user_id = ? AND {key_col} = ?",
+                           (user_id, key)).fetchone()
+        if row is None:
+            conn.execute(f"INSERT INTO {table} (user_id, {key_col}, data, refs) VALUES (?, ?, ?, 1)",
+                         (user_id, key, data))
+            delta["added"][kind].append(item)
+            return
+        if row[0] != data:
+            delta["changed"][kind].append(item)
+        conn.execute(f"UPDATE {table} SET refs = refs + 1, data = ? WHERE user_id = ? AND {key_col} = ?",
+                     (data, user_id, key))
+
+    @staticmethod
+    def _release(conn, table, key_col, user_id, key):
+        """Drop one reference; returns the stored data if the item was deleted."""
+        row = conn.execute(f"SELECT data, refs FROM {table} WHERE user_id = ? AND {key_col} = ?",
+                           (user_id, key)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= 1:
+            conn.execute(f"DELETE FROM {table} WHERE user_id = ? AND {key_col} = ?", (user_id, key))
+            return row[0]
+        conn.execute(f"UPDATE {table} SET refs = refs - 1 WHERE user_id = ? AND {key_col} = ?", (user_id, key))
+        return None
+
+    def snapshot(self, user_id: str):
+        """The whole graph as a delta against an empty client (used to resync)."""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            delta = _empty_delta(self.version(user_id))
+            delta["full"] = True
+            delta["added"]["nodes"] = [json.loads(r[0]) for r in conn.execute(
+                "SELECT data FROM graph_nodes WHERE user_id = ?", (user_id,))]
+            delta["added"]["edges"] = [json.loads(r[0]) for r in conn.execute(
+                "SELECT data FROM graph_edges WHERE user_id = ?", (user_id,))]
+            for (contrib,) in conn.execute("SELECT contrib FROM graph_triples WHERE user_id = ?", (user_id,)):
+                delta["node_name_mapping"].update(json.loads(contrib).get("mapping", {}))
+        finally:
+            conn.execute("COMMIT")
+        return delta
@@ -5,14 +5,24 @@ import os
 from dotenv import load_dotenv
 import re
 import time
+import hashlib
+import threading
 # import { OpenAIStream, StreamingTextResponse } from 'ai'
-from embedding_utils import get_embeddings
-from sklearn.preprocessing import normalize
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity as cosine_similarity_sklearn
-from openai import OpenAI
-from verify import verify_bp
+from embedding_utils import get_embeddings, embedding_cache_stats
+from kg_index import load_kg_index, KG_MATCH_BACKEND
+from openai_pool import get_openai_client, pool_stats
+from verify import verify_bp, SpeculativeVerifier
+from kg_backend import get_kg_backend, neighbour_cache_stats
+from verify_cache import verify_cache_stats
+from serper_cache import serper_cache_stats
+from recommend_index import recommend_index_stats
+from outbound import INTERACTIVE, estimate_tokens, outbound_call, outbound_stats
+from kg_snapshot import start_kg_snapshot, kg_snapshot_stats
 from recommend import recommend_bp
+from annotations import AnnotationStreamParser, sse_event
+from answer_cache import get_answer_cache, answer_cache_key, answer_cache_stats, replay_answer
+from session_store import RecommendationStore
+from graph_state import ConversationGraphStore, triple_key
 
 load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
 
@@ -36,28 +46,65 @@ def add_cors_headers(resp):
     return resp
 app.secret_key = os.urandom(12)
 
-recommendation_space = {}
-recommendation_id_counter = 0  # Keep track of the next ID to assign
+# Nothing below opens a file or a connection at import time: the stores and
+# the KG index are created on first use and the KG snapshot starts with the
+# first request (or the ASGI app's startup), so importing this module, e.g.
+# in scripts/bench_startup.py, measures the real cold start.
+_recommendation_store = None
+_graph_store = None
+_kg_index = None
+_kg_index_loaded = False
+_startup_lock = threading.Lock()
 
 
-@app.route("/api/chat", methods=["POST"])
-def post_chat():
-    json_data = request.get_json(force=True) or {}
-    messages = json_data.get('messages', [])
+def get_recommendation_store() -> RecommendationStore:
+    """Per-user recommendation space, shared by all workers (see session_store.py)."""
+    global _recommendation_store
+    with _startup_lock:
+        if _recommendation_store is None:
+            _recommendation_store = RecommendationStore()
+        return _recommendation_store
 
-    # Accept API key from header or Authorization: Bearer <key>
-    auth_header = request.headers.get("Authorization", "")
-    header_key = request.headers.get("x-openai-key", "") or request.headers.get("X-OpenAI-Key", "")
-    api_key = (
-        header_key.strip()
-        or (auth_header.startswith("Bearer ") and auth_header.replace("Bearer ", "").strip())
-        or json_data.get("apiKey", "").strip()  # optional fallback if you ever want to pass in body
-    )
 
-    if not api_key:
-        return jsonify({"error": "Missing OpenAI API key"}), 401
-    
-    qaPrompt = """
+def get_graph_store() -> ConversationGraphStore:
+    """Versioned per-user graph for /api/data delta mode (see graph_state.py)."""
+    global _graph_store
+    with _startup_lock:
+        if _graph_store is None:
+            _graph_store = ConversationGraphStore()
+        return _graph_store
+
+
+def get_kg_index():
+    """KG entity embeddings for agent(), or None; built offline with `python api/kg_index.py build`."""
+    global _kg_index, _kg_index_loaded
+    with _startup_lock:
+        if not _kg_index_loaded:
+            _kg_index = load_kg_index()
+            _kg_index_loaded = True
+            if _kg_index is None:
+                app.logger.warning("KG index not found; /api/data entity matching is unavailable")
+            elif KG_MATCH_BACKEND == "ivf" and _kg_index.ivf is None:
+                app.logger.warning("KG_MATCH_BACKEND=ivf but no IVF lists were built; using exact matching")
+        return _kg_index
+
+
+KG_MATCH_THRESHOLD = float(os.getenv("KG_MATCH_THRESHOLD", "0.9"))
+
+
+def start_background_tasks():
+    """In-process adjacency for /api/verify when KG_SNAPSHOT=1 (see kg_snapshot.py); runs once per process."""
+    start_kg_snapshot(get_kg_backend())
+
+
+@app.before_request
+def _start_on_first_request():
+    # start_kg_snapshot() returns at once after the first call
+    start_background_tasks()
+
+CHAT_MODEL = 'gpt-4o'
+
+QA_PROMPT = """
 You are an expert in healthcare and dietary supplements and need to help users answer related questions.
 Please return your response in a format where all entities and their relations are clearly defined in the response.
 Specifically, use [] to identify all entities and relations in the response,
@@ -117,25 +164,100 @@ Dietary supplements, including [omega-3 fatty acids]($N3) and [vitamin E]($N4),
 Use the above examples only as a guide for format and structure. Do not reuse their exact wording. Always generate a unique, original response that follows the annotated format.
 """
 
+# Derived from the prompt text, so editing QA_PROMPT invalidates cached answers
+QA_PROMPT_VERSION = hashlib.sha256(QA_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+# Completion allowance when budgeting a chat call's tokens with the outbound scheduler
+CHAT_COMPLETION_TOKENS = int(os.getenv("CHAT_COMPLETION_TOKENS", "1000"))
+
+
+def chat_tokens(messages) -> int:
+    return estimate_tokens(QA_PROMPT, *(str(m.get("content") or "") for m in messages),
+                           completion=CHAT_COMPLETION_TOKENS)
+
+
+def openai_key_from_request(headers, json_data):
+    # Accept API key from header or Authorization: Bearer <key>
+    auth_header = headers.get("Authorization", "")
+    header_key = headers.get("x-openai-key", "") or headers.get("X-OpenAI-Key", "")
+    return (
+        header_key.strip()
+        or (auth_header.startswith("Bearer ") and auth_header.replace("Bearer ", "").strip())
+        or json_data.get("apiKey", "").strip()  # optional fallback if you ever want to pass in body
+    )
+
+
+@app.route("/api/chat", methods=["POST"])
+def post_chat():
+    json_data = request.get_json(force=True) or {}
+    messages = json_data.get('messages', [])
+    # "text" (default): raw model text; "events": typed SSE events parsed server-side
+    stream_mode = json_data.get('stream_mode', 'text')
+    # Opt-in: serve repeated questions from the answer cache
+    use_cache = bool(json_data.get('cache'))
+    # Opt-in: check each triple against the KG while the answer streams (implies "events")
+    verify_inline = bool(json_data.get('verify'))
+    if verify_inline:
+        stream_mode = 'events'
+
+    api_key = openai_key_from_request(request.headers, json_data)
+    if not api_key:
+        return jsonify({"error": "Missing OpenAI API key"}), 401
+
+    cache = get_answer_cache() if use_cache else None
+    cache_key = answer_cache_key(messages, CHAT_MODEL, QA_PROMPT_VERSION) if use_cache else None
+
     def generate():
-        client = OpenAI(api_key=api_key)
-        res = client.chat.completions.create(
-            model='gpt-4o',
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                yield from replay_answer(cached)
+                return
+
+        client = get_openai_client(api_key)
+        res = outbound_call("openai", api_key, lambda: client.chat.completions.create(
+            model=CHAT_MODEL,
             messages=[
-                {"role": 'assistant', 'content': qaPrompt},
+                {"role": 'assistant', 'content': QA_PROMPT},
                 *messages
             ],
             temperature=1,
             stream=True,
-        )
+        ), chat_tokens(messages), INTERACTIVE)
+        parts = []
         for chunk in res:
             content = chunk.choices[0].delta.content
             if content:
+                parts.append(content)
                 # SSE text stream
                 yield content
 
+        # Only complete answers are cached; an aborted stream never gets here
+        if cache is not None:
+            cache.put(cache_key, "".join(parts))
+
+    def generate_events():
+        parser = AnnotationStreamParser()
+        verifier = SpeculativeVerifier() if verify_inline else None
+
+        def emit(events):
+            for event, data in events:
+                yield sse_event(event, data)
+                if verifier is not None and event == "triple":
+                    verifier.submit(data)
+
+        for content in generate():
+            yield from emit(parser.feed(content))
+            if verifier is not None:
+                for result in verifier.ready():
+                    yield sse_event("verification", result)
+        yield from emit(parser.close())
+        if verifier is not None:
+            for result in verifier.drain():
+                yield sse_event("verification", result)
+
     return Response(
-        generate(),
+        generate_events() if stream_mode == 'events' else generate(),
         content_type='text/event-stream',
         headers={
             "Cache-Control": "no-cache",
@@ -144,6 +266,22 @@ Use the above examples only as a guide for format and structure. Do not reuse th
     )
 
 
+@app.route("/api/stats", methods=["GET"])
+def get_stats():
+    # Cache and connection-pool counters for this worker
+    return jsonify({
+        "embedding_cache": embedding_cache_stats(),
+        "answer_cache": answer_cache_stats(),
+        "verify_cache": verify_cache_stats(),
+        "serper_cache": serper_cache_stats(),
+        "recommend_index": recommend_index_stats(),
+        "kg_neighbour_cache": neighbour_cache_stats(),
+        "kg_snapshot": kg_snapshot_stats(),
+        "openai_pool": pool_stats(),
+        "outbound": outbound_stats(),
+    })
+
+
 @app.route("/api/data", methods=["POST"])
 def post_chat_message():
     data = request.json
@@ -158,6 +296,10 @@ def post_chat_message():
     if not user_id:
         return jsonify({"status": "error", "message": "Unauthorized"}), 401
 
+    # Opt-in: keep the graph on the server and answer with a versioned delta
+    if data.get("delta"):
+        return graph_delta_response(data, input_type, user_id, triples or [], recommendId, start_time)
+
     # For a new conversation with no triples, return a message indicating there are no triples to process
     if input_type == "new_conversation" and not triples:
         return jsonify({
@@ -175,16 +317,11 @@ def post_chat_message():
         # Convert recommendId to integer if it's passed as a string
         recommendId = int(recommendId)
         # Process the selected recommendation
-        selected_recommendation = None
-        for key, value in recommendation_space.items():
-            if value['id'] == recommendId:
-                selected_recommendation = key
-                break
+        selected_recommendation = get_recommendation_store().pop(user_id, recommendId)
 
         recommendation = []
         if selected_recommendation:
-            del recommendation_space[selected_recommendation]
-            recommendation = generate_recommendation()
+            recommendation = generate_recommendation(user_id)
 
         return jsonify({
             "status": "success",
@@ -200,8 +337,8 @@ def post_chat_message():
         # Call the agent function from AI_agent.py
         if input_type == "new_conversation":
             # reset the recommendation space
-            recommendation_space.clear()
-            # response_data = agent(triples, 0, "new_conversation")
+            get_recommendation_store().clear(user_id)
+            # response_data = agent(triples, 0, "new_conversation", user_id)
             
             response_data = {"vis_res": 
                                 {
@@ -224,7 +361,7 @@ def post_chat_message():
 
         elif input_type == "continue_conversation":
             # Handle the continue conversation logic
-            # response_data = agent(triples, recommendId, "continue_conversation")
+            # response_data = agent(triples, recommendId, "continue_conversation", user_id)
             response_data = []
         else:
             raise ValueError("Invalid input type")
@@ -246,9 +383,73 @@ def post_chat_message():
 
     return jsonify(response)
 
-def generate_recommendation():
+def graph_delta_response(data, input_type, user_id, triples, recommendId, start_time):
+    removed_triples = data.get("data", {}).get("removed_triples") or []
+    since_version = data.get("since_version")
+    try:
+        if input_type == "new_conversation":
+            get_recommendation_store().clear(user_id)
+            get_graph_store().reset(user_id)
+            since_version = None
+        elif input_type == "continue_conversation":
+            if recommendId is not None:
+                get_recommendation_store().pop(user_id, int(recommendId))
+        else:
+            raise ValueError("Invalid input type")
+
+        delta = update_conversation_graph(user_id, triples, removed_triples, since_version)
+        delta["recommendation"] = generate_recommendation(user_id)
+    except Exception as e:
+        app.logger.error("Error in processing the request: " + str(e))
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    app.logger.info("Time taken for the delta request: " + str(time.time() - start_time))
+    return jsonify({
+        "status": "success",
+        "message": "Graph delta computed",
+        "data": delta,
+    })
+
+def update_conversation_graph(user_id, triples, removed_triples=(), since_version=None, retries=3):
+    """
+    Add the unseen triples (and drop removed_triples) from the user's graph.
+
+    Only triples the server has not processed before are embedded and matched.
+    Returns the delta against since_version; a client whose version does not
+    match the server's gets the full graph instead ("full": true).
+    """
+    valid = [t for t in triples if isinstance(t, (list, tuple)) and len(t) == 3]
+    keyed = {}
+    for triple in valid:
+        keyed.setdefault(triple_key(triple), triple)
+    removed_keys = {triple_key(t) for t in removed_triples if isinstance(t, (list, tuple)) and len(t) == 3}
+
+    graph_store = get_graph_store()
+    for _ in range(retries):
+        version = graph_store.version(user_id)
+        known = graph_store.known_triples(user_id, keyed.keys() | removed_keys)
+        new = [(k, t) for k, t in keyed.items() if k not in known]
+        gone = [k for k in removed_keys if k in known and k not in keyed]
+        in_sync = since_version is None or int(since_version) == version
+        if not new and not gone:
+            graph_store.touch(user_id)
+            return graph_store.snapshot(user_id) if not in_sync else {
+                "version": version,
+                "added": {"nodes": [], "edges": []},
+                "changed": {"nodes": [], "edges": []},
+                "removed": {"nodes": [], "edges": []},
+                "node_name_mapping": {},
+            }
+
+        parts = triple_graph_parts([t for _, t in new])
+        delta = graph_store.apply(user_id, version, [(k, *p) for (k, _), p in zip(new, parts)], gone)
+        if delta is not None:
+            return delta if in_sync else graph_store.snapshot(user_id)
+    raise RuntimeError("Conversation graph is being updated concurrently; retry the request")
+
+def generate_recommendation(user_id):
     recommendations = []
-    for key, value in recommendation_space.items():
+    for value in get_recommendation_store().items(user_id):
         recommendation_text = f"{value['entity']} and {value['neighbor']}"
         recommendations.append({
             "text": recommendation_text,
@@ -256,6 +457,27 @@ def generate_recommendation():
         })
     return recommendations
 
+def match_KG_nodes(kg_index, entities, indices, scores, threshold=KG_MATCH_THRESHOLD):
+    """
+    Split entity names into KG matches and misses.
+
+    Parameters:
+    - kg_index: The loaded KG index (see get_kg_index()).
+    - entities: Entity names from the triples.
+    - indices, scores: Rows of kg_index.search() for those names (best match first).
+    - threshold: Minimum cosine similarity for a match.
+
+    Returns (matched, unmatched): (cui, name, category) tuples and the names without a match.
+    """
+    matched_nodes = []
+    unmatched = []
+    for name, idx_row, score_row in zip(entities, indices, scores):
+        if len(idx_row) and score_row[0] >= threshold:
+            matched_nodes.append(kg_index.entity(int(idx_row[0])))
+        else:
+            unmatched.append(name)
+    return matched_nodes, unmatched
+
 def visualization_partial_match(matched_entity, unmatched_entity, relation, is_head_matched):
     """
     Create visualization components for partial matches.
@@ -307,72 +529,70 @@ def visualization_partial_match(matched_entity, unmatched_entity, relation, is_h
     return nodes_res, edges_res
 
 
-def agent(triples, recommand_id, input_type):
-    node_id_map = {}  # Maps CUI to Node_ID
-    rel_id_map = {}  # Maps (Source_CUI, Target_CUI, Relation_Type) to Relation_ID
+def triple_graph_parts(triples):
+    """
+    Match each triple's entities to the KG and build its visualization pieces.
 
-    # start_time = time.time()
+    Returns one (nodes, edges, node_name_mapping) tuple per triple.
+    """
+    if not triples:
+        return []
+    kg_index = get_kg_index()
+    if kg_index is None:
+        raise RuntimeError("KG index not built; run `python api/kg_index.py build`")
 
-    response_data = {"vis_res": []}
-    vis_res = {"nodes": [], "edges": []}
-    node_name_mapping = {}
     triple_entity_list = []
-    for triple in triples:
-        head, rel, tail = triple
-        app.logger.info(head is None)
-        app.logger.info(tail is None)
+    for head, rel, tail in triples:
         triple_entity_list.append(head)
         triple_entity_list.append(tail)
 
-    triple_embeddings = get_embeddings(triple_entity_list, model="text-embedding-ada-002")  # speed up the process by using batch processing
-    normalized_vectors = normalize(np.asarray(triple_embeddings))
-    similarity_list = cosine_similarity_sklearn(normalized_vectors, normalized_embedding)
-    unmatched_entities = []  # Store unmatched entities
-    triples_index = 0
-    for triple in triples:
-        head, rel, tail = triple
+    triple_embeddings = get_embeddings(triple_entity_list, model=kg_index.model)  # speed up the process by using batch processing
+    # Best KG node per entity; no query x KG similarity matrix is kept around
+    match_idx, match_scores = kg_index.search(triple_embeddings, k=1)
 
-        matched_nodes, unmatched = match_KG_nodes([head, tail], similarity_list[triples_index:triples_index + 2])
-        unmatched_entities.extend(unmatched)  # Add unmatched entities
+    parts = []
+    for triples_index in range(0, len(triple_entity_list), 2):
+        head, rel, tail = triples[triples_index // 2]
+        matched_nodes, unmatched = match_KG_nodes(
+            kg_index, [head, tail], match_idx[triples_index:triples_index + 2], match_scores[triples_index:triples_index + 2])
+        nodes, edges, node_name_mapping = [], [], {}
         # Logic to handle different match scenarios
         if len(matched_nodes) == 1 and len(unmatched) == 1:
             # Identify if the head or tail is the matched entity
-            is_head_matched = head in [node[2] for node in matched_nodes]  # Check if head is in matched_nodes by names
-            matched_entity = matched_nodes[0]  # We have only one matched entity
-            unmatched_entity = unmatched[0]  # Only one unmatched entity
-            # Call visualization_partial_match with the correct parameters
-            temp_nodes, temp_edges = visualization_partial_match(matched_entity, unmatched_entity, rel, is_head_matched)
-            vis_res["nodes"].extend(temp_nodes)
-            vis_res["edges"].extend(temp_edges)
+            is_head_matched = head not in unmatched
+            nodes, edges = visualization_partial_match(matched_nodes[0], unmatched[0], rel, is_head_matched)
         elif len(matched_nodes) == 2:
-            triples_index += 2
-            # temp_nodes, temp_edges = visualization(matched_nodes, node_id_map, rel_id_map)
-            # vis_res["nodes"].extend(temp_nodes)
-            # vis_res["edges"].extend(temp_edges)
-            for i in range(len(matched_nodes)):
-                node_name_mapping[matched_nodes[i][1]] = matched_nodes[i][2]
+            # nodes, edges = visualization(matched_nodes, node_id_map, rel_id_map)
+            for matched in matched_nodes:
+                node_name_mapping[matched[1]] = matched[2]
         else:
-        # Handle cases where neither entity is matched, if needed
-            for unmatched_entity in unmatched_entities:
-                special_node = {
+            # Neither entity is matched: special nodes plus a special edge between them
+            for unmatched_entity in unmatched:
+                nodes.append({
                     "category": "NotFind",
                     "id": unmatched_entity,
                     "name": unmatched_entity
-                }
-                vis_res["nodes"].extend(special_node)
-            # Handle unmatched edges
-            for triple in triples:
-                head, rel, tail = triple
-                # if both head and tail are unmatched, a special edge is created
-                if head in unmatched_entities and tail in unmatched_entities:
-                    special_edge = {
-                        "PubMed_ID": "None",
-                        "category": "NotFind",
-                        "source": head,
-                        "target": tail
-                    }
-                    # Create a visualization entry with no nodes but the special edge
-                    vis_res["edges"].extend(special_edge)
+                })
+            edges.append({
+                "PubMed_ID": "None",
+                "category": "NotFind",
+                "source": head,
+                "target": tail
+            })
+        parts.append((nodes, edges, node_name_mapping))
+    return parts
+
+
+def agent(triples, recommand_id, input_type, user_id):
+    # start_time = time.time()
+
+    response_data = {"vis_res": []}
+    vis_res = {"nodes": [], "edges": []}
+    node_name_mapping = {}
+    for nodes, edges, mapping in triple_graph_parts(triples):
+        vis_res["nodes"].extend(nodes)
+        vis_res["edges"].extend(edges)
+        node_name_mapping.update(mapping)
     response_data["vis_res"] = vis_res
     response_data['node_name_mapping'] = node_name_mapping
 
@@ -380,25 +600,20 @@ def agent(triples, recommand_id, input_type):
 
         # triple_nodes_list, unmatched = match_KG_nodes(triple_entity_list, similarity_list)
         # add_recommendation_space(triple_nodes_list)  # Updates the recommendation space
-        recommendation = generate_recommendation()
+        recommendation = generate_recommendation(user_id)
         response_data["recommendation"] = recommendation
 
     elif input_type == "continue_conversation" and recommand_id is not None:
         # Convert recommendId to integer if it's passed as a string
         recommendId = int(recommand_id)
         # Process the selected recommendation
-        selected_recommendation = None
-        for key, value in recommendation_space.items():
-            if value['id'] == recommendId:
-                selected_recommendation = key
-                break
+        selected_recommendation = get_recommendation_store().pop(user_id, recommendId)
         if selected_recommendation:
-            # entity, neighbor = selected_recommendation
+            # entity, neighbor = selected_recommendation["entity"], selected_recommendation["neighbor"]
             # # generate nodes and edges from chatgpt entity and neighbor
             # node_id, rel_id = subgraph_type(entity, neighbor, node_id, rel_id, node_id_map, rel_id_map)
-            # # Optionally, remove the selected recommendation
-            del recommendation_space[selected_recommendation]
-            recommendation = generate_recommendation()
+            # (pop() already removed the selected recommendation)
+            recommendation = generate_recommendation(user_id)
             response_data["recommendation"] = recommendation
     # app.logger.info("Time taken for the agent function: "+ str(time.time() - start_time))
     return response_data
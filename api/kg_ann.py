@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+
+from kg_index import KG_INDEX_DIR, normalize_rows, topk_inner_product
+
+# Inverted-file (IVF) approximate search over the KG embedding matrix.
+#
+# Rows are assigned to the nearest of `nlist` k-means centroids (spherical
+# k-means, since all rows are unit length). A query scores the centroids,
+# visits the `nprobe` best lists and re-ranks that shortlist exactly against
+# the full-precision rows. Stored next to the exact index as ivf.npz.
+
+IVF_FILE = "ivf.npz"
+KG_IVF_NPROBE = int(os.getenv("KG_IVF_NPROBE", "16"))
+
+
+def train_centroids(matrix, nlist, iters=20, sample=200_000, seed=0, chunk=65536):
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    sample_idx = np.sort(rng.choice(n, size=min(n, sample), replace=False))
+    x = np.asarray(matrix[sample_idx], dtype=np.float32)
+    nlist = min(nlist, len(x))
+    centroids = x[rng.choice(len(x), size=nlist, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = _assign(x, centroids, chunk)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists from random sample rows
+            sums[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def _assign(x, centroids, chunk=65536):
+    out = np.empty(x.shape[0], dtype=np.int64)
+    for start in range(0, x.shape[0], chunk):
+        block = np.asarray(x[start:start + chunk], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex:
+    def __init__(self, centroids, list_offsets, list_rows):
+        self.centroids = centroids        # (nlist, dim) float32, unit rows
+        self.list_offsets = list_offsets  # (nlist + 1,) start of each list in list_rows
+        self.list_rows = list_rows        # row ids of the exact matrix, grouped by list
+
+    @classmethod
+    def build(cls, matrix, nlist=None, iters=20, seed=0):
+        n = matrix.shape[0]
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        centroids = train_centroids(matrix, nlist, iters=iters, seed=seed)
+        assign = _assign(matrix, centroids)
+        list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+        counts = np.bincount(assign, minlength=len(centroids))
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(centroids, list_offsets, list_rows)
+
+    def save(self, index_dir=KG_INDEX_DIR):
+        path = os.path.join(index_dir, IVF_FILE)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, index_dir=KG_INDEX_DIR):
+        path = os.path.join(index_dir, IVF_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as z:
+            return cls(z["centroids"], z["list_offsets"], z["list_rows"])
+
+    def search(self, queries, matrix, k=1, nprobe=KG_IVF_NPROBE):
+        """Approximate top-k with the same (indices, scores) layout as topk_inner_product."""
+        nprobe = min(nprobe, len(self.centroids))
+        probe, _ = topk_inner_product(queries, self.centroids, nprobe)
+
+        out_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q, lists in enumerate(probe):
+            shortlist = np.concatenate(
+                [self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists])
+            if len(shortlist) == 0:
+                continue
+            shortlist.sort()  # sequential reads from a memory-mapped matrix
+            local_idx, local_scores = topk_inner_product(queries[q:q + 1], matrix[shortlist], k)
+            kk = local_idx.shape[1]
+            out_idx[q, :kk] = shortlist[local_idx[0]]
+            out_scores[q, :kk] = local_scores[0]
+        return out_idx, out_scores
@@ -0,0 +1,670 @@
+import argparse
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from verify_cache import Q_KG_VERSION
+
+# Knowledge-graph access for /api/verify and /api/recommend.
+#
+# Callers open a session on the configured backend and use five lookups:
+# exact_edge, alternate_relation, two_hop, neighbours and edge_counts (plus
+# export_edges, export_edge_keys and version_stamp for snapshots and caches). Names are matched after
+# normalize_name(), relations by their canonical upper-case type.
+#
+#   KG_BACKEND=neo4j   Bolt server (default); the driver is created on first use
+#   KG_BACKEND=sqlite  embedded copy at KG_SQLITE_PATH, built from a Neo4j
+#                      export with `python api/kg_backend.py load-sqlite`;
+#                      KG_SQLITE_PATH=:memory: loads KG_SQLITE_SOURCE (a JSONL
+#                      export) into memory at startup
+
+KG_BACKEND = os.getenv("KG_BACKEND", "neo4j")
+KG_SQLITE_PATH = os.getenv("KG_SQLITE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "kg.sqlite3"))
+KG_SQLITE_SOURCE = os.getenv("KG_SQLITE_SOURCE", "")
+
+# Entity lookups anchor on the precomputed e.name_norm property and its index
+# (created by `python api/kg_migrate.py migrate`). With KG_NAME_NORM=auto the
+# first lookup checks once that the entity_name_norm index is online and
+# otherwise keeps the old toLower(e.name) comparisons, with a warning, so an
+# unmigrated graph still matches. KG_NAME_NORM=1 / 0 skip the check.
+# A name that matches no e.name_norm is then looked up once more as a synonym:
+# the entity_names full-text index finds candidates among e.aliases and the
+# match must equal one of their normalized e.aliases_norm exactly.
+KG_NAME_NORM = os.getenv("KG_NAME_NORM", "auto")
+
+logger = logging.getLogger(__name__)
+
+# Neighbour lists of hub entities (at least KG_HUB_MIN_NEIGHBOURS edges) are
+# kept in a small in-process LRU for KG_HUB_CACHE_TTL seconds; /api/recommend
+# asks for the same popular heads over and over.
+KG_HUB_MIN_NEIGHBOURS = int(os.getenv("KG_HUB_MIN_NEIGHBOURS", "50"))
+KG_HUB_CACHE_ITEMS = int(os.getenv("KG_HUB_CACHE_ITEMS", "1000"))
+KG_HUB_CACHE_TTL = float(os.getenv("KG_HUB_CACHE_TTL", "3600"))
+
+
+def normalize_name(name: str) -> str:
+    # Must match the migration's toLower(trim(e.name))
+    return (name or "").strip().lower()
+
+
+def _names_predicate(head: str, tail: str, norm: bool) -> str:
+    if norm:
+        return f"h.name_norm = {head}Norm\n  AND t.name_norm = {tail}Norm"
+    return f"toLower(h.name) = toLower({head})\n  AND toLower(t.name) = toLower({tail})"
+
+
+def _anchor_names(query: str, norm: bool) -> str:
+    head_only = "h.name_norm = $headNorm" if norm else "toLower(h.name) = toLower($head)"
+    return (query.replace("__NAMES__", _names_predicate("$head", "$tail", norm))
+                 .replace("__BATCH_NAMES__", _names_predicate("q.head", "q.tail", norm))
+                 .replace("__HEAD__", head_only)
+                 .replace("__TAILS__", "t.name_norm IN $tails" if norm else "toLower(t.name) IN $tails"))
+
+
+Q_NAME_NORM_INDEX = """
+SHOW INDEXES YIELD name, state
+WHERE name = 'entity_name_norm' AND state = 'ONLINE'
+RETURN count(*) AS n
+"""
+
+_name_norm = None
+_name_norm_lock = threading.Lock()
+
+
+def name_norm_enabled() -> bool:
+    """Whether Neo4j lookups can anchor on e.name_norm (see KG_NAME_NORM)."""
+    global _name_norm
+    if KG_NAME_NORM != "auto":
+        return KG_NAME_NORM == "1"
+    with _name_norm_lock:
+        if _name_norm is None:
+            try:
+                with neo4j_driver().session() as session:
+                    _name_norm = session.run(Q_NAME_NORM_INDEX).single()["n"] > 0
+                if not _name_norm:
+                    logger.warning("entity_name_norm index is not online; matching entities by toLower(name). "
+                                   "Run `python api/kg_migrate.py migrate` and restart to use the index.")
+            except Exception as e:
+                # Unknown schema: the unindexed predicate is slower but matches on any graph
+                _name_norm = False
+                logger.warning("could not check for the entity_name_norm index (%s); matching entities by "
+                               "toLower(name)", e)
+        return _name_norm
+
+
+@functools.lru_cache(maxsize=None)
+def _anchored(query: str, norm: bool) -> str:
+    return _anchor_names(query, norm)
+
+
+def kg_query(query: str) -> str:
+    """One of the Q_* templates below with its entity-name predicates filled in."""
+    return _anchored(query, name_norm_enabled())
+
+
+def name_params(head: str, tail: str):
+    return {"head": head, "tail": tail, "headNorm": normalize_name(head), "tailNorm": normalize_name(tail)}
+
+
+# Entity-lookup templates; run them through kg_query(), which fills in __NAMES__ / __HEAD__.
+# 1) Exact relation match (align with recommend.py: label :Entity, property .name)
+Q_EXACT = """
+MATCH (h:Entity)-[r]->(t:Entity)
+WHERE __NAMES__
+  AND toUpper(type(r)) = toUpper($relCanon)
+RETURN coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END) AS count,
+       coalesce(r.papers, []) AS papers
+LIMIT 1
+"""
+
+# 2) Same entities but different relation → relevant
+Q_ALT_REL = """
+MATCH (h:Entity)-[r]->(t:Entity)
+WHERE __NAMES__
+  AND toUpper(type(r)) <> toUpper($relCanon)
+RETURN type(r) AS alt_rel,
+       coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END) AS count
+ORDER BY count DESC
+LIMIT 1
+"""
+
+# 3) Two-hop head → X → tail → relevant
+Q_TWO_HOP = """
+MATCH (h:Entity)-[r1]->(m)-[r2]->(t:Entity)
+WHERE __NAMES__
+RETURN m.name AS bridge,
+       type(r1) AS r1_type, type(r2) AS r2_type,
+       coalesce(r1.count, CASE WHEN r1.papers IS NULL THEN 0 ELSE size(r1.papers) END) +
+       coalesce(r2.count, CASE WHEN r2.papers IS NULL THEN 0 ELSE size(r2.papers) END) AS total_weight
+ORDER BY total_weight DESC
+LIMIT 1
+"""
+
+# Batched variants: all triples travel as one $triples list of
+# {idx, head, tail, relCanon}. The first query resolves supported/relevant from
+# the direct h→t edges; the second checks two-hop paths only for what is left.
+Q_BATCH_DIRECT = """
+UNWIND $triples AS q
+OPTIONAL MATCH (h:Entity)-[r]->(t:Entity)
+WHERE __BATCH_NAMES__
+WITH q, collect(CASE WHEN r IS NULL THEN NULL ELSE {
+         type: toUpper(type(r)),
+         count: coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END),
+         papers: coalesce(r.papers, [])
+       } END) AS rels
+RETURN q.idx AS idx,
+       [x IN rels WHERE x.type = toUpper(q.relCanon)][0] AS exact,
+       size(rels) > 0 AS linked
+"""
+
+Q_BATCH_TWO_HOP = """
+UNWIND $triples AS q
+RETURN q.idx AS idx, EXISTS {
+  MATCH (h:Entity)-[r1]->(m)-[r2]->(t:Entity)
+  WHERE __BATCH_NAMES__
+} AS two_hop
+"""
+
+
+# Synonyms: {norm, query} rows for names with no e.name_norm match -> the
+# canonical name_norm of an entity listing them among its aliases
+Q_ALIASES = """
+UNWIND $names AS n
+WITH n WHERE NOT EXISTS { MATCH (:Entity {name_norm: n.norm}) }
+CALL db.index.fulltext.queryNodes('entity_names', n.query) YIELD node, score
+WITH n, node, score
+WHERE n.norm IN node.aliases_norm AND node.name_norm IS NOT NULL
+WITH n, node ORDER BY score DESC
+RETURN n.norm AS alias, collect(node.name_norm)[0] AS canonical
+"""
+
+
+def alias_search(name: str) -> str:
+    """Lucene phrase query for name in the aliases field of the entity_names index."""
+    phrase = normalize_name(name).replace("\\", "\\\\").replace('"', '\\"')
+    return f'aliases:"{phrase}"'
+
+
+def alias_lookup_params(names):
+    """Q_ALIASES parameters for the distinct non-empty normalized names."""
+    norms = {normalize_name(n) for n in names} - {""}
+    return [{"norm": n, "query": alias_search(n)} for n in sorted(norms)]
+
+
+# 4) Outgoing edges of one entity, strongest first
+Q_NEIGHBOURS = """
+MATCH (h:Entity)-[r]->(t:Entity)
+WHERE __HEAD__
+RETURN t.name AS name, type(r) AS relation,
+       coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END) AS count,
+       coalesce(r.papers, []) AS papers
+ORDER BY count DESC
+LIMIT $limit
+"""
+
+# 5) Strongest edge count from one entity to each of a few named tails (no papers)
+Q_EDGE_COUNTS = """
+MATCH (h:Entity)-[r]->(t:Entity)
+WHERE __HEAD__
+  AND __TAILS__
+RETURN t.name AS name,
+       max(coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END)) AS count
+"""
+
+Q_TOP_HEADS = """
+MATCH (h:Entity)-[r]->(:Entity)
+WHERE h.name IS NOT NULL
+RETURN h.name AS name, count(r) AS degree
+ORDER BY degree DESC
+LIMIT $limit
+"""
+
+Q_EXPORT_EDGES = """
+MATCH (h:Entity)-[r]->(t:Entity)
+WHERE h.name IS NOT NULL AND t.name IS NOT NULL
+RETURN coalesce(h.name_norm, toLower(trim(h.name))) AS head, h.name AS head_name,
+       toUpper(type(r)) AS rel,
+       coalesce(t.name_norm, toLower(trim(t.name))) AS tail, t.name AS tail_name,
+       coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END) AS count,
+       coalesce(r.papers, []) AS papers
+"""
+
+# Same edges as Q_EXPORT_EDGES without display names or paper lists (for kg_snapshot)
+Q_EXPORT_EDGE_KEYS = """
+MATCH (h:Entity)-[r]->(t:Entity)
+WHERE h.name IS NOT NULL AND t.name IS NOT NULL
+RETURN coalesce(h.name_norm, toLower(trim(h.name))) AS head,
+       toUpper(type(r)) AS rel,
+       coalesce(t.name_norm, toLower(trim(t.name))) AS tail,
+       coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END) AS count
+"""
+
+def neo4j_settings():
+    """(uri, auth) read when the first driver is made, i.e. after the app has loaded .env."""
+    return (os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            (os.getenv("NEO4J_USER", "neo4j"), os.getenv("NEO4J_PASSWORD", "passwordknow")))
+
+
+_driver = None
+_driver_lock = threading.Lock()
+
+
+def neo4j_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            from neo4j import GraphDatabase
+            uri, auth = neo4j_settings()
+            _driver = GraphDatabase.driver(uri, auth=auth)
+        return _driver
+
+
+class Neo4jSession:
+    def __init__(self, session):
+        self.session = session
+
+    def run(self, query, **params):
+        # Raw Cypher, for Neo4j-only paths such as the batched verify queries
+        return self.session.run(query, **params)
+
+    def exact_edge(self, head, tail, rel_norm):
+        rec = self.session.run(kg_query(Q_EXACT), **name_params(head, tail), relCanon=rel_norm).single()
+        return {"count": int(rec["count"] or 0), "papers": rec["papers"] or []} if rec else None
+
+    def alternate_relation(self, head, tail, rel_norm):
+        rec = self.session.run(kg_query(Q_ALT_REL), **name_params(head, tail), relCanon=rel_norm).single()
+        return {"relation": rec["alt_rel"], "count": int(rec["count"] or 0)} if rec else None
+
+    def two_hop(self, head, tail):
+        rec = self.session.run(kg_query(Q_TWO_HOP), **name_params(head, tail)).single()
+        return {"bridge": rec["bridge"], "weight": int(rec["total_weight"] or 0)} if rec else None
+
+    def resolve_aliases(self, names):
+        """{normalized name: canonical name_norm} for the names known only as another entity's alias."""
+        if not name_norm_enabled():
+            return {}
+        params = alias_lookup_params(names)
+        if not params:
+            return {}
+        try:
+            return {r["alias"]: r["canonical"] for r in self.session.run(Q_ALIASES, names=params)}
+        except Exception as e:
+            # No full-text index yet (unmigrated graph): synonyms simply do not match
+            logger.warning("alias lookup failed: %s", e)
+            return {}
+
+    def neighbours(self, head, limit=50):
+        rows = [{"name": r["name"], "relation": r["relation"], "count": int(r["count"] or 0),
+                 "papers": r["papers"] or []}
+                for r in self.session.run(kg_query(Q_NEIGHBOURS), **name_params(head, ""), limit=limit)]
+        if not rows:
+            canonical = self.resolve_aliases([head]).get(normalize_name(head))
+            if canonical:
+                return self.neighbours(canonical, limit)
+        return rows
+
+    def edge_counts(self, head, tails):
+        tails = sorted({normalize_name(t) for t in tails} - {""})
+        if not tails:
+            return []
+        return [{"name": r["name"], "count": int(r["count"] or 0)}
+                for r in self.session.run(kg_query(Q_EDGE_COUNTS), **name_params(head, ""), tails=tails)]
+
+    def top_heads(self, limit=300):
+        return [{"name": r["name"], "degree": int(r["degree"])} for r in self.session.run(Q_TOP_HEADS, limit=limit)]
+
+    def export_edges(self):
+        for r in self.session.run(Q_EXPORT_EDGES):
+            yield dict(r)
+
+    def export_edge_keys(self):
+        for r in self.session.run(Q_EXPORT_EDGE_KEYS):
+            yield r["head"], r["rel"], r["tail"], r["count"]
+
+    def version_stamp(self):
+        return str(self.session.run(Q_KG_VERSION).single()["stamp"])
+
+
+class Neo4jKG:
+    name = "neo4j"
+    supports_batch = True
+
+    def __init__(self, driver=None):
+        self._driver = driver
+
+    @property
+    def driver(self):
+        return self._driver or neo4j_driver()
+
+    @contextmanager
+    def session(self):
+        with self.driver.session() as session:
+            yield Neo4jSession(session)
+
+
+class SQLiteSession:
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self._lock = lock
+
+    def _all(self, sql, params):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def resolve_aliases(self, names):
+        # The embedded copy only holds names; synonyms need the Neo4j full-text index
+        return {}
+
+    def _node(self, name):
+        rows = self._all("SELECT id FROM kg_nodes WHERE name_norm = ?", (normalize_name(name),))
+        return rows[0][0] if rows else None
+
+    def exact_edge(self, head, tail, rel_norm):
+        h, t = self._node(head), self._node(tail)
+        if h is None or t is None:
+            return None
+        rows = self._all("SELECT count, papers FROM kg_edges WHERE src = ? AND dst = ? AND rel = ? LIMIT 1",
+                         (h, t, rel_norm.upper()))
+        return {"count": rows[0][0], "papers": json.loads(rows[0][1])} if rows else None
+
+    def alternate_relation(self, head, tail, rel_norm):
+        h, t = self._node(head), self._node(tail)
+        if h is None or t is None:
+            return None
+        rows = self._all("SELECT rel, count FROM kg_edges WHERE src = ? AND dst = ? AND rel <> ? "
+                         "ORDER BY count DESC LIMIT 1", (h, t, rel_norm.upper()))
+        return {"relation": rows[0][0], "count": rows[0][1]} if rows else None
+
+    def two_hop(self, head, tail):
+        h, t = self._node(head), self._node(tail)
+        if h is None or t is None:
+            return None
+        rows = self._all("""
+            SELECT m.name, a.count + b.count AS weight
+            FROM kg_edges a
+            JOIN kg_edges b ON b.src = a.dst AND b.dst = ?
+            JOIN kg_nodes m ON m.id = a.dst
+            WHERE a.src = ?
+            ORDER BY weight DESC LIMIT 1
+        """, (t, h))
+        return {"bridge": rows[0][0], "weight": rows[0][1]} if rows else None
+
+    def neighbours(self, head, limit=50):
+        h = self._node(head)
+        if h is None:
+            return []
+        rows = self._all("""
+            SELECT n.name, e.rel, e.count, e.papers
+            FROM kg_edges e JOIN kg_nodes n ON n.id = e.dst
+            WHERE e.src = ?
+            ORDER BY e.count DESC LIMIT ?
+        """, (h, limit))
+        return [{"name": r[0], "relation": r[1], "count": r[2], "papers": json.loads(r[3])} for r in rows]
+
+    def edge_counts(self, head, tails):
+        h = self._node(head)
+        tails = sorted({normalize_name(t) for t in tails} - {""})
+        if h is None or not tails:
+            return []
+        rows = self._all(f"""
+            SELECT n.name, MAX(e.count)
+            FROM kg_edges e JOIN kg_nodes n ON n.id = e.dst
+            WHERE e.src = ? AND n.name_norm IN ({','.join('?' * len(tails))})
+            GROUP BY e.dst
+        """, (h, *tails))
+        return [{"name": r[0], "count": r[1]} for r in rows]
+
+    def top_heads(self, limit=300):
+        rows = self._all("""
+            SELECT n.name, COUNT(*) AS degree
+            FROM kg_edges e JOIN kg_nodes n ON n.id = e.src
+            GROUP BY e.src ORDER BY degree DESC LIMIT ?
+        """, (limit,))
+        return [{"name": r[0], "degree": r[1]} for r in rows]
+
+    def export_edges(self):
+        rows = self._all("""
+            SELECT h.name_norm, h.name, e.rel, t.name_norm, t.name, e.count, e.papers
+            FROM kg_edges e JOIN kg_nodes h ON h.id = e.src JOIN kg_nodes t ON t.id = e.dst
+        """, ())
+        for r in rows:
+            yield {"head": r[0], "head_name": r[1], "rel": r[2], "tail": r[3], "tail_name": r[4],
+                   "count": r[5], "papers": json.loads(r[6])}
+
+    def export_edge_keys(self):
+        return iter(self._all("""
+            SELECT h.name_norm, e.rel, t.name_norm, e.count
+            FROM kg_edges e JOIN kg_nodes h ON h.id = e.src JOIN kg_nodes t ON t.id = e.dst
+        """, ()))
+
+    def version_stamp(self):
+        rows = self._all("SELECT value FROM kg_meta WHERE key = 'version'", ())
+        return rows[0][0] if rows else "0"
+
+
+class SQLiteKG:
+    """Embedded read-mostly copy of the :Entity graph.
+
+    Nodes are interned by normalized name. kg_edges_out (src, dst, rel, count)
+    and its mirror kg_edges_in answer exact, alternate-relation and two-hop
+    lookups from the indexes alone; kg_edges_nbrs (src, count) serves
+    neighbour lists in order. Paper lists are only read for the rows returned.
+    """
+
+    name = "sqlite"
+    supports_batch = False
+
+    def __init__(self, path=KG_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.RLock() if path == ":memory:" else None
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._shared = sqlite3.connect(path, check_same_thread=False) if path == ":memory:" else None
+        # Serving connections are read-only; the schema is created on a separate one
+        conn = self._shared or sqlite3.connect(path, timeout=10)
+        with conn:
+            if path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS kg_nodes (
+                    id INTEGER PRIMARY KEY,
+                    name_norm TEXT NOT NULL UNIQUE,
+                    name TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS kg_edges (
+                    src INTEGER NOT NULL,
+                    rel TEXT NOT NULL,
+                    dst INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    papers TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS kg_edges_out ON kg_edges(src, dst, rel, count);
+                CREATE INDEX IF NOT EXISTS kg_edges_in ON kg_edges(dst, src, rel, count);
+                CREATE INDEX IF NOT EXISTS kg_edges_nbrs ON kg_edges(src, count DESC);
+                CREATE TABLE IF NOT EXISTS kg_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                ) WITHOUT ROWID;
+            """)
+        if conn is not self._shared:
+            conn.close()
+
+    def _conn(self):
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def session(self):
+        # A file-backed store needs no lock: each thread has its own connection
+        yield SQLiteSession(self._conn(), self._lock or _NO_LOCK)
+
+    def load(self, edges, log=print, batch=50_000):
+        """Replace the stored graph with `edges` (dicts shaped like export_edges rows)."""
+        conn = sqlite3.connect(self.path) if self._shared is None else self._shared
+        node_ids = {}
+        rows = []
+        n = 0
+        with conn:
+            conn.execute("DELETE FROM kg_edges")
+            conn.execute("DELETE FROM kg_nodes")
+            for e in edges:
+                ids = []
+                for key, name in ((e["head"], e["head_name"]), (e["tail"], e["tail_name"])):
+                    if key not in node_ids:
+                        node_ids[key] = len(node_ids) + 1
+                        conn.execute("INSERT INTO kg_nodes (id, name_norm, name) VALUES (?, ?, ?)",
+                                     (node_ids[key], key, name))
+                    ids.append(node_ids[key])
+                rows.append((ids[0], e["rel"].upper(), ids[1], int(e["count"] or 0), json.dumps(e["papers"] or [])))
+                if len(rows) >= batch:
+                    conn.executemany("INSERT INTO kg_edges (src, rel, dst, count, papers) VALUES (?, ?, ?, ?, ?)", rows)
+                    n += len(rows)
+                    rows = []
+                    log(f"loaded {n} edges")
+            conn.executemany("INSERT INTO kg_edges (src, rel, dst, count, papers) VALUES (?, ?, ?, ?, ?)", rows)
+            n += len(rows)
+            conn.execute("INSERT OR REPLACE INTO kg_meta (key, value) VALUES ('version', ?)", (f"sqlite:{time.time():.0f}",))
+        conn.execute("ANALYZE")
+        if conn is not self._shared:
+            conn.close()
+        log(f"done: {len(node_ids)} nodes, {n} edges in {self.path}")
+        return n
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_LOCK = _NoLock()
+
+
+def read_export(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+_kg = None
+_kg_lock = threading.Lock()
+
+
+def get_kg_backend():
+    global _kg
+    with _kg_lock:
+        if _kg is None:
+            if KG_BACKEND == "sqlite":
+                _kg = SQLiteKG(KG_SQLITE_PATH)
+                if KG_SQLITE_PATH == ":memory:" and KG_SQLITE_SOURCE:
+                    _kg.load(read_export(KG_SQLITE_SOURCE), log=lambda msg: None)
+            elif KG_BACKEND == "neo4j":
+                _kg = Neo4jKG()
+            else:
+                raise ValueError(f"unknown KG_BACKEND {KG_BACKEND!r} (expected 'neo4j' or 'sqlite')")
+        return _kg
+
+
+class NeighbourCache:
+    def __init__(self, min_neighbours=KG_HUB_MIN_NEIGHBOURS, items=KG_HUB_CACHE_ITEMS, ttl=KG_HUB_CACHE_TTL):
+        self.min_neighbours = min_neighbours
+        self.items = items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (head_norm, limit) -> (neighbours, expires_at)
+        self._lock = threading.Lock()
+
+    def neighbours(self, kg, head: str, limit: int = 50):
+        """kg's neighbour list for head, from memory when head is a cached hub."""
+        key = (normalize_name(head), limit)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(key, None)
+            self.misses += 1
+        with kg.session() as session:
+            rows = session.neighbours(head, limit)
+        if len(rows) >= self.min_neighbours:
+            with self._lock:
+                self._entries[key] = (rows, now + self.ttl)
+                while len(self._entries) > self.items:
+                    self._entries.popitem(last=False)
+        return rows
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hubs": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_neighbour_cache = NeighbourCache()
+
+
+def cached_neighbours(head: str, limit: int = 50):
+    """Neighbours of head on the configured backend, caching hub entities."""
+    return _neighbour_cache.neighbours(get_kg_backend(), head, limit)
+
+
+def edge_counts(head: str, tails):
+    """[{name, count}] of head's strongest edge to each of tails that it links to; a cheap ranking prior."""
+    with get_kg_backend().session() as session:
+        return session.edge_counts(head, tails)
+
+
+def neighbour_cache_stats():
+    return _neighbour_cache.stats()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Export the KG from Neo4j and build the embedded SQLite copy")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="write every :Entity edge from Neo4j as JSON lines")
+    ex.add_argument("--out", required=True)
+    ld = sub.add_parser("load-sqlite", help="build the SQLite store from an export file or straight from Neo4j")
+    ld.add_argument("--source", default="neo4j", help="JSONL export path, or 'neo4j'")
+    ld.add_argument("--out", default=KG_SQLITE_PATH)
+    args = ap.parse_args()
+
+    from dotenv import load_dotenv
+    from pathlib import Path
+    load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+
+    if args.cmd == "export":
+        n = 0
+        with Neo4jKG().session() as session, open(args.out + ".tmp", "w", encoding="utf-8") as f:
+            for edge in session.export_edges():
+                f.write(json.dumps(edge) + "\n")
+                n += 1
+        os.replace(args.out + ".tmp", args.out)
+        print(f"wrote {n} edges to {args.out}")
+    elif args.source == "neo4j":
+        with Neo4jKG().session() as session:
+            SQLiteKG(args.out).load(session.export_edges())
+    else:
+        SQLiteKG(args.out).load(read_export(args.source))
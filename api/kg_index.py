@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+# Embedding index over the KG's :Entity nodes, used by agent() in index.py
+# to map answer entities onto KG nodes.
+#
+# On disk (KG_INDEX_DIR):
+#   embeddings.npy  contiguous float32 matrix, one L2-normalized row per entity
+#   entities.json   sidecar with model, dim and parallel cui/name/category lists
+#
+# Build it with `python api/kg_index.py build` (needs Neo4j and OPENAI_API_KEY),
+# then optionally `python api/kg_index.py build-ivf` for KG_MATCH_BACKEND=ivf, or
+# `python api/kg_index.py quantize --dtype int8` for KG_INDEX_DTYPE=int8.
+
+KG_INDEX_DIR = os.getenv("KG_INDEX_DIR", os.path.join(os.path.dirname(__file__), "kg_index"))
+KG_EMBED_MODEL = os.getenv("KG_EMBED_MODEL", "text-embedding-ada-002")
+KG_MATCH_CHUNK = int(os.getenv("KG_MATCH_CHUNK", "65536"))  # KG rows scored per block
+# "exact" brute force, or "ivf" approximate search (kg_ann.py) once an IVF file is built
+KG_MATCH_BACKEND = os.getenv("KG_MATCH_BACKEND", "exact")
+# Exact backend only: score a float16 / per-row int8 copy held in memory, then
+# re-score the best KG_RESCORE_CANDIDATES rows from the memory-mapped float32 file
+KG_INDEX_DTYPE = os.getenv("KG_INDEX_DTYPE", "float32")
+KG_RESCORE_CANDIDATES = int(os.getenv("KG_RESCORE_CANDIDATES", "32"))
+
+EMBEDDINGS_FILE = "embeddings.npy"
+SIDECAR_FILE = "entities.json"
+QUANTIZED_FILES = {"float16": "embeddings.float16.npy", "int8": "embeddings.int8.npy"}
+INT8_SCALES_FILE = "scales.int8.npy"
+
+Q_EXPORT_ENTITIES = """
+MATCH (e:Entity)
+WHERE e.name IS NOT NULL
+RETURN coalesce(toString(e.CUI), elementId(e)) AS cui,
+       e.name AS name,
+       coalesce(e.category, e.Label, head([l IN labels(e) WHERE l <> 'Entity']), '') AS category
+"""
+
+
+def normalize_rows(x):
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[None, :]
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def topk_inner_product(queries, matrix, k=1, chunk=KG_MATCH_CHUNK, scales=None):
+    """Exact top-k rows of matrix by inner product for each query row.
+
+    The KG is scored in blocks of `chunk` rows, so at most queries x chunk
+    scores exist at any time. `scales` holds per-row factors for an int8
+    matrix. Returns (indices, scores), both (n_queries, k), best match first.
+    """
+    n_queries = queries.shape[0]
+    n_rows = matrix.shape[0]
+    k = min(k, n_rows)
+    best_idx = np.zeros((n_queries, 0), dtype=np.int64)
+    best_scores = np.zeros((n_queries, 0), dtype=np.float32)
+    if n_queries == 0 or k == 0:
+        return best_idx, best_scores
+
+    rows = np.arange(n_queries)[:, None]
+    for start in range(0, n_rows, chunk):
+        block = np.asarray(matrix[start:start + chunk], dtype=np.float32)
+        scores = queries @ block.T
+        if scales is not None:
+            scores *= scales[start:start + chunk]
+        kk = min(k, scores.shape[1])
+        part = np.argpartition(scores, -kk, axis=1)[:, -kk:]
+        cand_idx = np.concatenate([best_idx, part + start], axis=1)
+        cand_scores = np.concatenate([best_scores, scores[rows, part]], axis=1)
+        if cand_idx.shape[1] > k:
+            keep = np.argpartition(cand_scores, -k, axis=1)[:, -k:]
+            cand_idx, cand_scores = cand_idx[rows, keep], cand_scores[rows, keep]
+        best_idx, best_scores = cand_idx, cand_scores
+
+    order = np.argsort(-best_scores, axis=1)
+    return best_idx[rows, order], best_scores[rows, order]
+
+
+def quantize_matrix(matrix, dtype, chunk=KG_MATCH_CHUNK):
+    """Compact copy of a float32 matrix: float16, or int8 codes plus per-row scales."""
+    if dtype == "float16":
+        return np.asarray(matrix, dtype=np.float16), None
+    if dtype != "int8":
+        raise ValueError(f"unsupported KG index dtype {dtype!r}")
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    scales = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], chunk):
+        block = np.asarray(matrix[start:start + chunk], dtype=np.float32)
+        s = np.abs(block).max(axis=1) / 127.0
+        s[s == 0] = 1.0
+        codes[start:start + len(block)] = np.rint(block / s[:, None]).astype(np.int8)
+        scales[start:start + len(block)] = s
+    return codes, scales
+
+
+def rescored_topk(queries, compact, scales, matrix, k=1, candidates=KG_RESCORE_CANDIDATES):
+    """Top-k from the compact matrix, re-scored at full precision from `matrix`."""
+    shortlist, _ = topk_inner_product(queries, compact, max(k, candidates), scales=scales)
+    if shortlist.shape[1] == 0:
+        return shortlist, np.zeros(shortlist.shape, dtype=np.float32)
+    # Read each candidate row once, in file order
+    uniq, pos = np.unique(shortlist, return_inverse=True)
+    pos = pos.reshape(shortlist.shape)
+    exact = queries @ np.asarray(matrix[uniq], dtype=np.float32).T
+    rows = np.arange(len(queries))[:, None]
+    cand_scores = exact[rows, pos]
+    k = min(k, shortlist.shape[1])
+    order = np.argsort(-cand_scores, axis=1)[:, :k]
+    return shortlist[rows, order], cand_scores[rows, order]
+
+
+class KGIndex:
+    def __init__(self, matrix, cuis, names, categories, model=KG_EMBED_MODEL, ivf=None, backend=KG_MATCH_BACKEND,
+                 compact=None, scales=None):
+        self.matrix = matrix
+        self.compact = compact  # float16 / int8 copy used for scoring, or None
+        self.scales = scales
+        self.cuis = cuis
+        self.names = names
+        self.categories = categories
+        self.model = model
+        self.ivf = ivf
+        self.backend = backend if ivf is not None else "exact"
+
+    def __len__(self):
+        return len(self.cuis)
+
+    def entity(self, i):
+        """(cui, name, category) for row i — the tuple agent() passes around."""
+        return self.cuis[i], self.names[i], self.categories[i]
+
+    def search(self, query_vectors, k=1, nprobe=None):
+        queries = normalize_rows(query_vectors)
+        if self.backend == "ivf":
+            if nprobe is None:
+                return self.ivf.search(queries, self.matrix, k)
+            return self.ivf.search(queries, self.matrix, k, nprobe)
+        if self.compact is not None:
+            return rescored_topk(queries, self.compact, self.scales, self.matrix, k)
+        return topk_inner_product(queries, self.matrix, k)
+
+
+def load_kg_index(index_dir=KG_INDEX_DIR, mmap=True, backend=KG_MATCH_BACKEND, dtype=KG_INDEX_DTYPE):
+    """Load the index written by build_kg_index, or None if it has not been built."""
+    sidecar_path = os.path.join(index_dir, SIDECAR_FILE)
+    matrix_path = os.path.join(index_dir, EMBEDDINGS_FILE)
+    if not (os.path.exists(sidecar_path) and os.path.exists(matrix_path)):
+        return None
+    with open(sidecar_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+    if matrix.dtype != np.float32 or matrix.shape != (len(meta["cuis"]), meta["dim"]):
+        raise ValueError(f"KG index in {index_dir} is inconsistent with its sidecar")
+    ivf = None
+    if backend == "ivf":
+        from kg_ann import IVFIndex
+        ivf = IVFIndex.load(index_dir)
+    compact = scales = None
+    if dtype != "float32" and backend != "ivf":
+        compact_path = os.path.join(index_dir, QUANTIZED_FILES[dtype])
+        if not os.path.exists(compact_path):
+            raise FileNotFoundError(f"{compact_path} missing; run `python api/kg_index.py quantize --dtype {dtype}`")
+        compact = np.load(compact_path)
+        if dtype == "int8":
+            scales = np.load(os.path.join(index_dir, INT8_SCALES_FILE))
+        if compact.shape != matrix.shape:
+            raise ValueError(f"{compact_path} does not match {matrix_path}")
+    return KGIndex(matrix, meta["cuis"], meta["names"], meta["categories"],
+                   meta.get("model", KG_EMBED_MODEL), ivf=ivf, backend=backend,
+                   compact=compact, scales=scales)
+
+
+def save_quantized(index_dir, dtype):
+    matrix = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    compact, scales = quantize_matrix(matrix, dtype)
+    path = os.path.join(index_dir, QUANTIZED_FILES[dtype])
+    np.save(path + ".tmp.npy", compact)
+    if scales is not None:
+        np.save(os.path.join(index_dir, INT8_SCALES_FILE), scales)
+    os.replace(path + ".tmp.npy", path)
+    return compact.nbytes + (scales.nbytes if scales is not None else 0), matrix.nbytes
+
+
+def export_entities(driver):
+    with driver.session() as session:
+        rows = [(r["cui"], r["name"], r["category"] or "") for r in session.run(Q_EXPORT_ENTITIES)]
+    return rows
+
+
+def build_kg_index(driver, index_dir=KG_INDEX_DIR, model=KG_EMBED_MODEL, batch_size=1000, log=print):
+    from embedding_utils import get_embeddings
+
+    rows = export_entities(driver)
+    if not rows:
+        raise RuntimeError("No :Entity nodes with a name were found")
+    cuis, names, categories = (list(col) for col in zip(*rows))
+    log(f"exported {len(rows)} entities")
+
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_matrix = os.path.join(index_dir, EMBEDDINGS_FILE + ".tmp")
+    matrix = None
+    for start in range(0, len(names), batch_size):
+        vectors = normalize_rows(get_embeddings(names[start:start + batch_size], model=model))
+        if matrix is None:
+            # Written straight into the .npy file so the build never holds the whole matrix
+            matrix = np.lib.format.open_memmap(tmp_matrix, mode="w+", dtype=np.float32,
+                                               shape=(len(names), vectors.shape[1]))
+        matrix[start:start + len(vectors)] = vectors
+        log(f"embedded {min(start + batch_size, len(names))}/{len(names)}")
+    matrix.flush()
+    dim = matrix.shape[1]
+    del matrix
+
+    tmp_sidecar = os.path.join(index_dir, SIDECAR_FILE + ".tmp")
+    with open(tmp_sidecar, "w", encoding="utf-8") as f:
+        json.dump({"model": model, "dim": dim, "cuis": cuis, "names": names, "categories": categories}, f)
+    os.replace(tmp_matrix, os.path.join(index_dir, EMBEDDINGS_FILE))
+    os.replace(tmp_sidecar, os.path.join(index_dir, SIDECAR_FILE))
+    log(f"wrote {len(names)} x {dim} index to {index_dir}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build the KG entity embedding index")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="export :Entity names from Neo4j and embed them")
+    b.add_argument("--out", default=KG_INDEX_DIR)
+    b.add_argument("--model", default=KG_EMBED_MODEL)
+    b.add_argument("--batch-size", type=int, default=1000)
+    ivf = sub.add_parser("build-ivf", help="train the approximate (IVF) index over an existing build")
+    ivf.add_argument("--dir", default=KG_INDEX_DIR)
+    ivf.add_argument("--nlist", type=int, default=None, help="number of lists (default 4*sqrt(n))")
+    ivf.add_argument("--iters", type=int, default=20)
+    qz = sub.add_parser("quantize", help="write a float16 or int8 copy for KG_INDEX_DTYPE")
+    qz.add_argument("--dir", default=KG_INDEX_DIR)
+    qz.add_argument("--dtype", choices=sorted(QUANTIZED_FILES), required=True)
+    args = ap.parse_args()
+
+    if args.cmd == "quantize":
+        compact_bytes, full_bytes = save_quantized(args.dir, args.dtype)
+        print(f"wrote {args.dtype} copy: {compact_bytes / 2**20:.1f} MiB (float32: {full_bytes / 2**20:.1f} MiB)")
+        raise SystemExit(0)
+
+    if args.cmd == "build-ivf":
+        from kg_ann import IVFIndex
+        index = load_kg_index(args.dir, backend="exact")
+        if index is None:
+            raise SystemExit(f"no KG index in {args.dir}; run `build` first")
+        IVFIndex.build(index.matrix, args.nlist, args.iters).save(args.dir)
+        print(f"wrote IVF lists for {len(index)} entities to {args.dir}")
+        raise SystemExit(0)
+
+    from dotenv import load_dotenv
+    from pathlib import Path
+    load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+    from kg_backend import neo4j_driver
+    from outbound import background_calls
+
+    # Embedding batches yield the shared OpenAI budget to serving traffic
+    with background_calls():
+        build_kg_index(neo4j_driver(), args.out, args.model, args.batch_size)
@@ -0,0 +1,123 @@
+import argparse
+import os
+
+# Schema migration for entity lookups.
+#
+# verify.py used to match entities with toLower(h.name) = toLower($head),
+# which no index can serve: every lookup scanned all :Entity nodes. `migrate`
+# stores the normalized name once as e.name_norm (and e.aliases_norm when the
+# node has aliases), indexes it, and adds a full-text index over name and
+# aliases. Lookups that miss on name_norm search that index for a synonym
+# and keep the hit only if it equals one of the entity's aliases_norm
+# (kg_backend.Q_ALIASES). `profile` reports PROFILE db hits for the old
+# and the new exact-match query on sample pairs.
+#
+#     python api/kg_migrate.py migrate
+#     python api/kg_migrate.py profile --samples 20
+#
+# Re-run `migrate` after loading new entities; it only touches nodes whose
+# name_norm or aliases_norm is missing or stale.
+
+KG_MIGRATE_BATCH = int(os.getenv("KG_MIGRATE_BATCH", "10000"))
+
+Q_SET_NAME_NORM = """
+MATCH (e:Entity)
+WHERE e.name IS NOT NULL
+  AND (e.name_norm IS NULL OR e.name_norm <> toLower(trim(e.name))
+       OR coalesce(e.aliases_norm, []) <> coalesce([a IN e.aliases | toLower(trim(a))], []))
+WITH e LIMIT $batch
+SET e.name_norm = toLower(trim(e.name)),
+    e.aliases_norm = CASE WHEN e.aliases IS NULL THEN NULL
+                          ELSE [a IN e.aliases | toLower(trim(a))] END
+RETURN count(e) AS updated
+"""
+
+SCHEMA_STATEMENTS = [
+    "CREATE INDEX entity_name_norm IF NOT EXISTS FOR (e:Entity) ON (e.name_norm)",
+    "CREATE FULLTEXT INDEX entity_names IF NOT EXISTS FOR (e:Entity) ON EACH [e.name, e.aliases]",
+]
+
+Q_SAMPLE_PAIRS = """
+MATCH (h:Entity)-[r]->(t:Entity)
+WHERE h.name IS NOT NULL AND t.name IS NOT NULL
+RETURN h.name AS head, type(r) AS rel, t.name AS tail
+LIMIT $n
+"""
+
+# Same shape as kg_backend.Q_EXACT; names are filled in by kg_backend._anchor_names
+Q_PROFILE_EXACT = """
+PROFILE
+MATCH (h:Entity)-[r]->(t:Entity)
+WHERE __NAMES__
+  AND toUpper(type(r)) = toUpper($relCanon)
+RETURN count(r) AS n
+"""
+
+
+def migrate(driver, batch=KG_MIGRATE_BATCH, log=print):
+    with driver.session() as session:
+        for stmt in SCHEMA_STATEMENTS:
+            session.run(stmt).consume()
+        total = 0
+        while True:
+            updated = session.run(Q_SET_NAME_NORM, batch=batch).single()["updated"]
+            total += updated
+            if updated:
+                log(f"normalized {total} entity names")
+            if updated < batch:
+                break
+        session.run("CALL db.awaitIndexes()").consume()
+    log(f"done: {total} entities updated, indexes online")
+    return total
+
+
+def _db_hits(plan) -> int:
+    if plan is None:
+        return 0
+    own = plan.get("dbHits", 0) if isinstance(plan, dict) else getattr(plan, "db_hits", 0)
+    children = plan.get("children", []) if isinstance(plan, dict) else getattr(plan, "children", [])
+    return own + sum(_db_hits(c) for c in children)
+
+
+def profile(driver, samples=20, log=print):
+    from kg_backend import _anchor_names, name_params
+
+    queries = {"toLower(name)": _anchor_names(Q_PROFILE_EXACT, norm=False),
+               "name_norm": _anchor_names(Q_PROFILE_EXACT, norm=True)}
+    with driver.session() as session:
+        pairs = [(r["head"], r["rel"], r["tail"]) for r in session.run(Q_SAMPLE_PAIRS, n=samples)]
+        if not pairs:
+            raise SystemExit("no :Entity edges to sample")
+        totals = {}
+        for label, query in queries.items():
+            hits = []
+            for head, rel, tail in pairs:
+                summary = session.run(query, **name_params(head, tail), relCanon=rel).consume()
+                hits.append(_db_hits(summary.profile))
+            totals[label] = hits
+
+    log(f"{len(pairs)} sampled (head, rel, tail) pairs\n")
+    log(f"{'predicate':>14} {'db hits/query':>14} {'max':>10}")
+    for label, hits in totals.items():
+        log(f"{label:>14} {sum(hits) / len(hits):>14.0f} {max(hits):>10}")
+    return totals
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Normalized-name properties and indexes for :Entity")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="write e.name_norm / e.aliases_norm and create the indexes")
+    m.add_argument("--batch", type=int, default=KG_MIGRATE_BATCH)
+    p = sub.add_parser("profile", help="compare PROFILE db hits of the old and new exact-match query")
+    p.add_argument("--samples", type=int, default=20)
+    args = ap.parse_args()
+
+    from dotenv import load_dotenv
+    from pathlib import Path
+    load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+    from kg_backend import neo4j_driver
+
+    if args.cmd == "migrate":
+        migrate(neo4j_driver(), args.batch)
+    else:
+        profile(neo4j_driver(), args.samples)
@@ -0,0 +1,221 @@
+import os
+import sys
+import threading
+import time
+import traceback
+from array import array
+
+import numpy as np
+
+# Read-only in-process copy of the KG's :Entity edges for /api/verify.
+#
+# Node names (normalized like kg_backend.normalize_name) are interned to int ids
+# and the edges are stored as compressed sparse rows twice: by head for the
+# exact / alternate-relation checks, and by tail so a two-hop check is the
+# intersection of two sorted neighbour lists instead of a variable-length
+# path match around hub entities. Each edge carries a relation-type code and
+# its count; paper lists stay in Neo4j and are only fetched for supported
+# triples. The load streams only (head, relation, tail, count) per edge
+# (kg_backend.Q_EXPORT_EDGE_KEYS), with no names or papers.
+#
+# Only :Entity→:Entity edges are held, so a two-hop check can only bridge
+# through an :Entity. kg_backend.Q_TWO_HOP accepts a middle node with any
+# label, so a triple that Neo4j rates "relevant" through such a node is
+# "unsure" here.
+#
+# Enabled with KG_SNAPSHOT=1. Every worker loads its own copy in a background
+# thread and reloads it every KG_SNAPSHOT_REFRESH seconds; until the first
+# load finishes (or if the graph exceeds KG_SNAPSHOT_MAX_MB) verification
+# queries the KG backend as before. The budget is checked while the edges
+# stream in, from a per-edge and per-node estimate, so an oversized graph is
+# abandoned early instead of being built and then discarded.
+
+KG_SNAPSHOT_ENABLED = os.getenv("KG_SNAPSHOT", "0") == "1"
+KG_SNAPSHOT_REFRESH = float(os.getenv("KG_SNAPSHOT_REFRESH", "3600"))
+KG_SNAPSHOT_MAX_MB = float(os.getenv("KG_SNAPSHOT_MAX_MB", "2048"))
+
+# Estimated bytes held per edge (both CSR copies: 2 neighbour ids, a relation
+# code and 2 counts) and per node besides its name string (2 row pointers, the
+# names list slot and the node_ids dict entry)
+_EDGE_BYTES = 18
+_NODE_BYTES = 16 + 8 + 72
+
+
+class KGSnapshotTooLarge(Exception):
+    def __init__(self, size_mb, budget_mb):
+        super().__init__(f"KG snapshot estimate {size_mb:.1f} MiB passed the {budget_mb:.0f} MiB budget")
+        self.size_mb = size_mb
+        self.budget_mb = budget_mb
+
+
+def _csr(keys, values, n):
+    """Row pointers and the order that groups `keys` into rows with sorted `values`."""
+    order = np.lexsort((values, keys))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=indptr[1:])
+    return indptr, order
+
+
+class KGSnapshot:
+    def __init__(self, names, rel_types, heads, rels, tails, counts):
+        self.names = names
+        self.node_ids = {name: i for i, name in enumerate(names)}
+        self.rel_types = rel_types
+        self.rel_codes = {rel: i for i, rel in enumerate(rel_types)}
+        self.loaded_at = time.time()
+        n = len(names)
+
+        self.out_ptr, order = _csr(heads, tails, n)
+        self.out_nbrs = tails[order]
+        self.out_rels = rels[order]
+        self.out_counts = counts[order]
+
+        self.in_ptr, order = _csr(tails, heads, n)
+        self.in_nbrs = heads[order]
+        self.in_counts = counts[order]
+
+    @classmethod
+    def from_edges(cls, rows, max_mb=None):
+        """Build from (head, rel, tail, count) tuples with already-normalized names.
+
+        Raises KGSnapshotTooLarge as soon as the estimated size passes max_mb.
+        """
+        node_ids, rel_codes = {}, {}
+        heads, rels, tails, counts = array("i"), array("H"), array("i"), array("i")
+        budget = max_mb * 2**20 if max_mb is not None else None
+        size = 0
+        for head, rel, tail, count in rows:
+            for name in (head, tail):
+                if name not in node_ids:
+                    node_ids[name] = len(node_ids)
+                    size += sys.getsizeof(name) + _NODE_BYTES
+            heads.append(node_ids[head])
+            rels.append(rel_codes.setdefault(rel, len(rel_codes)))
+            tails.append(node_ids[tail])
+            counts.append(int(count or 0))
+            size += _EDGE_BYTES
+            if budget is not None and size > budget:
+                raise KGSnapshotTooLarge(size / 2**20, max_mb)
+        return cls(list(node_ids), list(rel_codes),
+                   np.frombuffer(heads, dtype=np.int32), np.frombuffer(rels, dtype=np.uint16),
+                   np.frombuffer(tails, dtype=np.int32), np.frombuffer(counts, dtype=np.int32))
+
+    @classmethod
+    def load(cls, kg, max_mb=None):
+        """Build from every edge of a kg_backend backend."""
+        with kg.session() as session:
+            return cls.from_edges(session.export_edge_keys(), max_mb)
+
+    def __len__(self):
+        return len(self.out_nbrs)
+
+    def _out_edges(self, h, t):
+        """Slice of h's out-row whose target is t."""
+        row = self.out_nbrs[self.out_ptr[h]:self.out_ptr[h + 1]]
+        lo = np.searchsorted(row, t, "left")
+        hi = np.searchsorted(row, t, "right")
+        return slice(self.out_ptr[h] + lo, self.out_ptr[h] + hi)
+
+    def two_hop_bridge(self, h, t):
+        """(bridge name, weight) for the best-weighted h→m→t path, or None.
+
+        Unlike kg_backend.Q_TWO_HOP, m is always an :Entity (the only nodes loaded).
+        """
+        out_row = slice(self.out_ptr[h], self.out_ptr[h + 1])
+        in_row = slice(self.in_ptr[t], self.in_ptr[t + 1])
+        common, out_pos, in_pos = np.intersect1d(self.out_nbrs[out_row], self.in_nbrs[in_row],
+                                                 assume_unique=False, return_indices=True)
+        if len(common) == 0:
+            return None
+        weights = self.out_counts[out_row][out_pos].astype(np.int64) + self.in_counts[in_row][in_pos]
+        best = int(np.argmax(weights))
+        return self.names[common[best]], int(weights[best])
+
+    def check(self, head: str, rel_norm: str, tail: str):
+        """(status, count) for normalized names, matching verify_triple's supported → relevant → unsure."""
+        h, t = self.node_ids.get(head), self.node_ids.get(tail)
+        if h is None or t is None:
+            return "unsure", 0
+        edges = self._out_edges(h, t)
+        code = self.rel_codes.get(rel_norm.upper())
+        if edges.stop > edges.start:
+            rels = self.out_rels[edges]
+            if code is not None and (rels == code).any():
+                return "supported", int(self.out_counts[edges][rels == code][0])
+            return "relevant", 0
+        if self.two_hop_bridge(h, t) is not None:
+            return "relevant", 0
+        return "unsure", 0
+
+    def memory_report(self):
+        arrays = {name: getattr(self, name) for name in (
+            "out_ptr", "out_nbrs", "out_rels", "out_counts", "in_ptr", "in_nbrs", "in_counts")}
+        array_bytes = sum(a.nbytes for a in arrays.values())
+        # Interned names: the strings plus the dict and list holding them
+        name_bytes = sum(sys.getsizeof(s) for s in self.names) + sys.getsizeof(self.node_ids) + \
+            sys.getsizeof(self.names)
+        total = array_bytes + name_bytes
+        return {
+            "nodes": len(self.names),
+            "edges": len(self),
+            "relation_types": len(self.rel_types),
+            "array_mb": array_bytes / 2**20,
+            "names_mb": name_bytes / 2**20,
+            "total_mb": total / 2**20,
+            "bytes_per_edge": total / len(self) if len(self) else 0.0,
+            "budget_mb": KG_SNAPSHOT_MAX_MB,
+            "age_s": time.time() - self.loaded_at,
+        }
+
+
+_snapshot = None
+_snapshot_status = {"enabled": KG_SNAPSHOT_ENABLED, "state": "off"}
+_snapshot_thread = None
+
+
+def get_kg_snapshot():
+    return _snapshot
+
+
+def kg_snapshot_stats():
+    stats = dict(_snapshot_status)
+    if _snapshot is not None:
+        stats.update(_snapshot.memory_report())
+    return stats
+
+
+def _refresh_loop(kg, interval):
+    global _snapshot
+    while True:
+        _snapshot_status["state"] = "loading" if _snapshot is None else "refreshing"
+        try:
+            t0 = time.perf_counter()
+            snapshot = KGSnapshot.load(kg, KG_SNAPSHOT_MAX_MB)
+            report = snapshot.memory_report()
+            _snapshot_status["load_s"] = time.perf_counter() - t0
+            if report["total_mb"] > KG_SNAPSHOT_MAX_MB:
+                _snapshot_status["state"] = "over_budget"
+                _snapshot_status["last_size_mb"] = report["total_mb"]
+                _snapshot = None
+            else:
+                _snapshot = snapshot  # swapped whole; readers never see a partial build
+                _snapshot_status["state"] = "ready"
+        except KGSnapshotTooLarge as e:
+            _snapshot_status["state"] = "over_budget"
+            _snapshot_status["last_size_mb"] = e.size_mb
+            _snapshot = None
+        except Exception as e:
+            traceback.print_exc()
+            _snapshot_status["state"] = "error"
+            _snapshot_status["error"] = str(e)
+        time.sleep(interval)
+
+
+def start_kg_snapshot(kg, interval=KG_SNAPSHOT_REFRESH):
+    """Load the snapshot in the background and keep refreshing it (once per process)."""
+    global _snapshot_thread
+    if not KG_SNAPSHOT_ENABLED or _snapshot_thread is not None:
+        return
+    _snapshot_thread = threading.Thread(target=_refresh_loop, args=(kg, interval),
+                                        name="kg-snapshot", daemon=True)
+    _snapshot_thread.start()
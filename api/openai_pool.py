@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from outbound import SDK_MAX_RETRIES
+
+# Reuse one OpenAI client (and its keep-alive connection pool) per API key
+# instead of paying a fresh TLS handshake on every request. Keys are only
+# held inside the client objects; the registry is keyed by their hash.
+# Clients do not retry on their own: outbound.py schedules and retries calls.
+
+POOL_MAX_CLIENTS = int(os.getenv("OPENAI_POOL_MAX_CLIENTS", "64"))
+POOL_IDLE_SECONDS = float(os.getenv("OPENAI_POOL_IDLE_SECONDS", "600"))
+POOL_MAX_CONNECTIONS = int(os.getenv("OPENAI_POOL_MAX_CONNECTIONS", "20"))
+POOL_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_POOL_KEEPALIVE_SECONDS", "90"))
+
+_clients = OrderedDict()        # key hash -> [client, last_used]
+_async_clients = OrderedDict()  # same, for the ASGI serving path
+# Clients dropped for capacity: [client, dropped_at], closed once idle for POOL_IDLE_SECONDS
+_retired = []
+_async_retired = []
+_closing = set()  # pending AsyncOpenAI.close() tasks
+_lock = threading.Lock()
+
+
+def _key_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_CONNECTIONS,
+        keepalive_expiry=POOL_KEEPALIVE_SECONDS,
+    )
+
+
+def _new_client(api_key: str) -> OpenAI:
+    http_client = httpx.Client(limits=_limits(), timeout=httpx.Timeout(60.0, connect=10.0))
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=SDK_MAX_RETRIES)
+
+
+def _new_async_client(api_key: str) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(limits=_limits(), timeout=httpx.Timeout(60.0, connect=10.0))
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=SDK_MAX_RETRIES)
+
+
+async def _aclose(client: AsyncOpenAI):
+    try:
+        await client.close()
+    except Exception:
+        pass
+
+
+def _close(client):
+    if isinstance(client, AsyncOpenAI):
+        # Async clients are only checked out on the serving loop, so one is running here
+        task = asyncio.get_running_loop().create_task(_aclose(client))
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+        return
+    try:
+        client.close()
+    except Exception:
+        pass
+
+
+def _evict_idle(registry, retired, now: float):
+    # Oldest entries sit at the front; stop at the first one still in use
+    while registry:
+        h, (client, last_used) = next(iter(registry.items()))
+        if now - last_used < POOL_IDLE_SECONDS:
+            break
+        del registry[h]
+        _close(client)
+    while retired and now - retired[0][1] >= POOL_IDLE_SECONDS:
+        _close(retired.pop(0)[0])
+
+
+def _checkout(registry, retired, api_key: str, factory):
+    h = _key_hash(api_key)
+    now = time.monotonic()
+    with _lock:
+        _evict_idle(registry, retired, now)
+        entry = registry.get(h)
+        if entry is not None:
+            entry[1] = now
+            registry.move_to_end(h)
+            return entry[0]
+
+        client = factory(api_key)
+        registry[h] = [client, now]
+        # Over capacity: drop the least recently used client. It is not closed
+        # yet because a stream started just before may still be reading from it.
+        while len(registry) > POOL_MAX_CLIENTS:
+            retired.append([registry.popitem(last=False)[1][0], now])
+        return client
+
+
+def get_openai_client(api_key: str) -> OpenAI:
+    """Return a shared client for api_key, creating it on first use."""
+    return _checkout(_clients, _retired, api_key, _new_client)
+
+
+def get_async_openai_client(api_key: str) -> AsyncOpenAI:
+    """Async counterpart of get_openai_client; only call from the serving event loop."""
+    return _checkout(_async_clients, _async_retired, api_key, _new_async_client)
+
+
+def pool_stats():
+    with _lock:
+        return {"clients": len(_clients), "async_clients": len(_async_clients),
+                "retired": len(_retired) + len(_async_retired), "max_clients": POOL_MAX_CLIENTS}
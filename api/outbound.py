@@ -0,0 +1,502 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import heapq
+import importlib
+import itertools
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Shared scheduler for outbound OpenAI and Serper calls.
+#
+# A call first takes one request (and its estimated tokens) from two token
+# buckets: the provider's, shared by every key, and the API key's own. The
+# buckets refill continuously at their per-minute limit, hold at most
+# OUTBOUND_BURST_SECONDS of it, and live in a SQLite file in WAL mode, so every gunicorn worker on the host draws from
+# one budget. A 429 / 503 pauses the bucket until the time the provider's
+# Retry-After asks for (for every worker, not just the caller) and the call
+# queues again. Connection errors, timeouts and other 5xx responses only
+# concern the one call: it backs off with jitter (OUTBOUND_BACKOFF_*) and
+# queues again. Either way a call is made at most OUTBOUND_MAX_ATTEMPTS times.
+#
+# Callers waiting in this process on the same API key are served by priority,
+# then arrival: INTERACTIVE (chat) before NORMAL (recommendations) before
+# BACKGROUND (index builds and refreshes). That order is kept per key bucket
+# only: calls on different keys do not queue behind each other, so a
+# background call on one key can take from the shared provider bucket while a
+# chat call on another key waits. What protects chat across keys (and across
+# workers) is the reserve: non-interactive calls leave OUTBOUND_RESERVE of
+# every bucket they draw from untouched, the provider's included.
+
+OUTBOUND_ENABLED = os.getenv("OUTBOUND_SCHEDULER", "1") != "0"
+OUTBOUND_STATE_PATH = os.getenv("OUTBOUND_STATE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "outbound.sqlite3"))
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "4"))
+OUTBOUND_MAX_WAIT = float(os.getenv("OUTBOUND_MAX_WAIT", "60"))
+OUTBOUND_DEFAULT_RETRY_AFTER = float(os.getenv("OUTBOUND_DEFAULT_RETRY_AFTER", "2"))
+OUTBOUND_BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", "0.5"))
+OUTBOUND_BACKOFF_MAX = float(os.getenv("OUTBOUND_BACKOFF_MAX", "8"))
+OUTBOUND_RESERVE = float(os.getenv("OUTBOUND_RESERVE", "0.2"))
+# A full bucket holds this many seconds of its limit, so an idle minute cannot burst a minute's worth
+OUTBOUND_BURST_SECONDS = float(os.getenv("OUTBOUND_BURST_SECONDS", "10"))
+
+# Per-minute limits; 0 means unlimited. *_KEY_* apply to each API key.
+PROVIDER_LIMITS = {
+    "openai": {
+        "rpm": float(os.getenv("OUTBOUND_OPENAI_RPM", "3000")),
+        "tpm": float(os.getenv("OUTBOUND_OPENAI_TPM", "1000000")),
+        "key_rpm": float(os.getenv("OUTBOUND_OPENAI_KEY_RPM", "500")),
+        "key_tpm": float(os.getenv("OUTBOUND_OPENAI_KEY_TPM", "200000")),
+    },
+    "serper": {
+        "rpm": float(os.getenv("OUTBOUND_SERPER_RPM", "600")),
+        "tpm": 0.0,
+        "key_rpm": float(os.getenv("OUTBOUND_SERPER_KEY_RPM", "300")),
+        "key_tpm": 0.0,
+    },
+}
+
+# SDK-level retries would back off on their own clock; the scheduler is the only retry loop
+SDK_MAX_RETRIES = 0 if OUTBOUND_ENABLED else 2
+
+INTERACTIVE, NORMAL, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BACKGROUND: "background"}
+RETRY_STATUSES = {429, 503}
+TRANSIENT_STATUSES = {408, 500, 502, 504}
+
+_demoted = contextvars.ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background_calls():
+    """Run every outbound call in this block (and the tasks / pool jobs it starts with
+    a copied context) at BACKGROUND priority."""
+    token = _demoted.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _demoted.reset(token)
+
+
+class RateLimited(Exception):
+    """A 429 / 503 from a provider, with the delay it asked for."""
+
+    def __init__(self, status: int, headers=None, message: str = ""):
+        super().__init__(message or f"rate limited ({status})")
+        self.status = status
+        self.retry_after = retry_after_seconds(headers or {})
+
+
+def retry_after_seconds(headers) -> float:
+    """Delay from Retry-After-Ms / Retry-After (seconds or HTTP date), else the default."""
+    value = headers.get("retry-after-ms") or headers.get("Retry-After-Ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    return OUTBOUND_DEFAULT_RETRY_AFTER
+
+
+def _status(exc):
+    # RateLimited.status, openai.APIStatusError.status_code, or the response's
+    return (getattr(exc, "status", None) or getattr(exc, "status_code", None)
+            or getattr(getattr(exc, "response", None), "status_code", None))
+
+
+def retry_delay(exc):
+    """Seconds to pause after exc, or None when exc is not a rate-limit / overload error."""
+    if isinstance(exc, RateLimited):
+        return exc.retry_after
+    if _status(exc) not in RETRY_STATUSES:
+        return None
+    return retry_after_seconds(getattr(getattr(exc, "response", None), "headers", None) or {})
+
+
+@functools.lru_cache(maxsize=None)
+def _transport_errors():
+    # OSError covers requests' ConnectionError / Timeout; the HTTP clients are optional here
+    errors = [OSError, asyncio.TimeoutError]
+    for module, name in (("httpx", "TransportError"), ("openai", "APIConnectionError")):
+        try:
+            errors.append(getattr(importlib.import_module(module), name))
+        except (ImportError, AttributeError):
+            pass
+    return tuple(errors)
+
+
+def backoff_delay(exc, attempt: int):
+    """Jittered exponential delay after a transport error or transient 5xx, else None."""
+    status = _status(exc)
+    if status is not None:
+        if status not in TRANSIENT_STATUSES:
+            return None
+    elif not isinstance(exc, _transport_errors()):
+        return None
+    return random.uniform(0.5, 1.0) * min(OUTBOUND_BACKOFF_MAX, OUTBOUND_BACKOFF_BASE * 2 ** (attempt - 1))
+
+
+def estimate_tokens(*texts, completion: int = 0) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return sum(len(t or "") for t in texts) // 4 + 1 + completion
+
+
+def _key_bucket(provider: str, api_key: str) -> str:
+    return f"{provider}:{hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]}"
+
+
+class BucketStore:
+    """Token buckets in SQLite: (requests, tokens) refilled at limit/60 per second."""
+
+    def __init__(self, path=OUTBOUND_STATE_PATH, burst_seconds=OUTBOUND_BURST_SECONDS):
+        self.path = path
+        self.burst = burst_seconds / 60
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._shared = sqlite3.connect(path, check_same_thread=False, isolation_level=None) if path == ":memory:" else None
+        self._shared_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbound_buckets (
+                name TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    def _conn(self):
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; take() manages its own BEGIN IMMEDIATE transaction
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        lock = self._shared_lock if self._shared is not None else _NO_LOCK
+        with lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _capacity(self, rpm, tpm):
+        return max(rpm * self.burst, 1.0), tpm * self.burst
+
+    def _refilled(self, conn, name, rpm, tpm, now):
+        max_requests, max_tokens = self._capacity(rpm, tpm)
+        row = conn.execute("SELECT requests, tokens, updated_at, blocked_until FROM outbound_buckets WHERE name = ?",
+                           (name,)).fetchone()
+        if row is None:
+            return max_requests, max_tokens, 0.0
+        requests, tokens, updated_at, blocked_until = row
+        elapsed = max(now - updated_at, 0.0)
+        return (min(max_requests, requests + elapsed * rpm / 60), min(max_tokens, tokens + elapsed * tpm / 60),
+                blocked_until)
+
+    def take(self, buckets, tokens: int, reserve: float = 0.0) -> float:
+        """Take one request and `tokens` from every (name, rpm, tpm) bucket, or none of them.
+
+        Returns 0 on success, else the seconds until the take could succeed. A bucket
+        must keep `reserve` of its capacity after the take.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            wait, state = 0.0, []
+            for name, rpm, tpm in buckets:
+                requests, have, blocked_until = self._refilled(conn, name, rpm, tpm, now)
+                max_requests, max_tokens = self._capacity(rpm, tpm)
+                wait = max(wait, blocked_until - now)
+                if rpm:
+                    need = min(1 + reserve * max_requests, max_requests)
+                    if requests < need:
+                        wait = max(wait, (need - requests) * 60 / rpm)
+                if tpm and tokens:
+                    # A request larger than the whole bucket waits for a full bucket, then overdraws
+                    need = min(tokens, max_tokens * (1 - reserve)) + reserve * max_tokens
+                    if have < need:
+                        wait = max(wait, (need - have) * 60 / tpm)
+                # Debt is capped at one bucket, so a bad estimate stalls callers for one burst at most
+                state.append((name, requests - 1, max(have - tokens, -max_tokens), blocked_until))
+            if wait > 0:
+                return wait
+            conn.executemany(
+                "INSERT OR REPLACE INTO outbound_buckets (name, requests, tokens, updated_at, blocked_until) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(name, requests, have, now, blocked_until) for name, requests, have, blocked_until in state],
+            )
+            return 0.0
+
+    def adjust_tokens(self, name: str, delta: float):
+        """Charge (or refund) tokens after the real usage is known."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE outbound_buckets SET tokens = tokens - ? WHERE name = ?", (delta, name))
+
+    def block(self, name: str, rpm: float, tpm: float, until: float):
+        """Pause a bucket for every worker until `until` (epoch seconds)."""
+        now = time.time()
+        with self._transaction() as conn:
+            requests, tokens, blocked_until = self._refilled(conn, name, rpm, tpm, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO outbound_buckets (name, requests, tokens, updated_at, blocked_until) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, requests, tokens, now, max(blocked_until, until)),
+            )
+
+    def levels(self):
+        return {name: {"requests": requests, "tokens": tokens, "blocked_s": max(blocked_until - time.time(), 0.0)}
+                for name, requests, tokens, blocked_until in self._conn().execute(
+                    "SELECT name, requests, tokens, blocked_until FROM outbound_buckets WHERE name NOT LIKE '%:%'")}
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_LOCK = _NoLock()
+
+
+class OutboundBusy(RuntimeError):
+    """The budget could not admit a call within OUTBOUND_MAX_WAIT seconds."""
+
+
+class OutboundScheduler:
+    def __init__(self, store=None, limits=None, max_attempts=OUTBOUND_MAX_ATTEMPTS, max_wait=OUTBOUND_MAX_WAIT,
+                 reserve=OUTBOUND_RESERVE):
+        self.store = store or BucketStore()
+        self.limits = limits or PROVIDER_LIMITS
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self.reserve = reserve
+        self._cond = threading.Condition()
+        self._queues = {}  # key bucket name -> heap of [priority, seq]
+        self._seq = itertools.count()
+        self.calls = 0
+        self.rate_limited = 0
+        self.transient_errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    def _buckets(self, provider: str, api_key: str):
+        lim = self.limits[provider]
+        return [(provider, lim["rpm"], lim["tpm"]), (_key_bucket(provider, api_key), lim["key_rpm"], lim["key_tpm"])]
+
+    def _enqueue(self, queue_name, priority, wake=None):
+        # wake: how to rouse an asyncio waiter when it reaches the head of the queue
+        entry = [priority, next(self._seq), wake]
+        with self._cond:
+            heapq.heappush(self._queues.setdefault(queue_name, []), entry)
+        return entry
+
+    def _leave(self, queue_name, entry):
+        with self._cond:
+            queue = self._queues[queue_name]
+            queue.remove(entry)
+            heapq.heapify(queue)
+            if not queue:
+                del self._queues[queue_name]
+            elif queue[0][2] is not None:
+                queue[0][2]()
+            self._cond.notify_all()
+
+    def _at_head(self, queue_name, entry):
+        with self._cond:
+            return self._queues[queue_name][0] is entry
+
+    def _take(self, buckets, tokens, priority):
+        # Never called with self._cond held: a SQLite write lock must not stall the queue
+        return self.store.take(buckets, tokens, 0.0 if priority == INTERACTIVE else self.reserve)
+
+    def _check_wait(self, provider, t0, wait):
+        if time.monotonic() - t0 + (wait or 0) > self.max_wait:
+            self._count("rejected")
+            raise OutboundBusy(f"{provider} budget exhausted for {self.max_wait:.0f}s")
+
+    def _count(self, name, n=1):
+        with self._cond:
+            setattr(self, name, getattr(self, name) + n)
+
+    def acquire(self, provider: str, api_key: str, tokens: int = 0, priority: int = NORMAL):
+        buckets = self._buckets(provider, api_key)
+        queue_name = buckets[1][0]
+        entry = self._enqueue(queue_name, priority)
+        t0 = time.monotonic()
+        try:
+            while True:
+                with self._cond:
+                    while self._queues[queue_name][0] is not entry:
+                        self._check_wait(provider, t0, None)
+                        self._cond.wait()  # until the queue moves
+                wait = self._take(buckets, tokens, priority)
+                if wait == 0:
+                    return
+                self._check_wait(provider, t0, wait)
+                with self._cond:
+                    self._cond.wait(timeout=wait)
+        finally:
+            self._count("wait_seconds", time.monotonic() - t0)
+            self._leave(queue_name, entry)
+
+    async def aacquire(self, provider: str, api_key: str, tokens: int = 0, priority: int = NORMAL):
+        buckets = self._buckets(provider, api_key)
+        queue_name = buckets[1][0]
+        loop = asyncio.get_running_loop()
+        moved = asyncio.Event()
+        entry = self._enqueue(queue_name, priority, lambda: loop.call_soon_threadsafe(moved.set))
+        t0 = time.monotonic()
+        try:
+            while True:
+                moved.clear()
+                wait = None
+                if self._at_head(queue_name, entry):
+                    wait = await asyncio.to_thread(self._take, buckets, tokens, priority)
+                    if wait == 0:
+                        return
+                self._check_wait(provider, t0, wait)
+                try:
+                    await asyncio.wait_for(moved.wait(), timeout=wait)  # None: until the queue moves
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._count("wait_seconds", time.monotonic() - t0)
+            self._leave(queue_name, entry)
+
+    def _retry_delay(self, provider, api_key, exc, attempt):
+        """Seconds until the next attempt, or None when exc is final. Pauses the bucket on a 429 / 503."""
+        if attempt == self.max_attempts:
+            return None
+        delay = retry_delay(exc)
+        if delay is not None:
+            self._count("rate_limited")
+            # 429s are per key; an overloaded provider pauses every key
+            name, rpm, tpm = self._buckets(provider, api_key)[1 if _status(exc) in (None, 429) else 0]
+            self.store.block(name, rpm, tpm, time.time() + delay)
+            # The caller queues again at once; the paused bucket holds it back
+            delay = 0.0
+        else:
+            delay = backoff_delay(exc, attempt)
+            if delay is None:
+                return None
+            self._count("transient_errors")
+        self._count("retries")
+        return delay
+
+    def _settle(self, provider, api_key, tokens, result):
+        usage = getattr(getattr(result, "usage", None), "total_tokens", None)
+        if tokens and usage:
+            for name, _, tpm in self._buckets(provider, api_key):
+                if tpm:
+                    self.store.adjust_tokens(name, usage - tokens)
+
+    def call(self, provider: str, api_key: str, fn, tokens: int = 0, priority: int = NORMAL):
+        """fn() once admitted by the provider and key budgets; 429 / 503 wait for Retry-After,
+        transport errors and other 5xx back off."""
+        if not OUTBOUND_ENABLED:
+            return fn()
+        priority = max(priority, _demoted.get())
+        for attempt in range(1, self.max_attempts + 1):
+            self.acquire(provider, api_key, tokens, priority)
+            self._count("calls")
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(provider, api_key, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._settle(provider, api_key, tokens, result)
+            return result
+
+    async def acall(self, provider: str, api_key: str, afn, tokens: int = 0, priority: int = NORMAL):
+        """call() for the asyncio app; afn is a coroutine function."""
+        if not OUTBOUND_ENABLED:
+            return await afn()
+        priority = max(priority, _demoted.get())
+        for attempt in range(1, self.max_attempts + 1):
+            await self.aacquire(provider, api_key, tokens, priority)
+            self._count("calls")
+            try:
+                result = await afn()
+            except Exception as e:
+                delay = await asyncio.to_thread(self._retry_delay, provider, api_key, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            await asyncio.to_thread(self._settle, provider, api_key, tokens, result)
+            return result
+
+    def stats(self):
+        with self._cond:
+            waiting = {}
+            for queue in self._queues.values():
+                for entry in queue:
+                    name = PRIORITY_NAMES[entry[0]]
+                    waiting[name] = waiting.get(name, 0) + 1
+        return {
+            "enabled": OUTBOUND_ENABLED,
+            "calls": self.calls,
+            "rate_limited": self.rate_limited,
+            "transient_errors": self.transient_errors,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "wait_s": self.wait_seconds,
+            "waiting": waiting,
+            "providers": self.store.levels(),
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_outbound_scheduler() -> OutboundScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OutboundScheduler()
+        return _scheduler
+
+
+def outbound_call(provider: str, api_key: str, fn, tokens: int = 0, priority: int = NORMAL):
+    return get_outbound_scheduler().call(provider, api_key, fn, tokens, priority)
+
+
+async def aoutbound_call(provider: str, api_key: str, afn, tokens: int = 0, priority: int = NORMAL):
+    return await get_outbound_scheduler().acall(provider, api_key, afn, tokens, priority)
+
+
+def outbound_stats():
+    return get_outbound_scheduler().stats()
@@ -1,8 +1,15 @@
-from flask import Blueprint, request, jsonify, current_app
-from openai import OpenAI
-import os, time, requests
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from annotations import sse_event
+from outbound import RateLimited, RETRY_STATUSES, NORMAL, background_calls, estimate_tokens, outbound_call
+from openai_pool import get_openai_client
+from serper_cache import get_serper_cache
+from kg_backend import cached_neighbours, edge_counts, normalize_name
+from recommend_index import get_recommend_index, pick_suggestions, server_keys, RECOMMEND_INDEX_DEPTH, RECOMMEND_INDEX_BUILD_DEADLINE
+import os, time, requests, contextvars, threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait, TimeoutError as FutureTimeout
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
-import math, re
+import math, re, json
 
 recommend_bp = Blueprint("recommend_bp", __name__)
 
@@ -20,6 +27,45 @@ DOMAIN_WEIGHTS = {
     "nejm.org": 2.0,
 }
 
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
+
+# Candidate searches fan out on a bounded pool over one keep-alive session.
+# Each call has its own (connect, read) timeout, and a request stops waiting
+# after RECOMMEND_DEADLINE seconds, ranking only the searches that finished.
+SERPER_TIMEOUT = (float(os.getenv("SERPER_CONNECT_TIMEOUT", "3")), float(os.getenv("SERPER_READ_TIMEOUT", "8")))
+RECOMMEND_WORKERS = int(os.getenv("RECOMMEND_WORKERS", "8"))
+RECOMMEND_DEADLINE = float(os.getenv("RECOMMEND_DEADLINE", "10"))
+
+# Evidence-ordered verification: candidates with a cached search are scored
+# for free, the rest are searched strongest KG prior first, a few at a time,
+# until k suggestions are "strong" or RECOMMEND_CALL_BUDGET searches are spent.
+RECOMMEND_CALL_BUDGET = int(os.getenv("RECOMMEND_CALL_BUDGET", "10"))
+# The prior is the KG edge count to each candidate tail: one small query
+# (kg_backend.edge_counts, no papers), or the neighbour list when the KG
+# source already fetched it. Ranking waits at most RECOMMEND_PRIOR_TIMEOUT for
+# it and otherwise searches in generator order, so a slow KG never slows
+# recommend. At most RECOMMEND_KG_PENDING KG lookups wait or run per process;
+# past that a request goes without instead of queueing behind a stalled KG.
+RECOMMEND_PRIOR_TIMEOUT = float(os.getenv("RECOMMEND_PRIOR_TIMEOUT", "0.25"))
+RECOMMEND_KG_PENDING = int(os.getenv("RECOMMEND_KG_PENDING", "16"))
+
+# Candidate tails come from the LLM ("llm", the heuristic seeds without an
+# OpenAI key), from the head's KG neighbours ("kg") or both interleaved
+# ("blend"); a request picks one with "candidates". One neighbour list of
+# RECOMMEND_KG_NEIGHBOURS edges serves both the KG source and the prior.
+RECOMMEND_CANDIDATES = os.getenv("RECOMMEND_CANDIDATES", "llm")
+CANDIDATE_SOURCES = ("llm", "kg", "blend")
+RECOMMEND_KG_NEIGHBOURS = int(os.getenv("RECOMMEND_KG_NEIGHBOURS", "500"))
+RECOMMEND_KG_CANDIDATES = int(os.getenv("RECOMMEND_KG_CANDIDATES", "15"))
+RECOMMEND_KG_TIMEOUT = float(os.getenv("RECOMMEND_KG_TIMEOUT", "2"))
+
+_serper_pool = ThreadPoolExecutor(max_workers=RECOMMEND_WORKERS, thread_name_prefix="serper")
+_index_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="recommend-index")
+_kg_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="recommend-kg")
+_kg_slots = threading.BoundedSemaphore(RECOMMEND_KG_PENDING)
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=RECOMMEND_WORKERS))
+
 REL_DEFAULTS = ["AFFECTS","BENEFITS","INTERACTS","PROTECTS","REDUCES","MODULATES","ASSOCIATED_WITH"]
 
 def _domain_weight(url: str) -> float:
@@ -43,19 +89,22 @@ def _extract_pubmed_ids(url: str):
     return ids
 
 def _serper_search(serper_key: str, query: str):
-    resp = requests.post(
-        "https://google.serper.dev/search",
-        headers={"X-API-KEY": serper_key, "Content-Type": "application/json"},
-        json={"q": query, "num": 10}
-    )
-    if resp.status_code != 200:
-        raise RuntimeError(f"Serper error {resp.status_code}: {resp.text}")
-    return resp.json()
+    def post():
+        resp = _http.post(
+            SERPER_URL,
+            headers={"X-API-KEY": serper_key, "Content-Type": "application/json"},
+            json={"q": query, "num": 10},
+            timeout=SERPER_TIMEOUT,
+        )
+        if resp.status_code in RETRY_STATUSES:
+            raise RateLimited(resp.status_code, resp.headers, f"Serper error {resp.status_code}: {resp.text}")
+        if resp.status_code != 200:
+            raise RuntimeError(f"Serper error {resp.status_code}: {resp.text}")
+        return resp.json()
+    # Searches share the Serper budget with every worker and wait behind chat traffic
+    return outbound_call("serper", serper_key, post, priority=NORMAL)
 
-def _verify_pair(serper_key: str, head: str, relation: str, tail: str):
-    # simple one-pass query; reuse logic from verify.py if you prefer
-    q = f"\"{head}\" \"{tail}\" {relation}"
-    data = _serper_search(serper_key, q)
+def _score_search(data):
     organic = data.get("organic") or []
 
     seen = set()
@@ -90,6 +139,20 @@ def _verify_pair(serper_key: str, head: str, relation: str, tail: str):
         "sources": urls[:20],
     }
 
+def _pair_query(head: str, relation: str, tail: str) -> str:
+    # simple one-pass query; reuse logic from verify.py if you prefer
+    return f"\"{head}\" \"{tail}\" {relation}"
+
+def _cached_search(serper_key: str, query: str, use_cache=True):
+    # Results do not depend on the caller's key, so all users share the cache
+    cache = get_serper_cache() if use_cache else None
+    if cache is None:
+        return _serper_search(serper_key, query)
+    return cache.fetch(query, lambda: _serper_search(serper_key, query))
+
+def _verify_pair(serper_key: str, head: str, relation: str, tail: str, use_cache=True):
+    return _score_search(_cached_search(serper_key, _pair_query(head, relation, tail), use_cache))
+
 def _heuristic_candidates(head: str, whitelist):
     h = head.lower()
     # A tiny heuristic seed list. You can expand or replace with dictionaries.
@@ -122,8 +185,7 @@ def _heuristic_candidates(head: str, whitelist):
         seeds = [(r,t) for (r,t) in seeds if r in whitelist]
     return seeds[:12]
 
-def _openai_candidates(openai_key: str, head: str, whitelist):
-    client = OpenAI(api_key=openai_key)
+def _candidate_messages(head: str, whitelist):
     rels = whitelist or REL_DEFAULTS
     sys = (
         "You are helping generate candidate biomedical relation targets. "
@@ -132,60 +194,151 @@ def _openai_candidates(openai_key: str, head: str, whitelist):
         "Return STRICT JSON: [{\"relation\":\"...\",\"tail\":\"...\"}, ...] with <= 15 items."
     )
     user = f"HEAD: {head}\nRELATIONS: {', '.join(rels)}"
+    return [
+        {"role":"system","content":sys},
+        {"role":"user","content":user}
+    ]
+
+def _parse_candidates(txt: str, whitelist):
+    arr = json.loads(txt.strip())
+    out = []
+    for item in arr:
+        rel = str(item.get("relation","")).upper().strip()
+        tail = str(item.get("tail","")).strip()
+        if not rel or not tail:
+            continue
+        out.append((rel, tail))
+    if whitelist:
+        out = [(r,t) for (r,t) in out if r in whitelist]
+    # cap to ~20 before verification
+    return out[:20]
+
+def _candidate_tokens(messages):
+    # Prompt plus up to 15 short {"relation", "tail"} items
+    return estimate_tokens(*(m["content"] for m in messages), completion=400)
+
+def _openai_candidates(openai_key: str, head: str, whitelist):
+    client = get_openai_client(openai_key)
+    messages = _candidate_messages(head, whitelist)
     try:
-        r = client.chat.completions.create(
+        r = outbound_call("openai", openai_key, lambda: client.chat.completions.create(
             model="gpt-4o-mini",
             temperature=0.4,
-            messages=[
-                {"role":"system","content":sys},
-                {"role":"user","content":user}
-            ]
-        )
-        txt = r.choices[0].message.content.strip()
-        import json
-        arr = json.loads(txt)
-        out = []
-        for item in arr:
-            rel = str(item.get("relation","")).upper().strip()
-            tail = str(item.get("tail","")).strip()
-            if not rel or not tail:
-                continue
-            out.append((rel, tail))
-        if whitelist:
-            out = [(r,t) for (r,t) in out if r in whitelist]
-        # cap to ~20 before verification
-        return out[:20]
+            messages=messages
+        ), _candidate_tokens(messages), NORMAL)
+        return _parse_candidates(r.choices[0].message.content, whitelist)
     except Exception as e:
         current_app.logger.warning("[recommend] OpenAI generation failed, falling back: %s", e)
         return _heuristic_candidates(head, whitelist)
 
-@recommend_bp.route("/api/recommend", methods=["POST"])
-def recommend():
-    t0 = time.time()
-    data = request.get_json(force=True) or {}
+def _submit_kg(fn, *args):
+    """fn(*args) on the KG pool, or None when RECOMMEND_KG_PENDING lookups are already waiting."""
+    if not _kg_slots.acquire(blocking=False):
+        return None
+    try:
+        future = _kg_pool.submit(fn, *args)
+    except Exception:
+        _kg_slots.release()
+        raise
+    future.add_done_callback(lambda _: _kg_slots.release())
+    return future
 
-    head = (data.get("head") or "").strip()
-    if not head:
-        return jsonify({"error": "head (node name) is required"}), 400
+def _start_neighbours(head: str):
+    """Look the head's neighbours up in the background, once per request for the KG candidates and the prior."""
+    return _submit_kg(cached_neighbours, head, RECOMMEND_KG_NEIGHBOURS)
+
+def _start_prior(head: str, candidates):
+    """Look up only the edge counts _kg_prior needs for these candidates."""
+    return _submit_kg(edge_counts, head, [tail for _, tail in candidates])
+
+def _kg_rows(head: str, future, timeout: float):
+    """A KG lookup's rows, or [] when it was not started, fails or misses the timeout (in seconds)."""
+    if future is None:
+        current_app.logger.warning("[recommend] %d KG lookups pending; going without for %s", RECOMMEND_KG_PENDING, head)
+        return []
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        current_app.logger.warning("[recommend] KG lookup for %s not ready after %.2fs; going without", head, timeout)
+    except Exception as e:
+        current_app.logger.warning("[recommend] KG lookup failed for %s: %s", head, e)
+    return []
 
+def _kg_candidates(head: str, neighbours, whitelist, exclude):
+    """The head's KG neighbours as (relation, tail), best supported first, one relation per tail."""
+    rows = sorted(neighbours, key=lambda n: (n["count"], len(n["papers"])), reverse=True)
+    out = []
+    seen = {normalize_name(head)}
+    for n in rows:
+        rel, tail = str(n["relation"]).upper(), (n["name"] or "").strip()
+        tnorm = normalize_name(tail)
+        if not tail or tnorm in seen or tnorm in exclude:
+            continue
+        if whitelist and rel not in whitelist:
+            continue
+        seen.add(tnorm)
+        out.append((rel, tail))
+        if len(out) == RECOMMEND_KG_CANDIDATES:
+            break
+    return out
+
+def _blend(*sources):
+    """Interleave candidate lists (first of each, then second of each, ...), capped like the LLM list."""
+    out = []
+    for i in range(max((len(c) for c in sources), default=0)):
+        out.extend(c[i] for c in sources if i < len(c))
+    return out[:20]
+
+def _candidate_source(data):
+    source = str(data.get("candidates") or RECOMMEND_CANDIDATES).lower()
+    return source if source in CANDIDATE_SOURCES else RECOMMEND_CANDIDATES
+
+def _llm_candidates(openai_key: str, head: str, whitelist):
+    if openai_key:
+        return _openai_candidates(openai_key, head, whitelist)
+    return _heuristic_candidates(head, whitelist)
+
+def _generate_candidates(source: str, openai_key: str, head: str, whitelist, exclude, neighbours=None):
+    """Candidate (relation, tail) pairs from the chosen source; "kg" falls back to the LLM for unknown heads."""
+    if source == "llm":
+        return _llm_candidates(openai_key, head, whitelist)
+    future = neighbours if neighbours is not None else _start_neighbours(head)
+    neighbours = _kg_rows(head, future, RECOMMEND_KG_TIMEOUT)
+    from_kg = _kg_candidates(head, neighbours, whitelist, exclude)
+    if _kg_suffices(source, from_kg):
+        return from_kg
+    return _combine_candidates(from_kg, _llm_candidates(openai_key, head, whitelist))
+
+def _kg_suffices(source: str, from_kg):
+    return source == "kg" and bool(from_kg)
+
+def _combine_candidates(from_kg, llm):
+    # "kg" heads unknown to the graph fall back to the LLM list alone
+    return _blend(from_kg, llm) if from_kg else llm
+
+def _parse_params(data):
     k = int(data.get("k", 5))
     whitelist = [str(w).upper() for w in (data.get("whitelist") or [])]
     per_type_cap = int(data.get("per_type_cap", 2))  # not used here; types not inferred
     exclude = [str(x).strip().lower() for x in (data.get("exclude") or [])]
+    return k, whitelist, exclude
 
-    openai_key = (request.headers.get("x-openai-key") or "").strip()
-    serper_key = (request.headers.get("x-serper-key") or "").strip()
-    if not serper_key:
-        return jsonify({"error": "Missing Serper API key"}), 400
+def _call_budget(data):
+    try:
+        return max(0, min(int(data.get("budget", RECOMMEND_CALL_BUDGET)), RECOMMEND_CALL_BUDGET))
+    except (TypeError, ValueError):
+        return RECOMMEND_CALL_BUDGET
 
-    # 1) Get candidate pairs (relation, tail)
-    if openai_key:
-        candidates = _openai_candidates(openai_key, head, whitelist)
-    else:
-        candidates = _heuristic_candidates(head, whitelist)
+def _deadline_seconds(data):
+    # "deadline" (seconds) may shorten the server default, never extend it
+    try:
+        return min(float(data.get("deadline", RECOMMEND_DEADLINE)), RECOMMEND_DEADLINE)
+    except (TypeError, ValueError):
+        return RECOMMEND_DEADLINE
 
-    # 2) Verify each candidate via Serper and score
-    scored = []
+def _filter_candidates(head: str, candidates, exclude):
+    """Drop excluded tails, self-loops and duplicate (relation, tail) pairs."""
+    out = []
     seen_tail = set()
     for rel, tail in candidates:
         tnorm = tail.lower()
@@ -194,29 +347,22 @@ def recommend():
         if (rel, tnorm) in seen_tail:
             continue
         seen_tail.add((rel, tnorm))
+        out.append((rel, tail))
+    return out
 
-        try:
-            ev = _verify_pair(serper_key, head, rel, tail)
-        except Exception as e:
-            current_app.logger.warning("[recommend] verify failed for %s -%s-> %s: %s", head, rel, tail, e)
-            continue
-
-        scored.append({
-            "relation": rel,
-            "tail": tail,
-            "count": ev["count"],
-            "confidence": ev["confidence"],
-            "ui_hint": ev["ui_hint"],
-            "papers": ev["papers"],
-            "sources": ev["sources"],
-        })
-
-    # 3) Rank by evidence count then confidence
-    scored.sort(key=lambda x: (x["count"], x["confidence"]), reverse=True)
-    picked = scored[:k]
+def _scored_entry(rel: str, tail: str, ev):
+    return {
+        "relation": rel,
+        "tail": tail,
+        "count": ev["count"],
+        "confidence": ev["confidence"],
+        "ui_hint": ev["ui_hint"],
+        "papers": ev["papers"],
+        "sources": ev["sources"],
+    }
 
-    # 4) Shape for UI
-    suggestions = [{
+def _shape_suggestion(head: str, p):
+    return {
         "text": f"Show me more about {head} and {p['tail']}",
         "head": {"id": "", "name": head, "types": []},
         "relation": {"type": p["relation"], "direction": "any"},
@@ -227,9 +373,276 @@ def recommend():
         "ui_hint": p["ui_hint"],
         "papers": p["papers"],
         "sources": p["sources"],
-    } for p in picked]
+    }
+
+def _iter_verified(serper_key: str, head: str, candidates, deadline: float, use_cache=True, report=None):
+    """Yield scored entries as their searches complete; searches past the deadline are
+    cancelled and counted in report["timed_out"]."""
+    # Each job runs in a copy of this context so a background_calls() block reaches the scheduler
+    futures = {_serper_pool.submit(contextvars.copy_context().run, _verify_pair, serper_key, head, rel, tail,
+                                   use_cache): (rel, tail)
+               for rel, tail in candidates}
+    t_end = time.time() + deadline
+    pending = set(futures)
+    try:
+        while pending:
+            remaining = t_end - time.time()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel, tail = futures[fut]
+                try:
+                    entry = _scored_entry(rel, tail, fut.result())
+                except Exception as e:
+                    _log_verify_failed(current_app.logger, head, rel, tail, e)
+                    continue
+                yield entry
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if report is not None:
+            report["timed_out"] = report.get("timed_out", 0) + len(pending)
+
+def _log_verify_failed(logger, head: str, rel: str, tail: str, error):
+    logger.warning("[recommend] verify failed for %s -%s-> %s: %s", head, rel, tail, error)
+
+def _in_candidate_order(candidates, entries):
+    # Equal-evidence ties rank in the generator's order, whatever finished first
+    position = {c: i for i, c in enumerate(candidates)}
+    return sorted(entries, key=lambda e: position.get((e["relation"], e["tail"]), len(position)))
+
+def _verify_candidates(serper_key: str, head: str, candidates, deadline: float, use_cache=True):
+    """Score candidates concurrently; returns (scored entries, number cut off by the deadline)."""
+    report = {"timed_out": 0}
+    scored = _in_candidate_order(candidates, _iter_verified(serper_key, head, candidates, deadline, use_cache, report))
+    return scored, report["timed_out"]
+
+def _kg_prior(rows):
+    """{normalized tail: strongest KG edge count} from neighbour or edge_counts rows."""
+    prior = {}
+    for n in rows:
+        tail = normalize_name(n["name"])
+        prior[tail] = max(prior.get(tail, 0), n["count"])
+    return prior
+
+def _order_candidates(head: str, candidates, prior, use_cache=True):
+    """Split into ([((rel, tail), cached search)], remaining candidates by descending prior)."""
+    cache = get_serper_cache() if use_cache else None
+    cached, rest = [], []
+    for rel, tail in candidates:
+        data = cache.peek(_pair_query(head, rel, tail)) if cache is not None else None
+        if data is not None:
+            cached.append(((rel, tail), data))
+        else:
+            rest.append((rel, tail))
+    # Stable sort: the generator's own order breaks ties
+    rest.sort(key=lambda c: prior.get(normalize_name(c[1]), 0), reverse=True)
+    return cached, rest
+
+def _strong(entries):
+    return sum(1 for e in entries if e["ui_hint"] == "strong")
+
+def _plan_searches(head: str, candidates, prior, use_cache, report, search_all=False):
+    """Score the candidates with a cached search and order the rest by prior; returns (entries, queue).
+
+    Starts report's counts: with search_all every queued candidate is a call,
+    otherwise they all count as skipped until _next_wave takes them.
+    """
+    cached, queue = _order_candidates(head, candidates, prior, use_cache)
+    report.update(calls=len(queue) if search_all else 0, cached=len(cached),
+                  skipped=0 if search_all else len(queue), timed_out=0)
+    return [_scored_entry(rel, tail, _score_search(data)) for (rel, tail), data in cached], queue
+
+def _next_wave(queue, strong: int, k: int, budget: int, report):
+    """Take the next searches off queue and count them in report; [] once early stopping applies."""
+    if strong >= k or report["calls"] >= budget:
+        return []
+    # Only as many searches as could still complete the top k
+    n = min(k - strong, budget - report["calls"])
+    wave = queue[:n]
+    del queue[:n]
+    report["calls"] += len(wave)
+    report["skipped"] = len(queue)
+    return wave
+
+def _iter_by_evidence(serper_key: str, head: str, candidates, prior, k: int, budget: int,
+                      deadline: float, use_cache=True, report=None):
+    """Yield scored entries best-prior first, stopping early; fills report with the call counts."""
+    report = {} if report is None else report
+    t_end = time.time() + deadline
+    entries, queue = _plan_searches(head, candidates, prior, use_cache, report)
+    strong = _strong(entries)
+    yield from entries
+    while True:
+        remaining = t_end - time.time()
+        wave = _next_wave(queue, strong, k, budget, report) if remaining > 0 else []
+        if not wave:
+            break
+        for entry in _iter_verified(serper_key, head, wave, remaining, use_cache, report):
+            strong += entry["ui_hint"] == "strong"
+            yield entry
+
+def _iter_all(serper_key: str, head: str, candidates, deadline: float, use_cache=True, report=None):
+    """Yield every candidate scored, cached searches first; fills report with the call counts."""
+    report = {} if report is None else report
+    entries, queue = _plan_searches(head, candidates, {}, use_cache, report, search_all=True)
+    yield from entries
+    yield from _iter_verified(serper_key, head, queue, deadline, use_cache, report)
+
+def _verify_by_evidence(serper_key: str, head: str, candidates, prior, k: int, budget: int,
+                        deadline: float, use_cache=True):
+    """Verify best-prior candidates first and stop early; returns (scored entries, report)."""
+    report = {}
+    scored = _in_candidate_order(candidates, _iter_by_evidence(serper_key, head, candidates, prior, k, budget,
+                                                               deadline, use_cache, report))
+    return scored, report
+
+def _rank_and_shape(head: str, scored, k: int):
+    # Rank by evidence count then confidence
+    scored.sort(key=lambda x: (x["count"], x["confidence"]), reverse=True)
+    return [_shape_suggestion(head, p) for p in scored[:k]]
+
+def index_suggestions(serper_key: str, openai_key: str, head: str):
+    """Full ranked list for the recommendation index: default relations, every candidate searched."""
+    candidates = _filter_candidates(head, _generate_candidates(RECOMMEND_CANDIDATES, openai_key, head, [], []), [])
+    scored, _ = _verify_candidates(serper_key, head, candidates, RECOMMEND_INDEX_BUILD_DEADLINE)
+    return _rank_and_shape(head, scored, RECOMMEND_INDEX_DEPTH)
+
+def _from_index(head: str, k: int, whitelist, exclude):
+    """(suggestions, entry info) when the index can answer this request, else None."""
+    index = get_recommend_index()
+    hit = index.lookup(head) if index is not None else None
+    if hit is None:
+        return None
+    stored, info = hit
+    picked = pick_suggestions(stored, k, whitelist, exclude)
+    # A filtered entry that can no longer fill k is answered live instead
+    if len(picked) < k and len(stored) >= k:
+        return None
+    return picked, info
+
+def _refresh_index_entry(app, serper_key: str, openai_key: str, head: str):
+    index = get_recommend_index()
+    try:
+        with app.app_context(), background_calls():
+            t0 = time.time()
+            suggestions = index_suggestions(serper_key, openai_key, head)
+            index.put(head, suggestions, int((time.time() - t0) * 1000))
+    except Exception as e:
+        app.logger.warning("[recommend] index refresh failed for %s: %s", head, e)
+    finally:
+        index.release_refresh(head)
+
+def _recommend_candidates(data, head: str, whitelist, exclude, openai_key: str, neighbours=None):
+    """Step 1 of recommend(): filtered (relation, tail) candidates from the request's source."""
+    candidates = _generate_candidates(_candidate_source(data), openai_key, head, whitelist, exclude, neighbours)
+    return _filter_candidates(head, candidates, exclude)
+
+def _iter_scored(data, serper_key: str, head: str, candidates, k: int, deadline: float, report, neighbours=None):
+    """Step 2 of recommend(): scored entries as they complete, in evidence order with early
+    stopping unless the request sends "early_stop": false."""
+    use_cache = bool(data.get("cache", True))
+    if not data.get("early_stop", True):
+        return _iter_all(serper_key, head, candidates, deadline, use_cache, report)
+    future = neighbours if neighbours is not None else _start_prior(head, candidates)
+    prior = _kg_prior(_kg_rows(head, future, RECOMMEND_PRIOR_TIMEOUT))
+    return _iter_by_evidence(serper_key, head, candidates, prior, k, _call_budget(data), deadline, use_cache, report)
+
+def _finish_recommend(logger, head: str, candidates, scored, k: int, t0: float, report):
+    """Steps 3 and 4 of recommend(): the ranked, UI-shaped top k, logged with the call counts."""
+    suggestions = _rank_and_shape(head, _in_candidate_order(candidates, scored), k)
+    logger.info("[recommend] head=%s -> %d suggestions in %dms (%d calls, %d cached, %d skipped, %d timed out)",
+                head, len(suggestions), int((time.time()-t0)*1000),
+                report["calls"], report["cached"], report["skipped"], report["timed_out"])
+    return suggestions
+
+def _request_args(data, headers):
+    """(head, k, whitelist, exclude, openai_key, serper_key, stream) for recommend(), or an error for a 400."""
+    head = (data.get("head") or "").strip()
+    if not head:
+        return None, "head (node name) is required"
+
+    k, whitelist, exclude = _parse_params(data)
+
+    openai_key = (headers.get("x-openai-key") or "").strip()
+    serper_key = (headers.get("x-serper-key") or "").strip()
+    if not serper_key:
+        return None, "Missing Serper API key"
+
+    # "stream": "sse" sends each suggestion as soon as it is scored, then the ranked top k
+    stream = data.get("stream")
+    if stream and stream != "sse":
+        return None, "stream must be 'sse'"
+    return (head, k, whitelist, exclude, openai_key, serper_key, stream), None
+
+def _index_response(logger, head: str, hit, t0: float):
+    """(body, keys) for an index hit; keys are the server's keys when this request should rebuild the entry."""
+    suggestions, info = hit
+    # The entry serves everyone, so it is rebuilt with the server's keys, not this caller's
+    keys = server_keys() if info["state"] == "stale" else None
+    if keys is not None and not get_recommend_index().claim_refresh(head):
+        keys = None
+    logger.info("[recommend] head=%s -> %d suggestions from index (%s) in %.1fms",
+                head, len(suggestions), info["state"], (time.time()-t0)*1000)
+    body = {"suggestions": suggestions, "calls": 0, "cached": 0, "skipped": 0, "timed_out": 0, "index": info}
+    return body, keys
+
+def _stream_recommend(data, head: str, k: int, whitelist, exclude, openai_key: str, serper_key: str, t0: float):
+    """recommend() as SSE: a "suggestion" event per scored candidate, then the "ranked" top k."""
+    neighbours = _start_neighbours(head) if _candidate_source(data) != "llm" else None
+    candidates = _recommend_candidates(data, head, whitelist, exclude, openai_key, neighbours)
+    deadline = max(_deadline_seconds(data) - (time.time() - t0), 0.0)
+    report, scored, first_ms = {}, [], None
+    for entry in _iter_scored(data, serper_key, head, candidates, k, deadline, report, neighbours):
+        if first_ms is None:
+            first_ms = (time.time() - t0) * 1e3
+        scored.append(entry)
+        yield sse_event("suggestion", _shape_suggestion(head, entry))
+    suggestions = _finish_recommend(current_app.logger, head, candidates, scored, k, t0, report)
+    yield sse_event("ranked", {"suggestions": suggestions, **report, "first_suggestion_ms": first_ms})
+
+def _replay_index(body):
+    for suggestion in body["suggestions"]:
+        yield sse_event("suggestion", suggestion)
+    yield sse_event("ranked", body)
+
+def _sse_response(events):
+    return Response(events, content_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@recommend_bp.route("/api/recommend", methods=["POST"])
+def recommend():
+    t0 = time.time()
+    data = request.get_json(force=True) or {}
+
+    args, error = _request_args(data, request.headers)
+    if error:
+        return jsonify({"error": error}), 400
+    head, k, whitelist, exclude, openai_key, serper_key, stream = args
+
+    # 0) Precomputed suggestions for frequent heads; stale ones are rebuilt in the background
+    hit = _from_index(head, k, whitelist, exclude) if data.get("index", True) else None
+    if hit is not None:
+        body, keys = _index_response(current_app.logger, head, hit, t0)
+        if keys is not None:
+            _index_refresh_pool.submit(_refresh_index_entry, current_app._get_current_object(), *keys, head)
+        return _sse_response(_replay_index(body)) if stream else jsonify(body)
+
+    if stream:
+        return _sse_response(stream_with_context(
+            _stream_recommend(data, head, k, whitelist, exclude, openai_key, serper_key, t0)))
+
+    # 1) Get candidate pairs (relation, tail); the KG sources and the prior share one neighbour lookup
+    neighbours = _start_neighbours(head) if _candidate_source(data) != "llm" else None
+    candidates = _recommend_candidates(data, head, whitelist, exclude, openai_key, neighbours)
+
+    # 2) Verify the candidates via Serper and score what finishes in time
+    deadline = max(_deadline_seconds(data) - (time.time() - t0), 0.0)
+    report = {}
+    scored = list(_iter_scored(data, serper_key, head, candidates, k, deadline, report, neighbours))
 
-    current_app.logger.info("[recommend] head=%s -> %d suggestions in %dms",
-                            head, len(suggestions), int((time.time()-t0)*1000))
+    # 3) Rank and 4) shape for UI
+    suggestions = _finish_recommend(current_app.logger, head, candidates, scored, k, t0, report)
 
-    return jsonify({"suggestions": suggestions})
+    return jsonify({"suggestions": suggestions, **report})
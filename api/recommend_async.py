@@ -0,0 +1,290 @@
+from quart import Blueprint, Response, request, jsonify, current_app, stream_with_context
+import asyncio
+import time
+
+import httpx
+
+from openai_pool import get_async_openai_client
+from serper_cache import get_serper_cache
+from recommend_index import get_recommend_index, RECOMMEND_INDEX_DEPTH, RECOMMEND_INDEX_BUILD_DEADLINE
+from recommend import (
+    SERPER_URL, SERPER_TIMEOUT, RECOMMEND_WORKERS, RECOMMEND_CANDIDATES,
+    RECOMMEND_KG_NEIGHBOURS, RECOMMEND_KG_TIMEOUT, RECOMMEND_PRIOR_TIMEOUT, RECOMMEND_KG_PENDING,
+    _submit_kg, _kg_candidates, _kg_suffices, _combine_candidates, _candidate_source,
+    _candidate_messages, _parse_candidates, _heuristic_candidates,
+    _deadline_seconds, _call_budget, _filter_candidates, _pair_query, _score_search,
+    _scored_entry, _rank_and_shape, _kg_prior, _from_index, _plan_searches, _next_wave, _strong,
+    _log_verify_failed, _finish_recommend, _request_args, _index_response,
+    _in_candidate_order, _shape_suggestion, _replay_index, _candidate_tokens,
+)
+from annotations import sse_event
+from kg_backend import cached_neighbours, edge_counts
+from outbound import RateLimited, RETRY_STATUSES, NORMAL, background_calls, aoutbound_call
+
+# asyncio counterpart of recommend.py for the ASGI app (asgi.py)
+recommend_abp = Blueprint("recommend_abp", __name__)
+
+http = None
+_searches = None  # bounds concurrent Serper calls per process, like recommend._serper_pool
+_index_refreshes = set()  # keeps background index rebuilds referenced until they finish
+
+
+@recommend_abp.before_app_serving
+async def _open_http():
+    global http, _searches
+    _searches = asyncio.Semaphore(RECOMMEND_WORKERS)
+    http = httpx.AsyncClient(
+        timeout=httpx.Timeout(SERPER_TIMEOUT[1], connect=SERPER_TIMEOUT[0]),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+
+
+@recommend_abp.after_app_serving
+async def _close_http():
+    if http is not None:
+        await http.aclose()
+
+
+async def _aserper_search(serper_key: str, query: str):
+    async def post():
+        async with _searches:
+            resp = await http.post(
+                SERPER_URL,
+                headers={"X-API-KEY": serper_key, "Content-Type": "application/json"},
+                json={"q": query, "num": 10},
+            )
+        if resp.status_code in RETRY_STATUSES:
+            raise RateLimited(resp.status_code, resp.headers, f"Serper error {resp.status_code}: {resp.text}")
+        if resp.status_code != 200:
+            raise RuntimeError(f"Serper error {resp.status_code}: {resp.text}")
+        return resp.json()
+    return await aoutbound_call("serper", serper_key, post, priority=NORMAL)
+
+
+async def _acached_search(serper_key: str, query: str, use_cache=True):
+    cache = await asyncio.to_thread(get_serper_cache) if use_cache else None
+    if cache is None:
+        return await _aserper_search(serper_key, query)
+    return await cache.afetch(query, lambda: _aserper_search(serper_key, query))
+
+
+async def _aopenai_candidates(openai_key: str, head: str, whitelist):
+    client = get_async_openai_client(openai_key)
+    messages = _candidate_messages(head, whitelist)
+    try:
+        r = await aoutbound_call("openai", openai_key, lambda: client.chat.completions.create(
+            model="gpt-4o-mini",
+            temperature=0.4,
+            messages=messages
+        ), _candidate_tokens(messages), NORMAL)
+        return _parse_candidates(r.choices[0].message.content, whitelist)
+    except Exception as e:
+        current_app.logger.warning("[recommend] OpenAI generation failed, falling back: %s", e)
+        return _heuristic_candidates(head, whitelist)
+
+
+async def _allm_candidates(openai_key: str, head: str, whitelist):
+    if openai_key:
+        return await _aopenai_candidates(openai_key, head, whitelist)
+    return _heuristic_candidates(head, whitelist)
+
+
+def _asubmit_kg(fn, *args):
+    """recommend._submit_kg as an awaitable; the lookup shares the bounded KG pool with the Flask app."""
+    future = _submit_kg(fn, *args)
+    if future is None:
+        return None
+    future = asyncio.wrap_future(future)
+    # A request that ends early never awaits the lookup; retrieve its error so it is not reported as lost
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return future
+
+
+def _astart_neighbours(head: str):
+    return _asubmit_kg(cached_neighbours, head, RECOMMEND_KG_NEIGHBOURS)
+
+
+def _astart_prior(head: str, candidates):
+    return _asubmit_kg(edge_counts, head, [tail for _, tail in candidates])
+
+
+async def _akg_rows(head: str, future, timeout: float):
+    """recommend._kg_rows for the asyncio app; a timeout leaves the lookup running for later waiters."""
+    if future is None:
+        current_app.logger.warning("[recommend] %d KG lookups pending; going without for %s", RECOMMEND_KG_PENDING, head)
+        return []
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        current_app.logger.warning("[recommend] KG lookup for %s not ready after %.2fs; going without", head, timeout)
+    except Exception as e:
+        current_app.logger.warning("[recommend] KG lookup failed for %s: %s", head, e)
+    return []
+
+
+async def _agenerate_candidates(source: str, openai_key: str, head: str, whitelist, exclude, neighbours=None):
+    """recommend._generate_candidates for the asyncio app; the KG and LLM sources run side by side."""
+    if source == "llm":
+        return await _allm_candidates(openai_key, head, whitelist)
+    llm_task = asyncio.create_task(_allm_candidates(openai_key, head, whitelist)) if source == "blend" else None
+    future = neighbours if neighbours is not None else _astart_neighbours(head)
+    neighbours = await _akg_rows(head, future, RECOMMEND_KG_TIMEOUT)
+    from_kg = _kg_candidates(head, neighbours, whitelist, exclude)
+    if _kg_suffices(source, from_kg):
+        return from_kg
+    return _combine_candidates(from_kg, await (llm_task or _allm_candidates(openai_key, head, whitelist)))
+
+
+async def _aiter_verified(serper_key: str, head: str, candidates, deadline: float, use_cache=True, report=None):
+    """recommend._iter_verified on the event loop; whatever misses the deadline is cancelled."""
+    tasks = {asyncio.create_task(_acached_search(serper_key, _pair_query(head, rel, tail), use_cache)): (rel, tail)
+             for rel, tail in candidates}
+    t_end = time.time() + deadline
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = t_end - time.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                rel, tail = tasks[task]
+                if task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    _log_verify_failed(current_app.logger, head, rel, tail, task.exception())
+                    continue
+                yield _scored_entry(rel, tail, _score_search(task.result()))
+    finally:
+        for task in pending:
+            task.cancel()
+        if report is not None:
+            report["timed_out"] = report.get("timed_out", 0) + len(pending)
+
+
+async def _averify_candidates(serper_key: str, head: str, candidates, deadline: float, use_cache=True):
+    """recommend._verify_candidates for the asyncio app."""
+    report = {"timed_out": 0}
+    scored = [e async for e in _aiter_verified(serper_key, head, candidates, deadline, use_cache, report)]
+    return _in_candidate_order(candidates, scored), report["timed_out"]
+
+
+async def _aiter_all(serper_key: str, head: str, candidates, deadline: float, use_cache=True, report=None):
+    """recommend._iter_all for the asyncio app."""
+    report = {} if report is None else report
+    entries, queue = await asyncio.to_thread(_plan_searches, head, candidates, {}, use_cache, report, True)
+    for entry in entries:
+        yield entry
+    async for entry in _aiter_verified(serper_key, head, queue, deadline, use_cache, report):
+        yield entry
+
+
+async def _aiter_by_evidence(serper_key: str, head: str, candidates, prior, k: int, budget: int,
+                             deadline: float, use_cache=True, report=None):
+    """recommend._iter_by_evidence for the asyncio app."""
+    report = {} if report is None else report
+    t_end = time.time() + deadline
+    entries, queue = await asyncio.to_thread(_plan_searches, head, candidates, prior, use_cache, report)
+    strong = _strong(entries)
+    for entry in entries:
+        yield entry
+    while True:
+        remaining = t_end - time.time()
+        wave = _next_wave(queue, strong, k, budget, report) if remaining > 0 else []
+        if not wave:
+            break
+        async for entry in _aiter_verified(serper_key, head, wave, remaining, use_cache, report):
+            strong += entry["ui_hint"] == "strong"
+            yield entry
+
+
+async def _aiter_scored(data, serper_key: str, head: str, candidates, k: int, deadline: float, report,
+                        neighbours=None):
+    """recommend._iter_scored for the asyncio app."""
+    use_cache = bool(data.get("cache", True))
+    if not data.get("early_stop", True):
+        entries = _aiter_all(serper_key, head, candidates, deadline, use_cache, report)
+    else:
+        future = neighbours if neighbours is not None else _astart_prior(head, candidates)
+        prior = _kg_prior(await _akg_rows(head, future, RECOMMEND_PRIOR_TIMEOUT))
+        entries = _aiter_by_evidence(serper_key, head, candidates, prior, k, _call_budget(data),
+                                     deadline, use_cache, report)
+    async for entry in entries:
+        yield entry
+
+
+async def _arecommend_candidates(data, head: str, whitelist, exclude, openai_key: str, neighbours=None):
+    candidates = await _agenerate_candidates(_candidate_source(data), openai_key, head, whitelist, exclude,
+                                             neighbours)
+    return _filter_candidates(head, candidates, exclude)
+
+
+@stream_with_context
+async def _astream_recommend(data, head: str, k: int, whitelist, exclude, openai_key: str, serper_key: str, t0: float):
+    """recommend._stream_recommend for the asyncio app."""
+    neighbours = _astart_neighbours(head) if _candidate_source(data) != "llm" else None
+    candidates = await _arecommend_candidates(data, head, whitelist, exclude, openai_key, neighbours)
+    deadline = max(_deadline_seconds(data) - (time.time() - t0), 0.0)
+    report, scored, first_ms = {}, [], None
+    async for entry in _aiter_scored(data, serper_key, head, candidates, k, deadline, report, neighbours):
+        if first_ms is None:
+            first_ms = (time.time() - t0) * 1e3
+        scored.append(entry)
+        yield sse_event("suggestion", _shape_suggestion(head, entry))
+    suggestions = _finish_recommend(current_app.logger, head, candidates, scored, k, t0, report)
+    yield sse_event("ranked", {"suggestions": suggestions, **report, "first_suggestion_ms": first_ms})
+
+
+def _sse_response(events):
+    return Response(events, content_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _arefresh_index_entry(serper_key: str, openai_key: str, head: str):
+    """recommend.index_suggestions on the event loop, stored into the index."""
+    index = get_recommend_index()
+    try:
+        with background_calls():
+            t0 = time.time()
+            candidates = _filter_candidates(
+                head, await _agenerate_candidates(RECOMMEND_CANDIDATES, openai_key, head, [], []), [])
+            scored, _ = await _averify_candidates(serper_key, head, candidates, RECOMMEND_INDEX_BUILD_DEADLINE)
+            suggestions = _rank_and_shape(head, scored, RECOMMEND_INDEX_DEPTH)
+            await asyncio.to_thread(index.put, head, suggestions, int((time.time() - t0) * 1000))
+    except Exception as e:
+        current_app.logger.warning("[recommend] index refresh failed for %s: %s", head, e)
+    finally:
+        index.release_refresh(head)
+
+
+@recommend_abp.route("/api/recommend", methods=["POST"])
+async def recommend():
+    t0 = time.time()
+    data = await request.get_json(force=True) or {}
+
+    args, error = _request_args(data, request.headers)
+    if error:
+        return jsonify({"error": error}), 400
+    head, k, whitelist, exclude, openai_key, serper_key, stream = args
+
+    hit = await asyncio.to_thread(_from_index, head, k, whitelist, exclude) if data.get("index", True) else None
+    if hit is not None:
+        body, keys = _index_response(current_app.logger, head, hit, t0)
+        if keys is not None:
+            task = asyncio.create_task(_arefresh_index_entry(*keys, head))
+            _index_refreshes.add(task)
+            task.add_done_callback(_index_refreshes.discard)
+        return _sse_response(_replay_index(body)) if stream else jsonify(body)
+
+    if stream:
+        return _sse_response(_astream_recommend(data, head, k, whitelist, exclude, openai_key, serper_key, t0))
+
+    neighbours = _astart_neighbours(head) if _candidate_source(data) != "llm" else None
+    candidates = await _arecommend_candidates(data, head, whitelist, exclude, openai_key, neighbours)
+    deadline = max(_deadline_seconds(data) - (time.time() - t0), 0.0)
+    report = {}
+    scored = [e async for e in _aiter_scored(data, serper_key, head, candidates, k, deadline, report, neighbours)]
+
+    suggestions = _finish_recommend(current_app.logger, head, candidates, scored, k, t0, report)
+
+    return jsonify({"suggestions": suggestions, **report})
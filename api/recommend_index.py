@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from kg_backend import normalize_name
+
+# Precomputed /api/recommend results for frequent heads.
+#
+# A batch job (`python api/recommend_index.py build`) scores every candidate
+# for a list of heads, or the top-N heads by KG degree, and stores the ranked
+# suggestions keyed on the normalized head with the time they were built.
+# recommend() serves an entry while it is younger than RECOMMEND_INDEX_TTL;
+# up to RECOMMEND_INDEX_MAX_STALE it is still served but rebuilt in the
+# background, and anything older (or missing) goes through the live path.
+# The file is SQLite in WAL mode so every gunicorn worker reads one copy.
+# Entries are shared by every user, so background rebuilds are paid for with
+# the server's SERPER_API_KEY / OPENAI_API_KEY, never a requester's own key;
+# without a server Serper key stale entries are served until they expire.
+
+RECOMMEND_INDEX_ENABLED = os.getenv("RECOMMEND_INDEX", "1") != "0"
+RECOMMEND_INDEX_PATH = os.getenv("RECOMMEND_INDEX_PATH", os.path.join(os.path.dirname(__file__), ".cache", "recommend_index.sqlite3"))
+RECOMMEND_INDEX_TTL = float(os.getenv("RECOMMEND_INDEX_TTL", str(24 * 3600)))
+RECOMMEND_INDEX_MAX_STALE = float(os.getenv("RECOMMEND_INDEX_MAX_STALE", str(7 * 24 * 3600)))
+RECOMMEND_INDEX_DEPTH = int(os.getenv("RECOMMEND_INDEX_DEPTH", "20"))
+RECOMMEND_INDEX_BUILD_DEADLINE = float(os.getenv("RECOMMEND_INDEX_BUILD_DEADLINE", "30"))
+
+
+def server_keys():
+    """(serper_key, openai_key) from the environment for index builds, or None without SERPER_API_KEY."""
+    serper_key = os.getenv("SERPER_API_KEY", "")
+    if not serper_key:
+        return None
+    return serper_key, os.getenv("OPENAI_API_KEY", "")
+
+
+def pick_suggestions(suggestions, k: int, whitelist, exclude):
+    """Top k stored suggestions allowed by the request's whitelist / exclude parameters."""
+    out = []
+    for s in suggestions:
+        if whitelist and s["relation"]["type"] not in whitelist:
+            continue
+        if s["tail"]["name"].strip().lower() in exclude:
+            continue
+        out.append(s)
+        if len(out) == k:
+            break
+    return out
+
+
+class RecommendIndex:
+    def __init__(self, path=RECOMMEND_INDEX_PATH, ttl=RECOMMEND_INDEX_TTL, max_stale=RECOMMEND_INDEX_MAX_STALE):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._shared = sqlite3.connect(path, check_same_thread=False) if path == ":memory:" else None
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recommend_index (
+                    head_norm TEXT PRIMARY KEY,
+                    head TEXT NOT NULL,
+                    suggestions TEXT NOT NULL,
+                    built_at REAL NOT NULL,
+                    build_ms INTEGER NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def _conn(self):
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, head: str):
+        """(suggestions, {"state", "built_at", "age_s"}) for a servable entry, else None.
+
+        state is "fresh" or "stale"; stale entries should be rebuilt (see claim_refresh).
+        """
+        row = self._conn().execute("SELECT suggestions, built_at FROM recommend_index WHERE head_norm = ?",
+                                   (normalize_name(head),)).fetchone()
+        age = time.time() - row[1] if row else None
+        with self._lock:
+            if row is None or age > self.max_stale:
+                self.misses += 1
+                return None
+            state = "fresh" if age <= self.ttl else "stale"
+            if state == "fresh":
+                self.fresh_hits += 1
+            else:
+                self.stale_hits += 1
+        return json.loads(row[0]), {"state": state, "built_at": row[1], "age_s": age}
+
+    def put(self, head: str, suggestions, build_ms: int = 0):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recommend_index (head_norm, head, suggestions, built_at, build_ms) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (normalize_name(head), head, json.dumps(suggestions, separators=(",", ":")), time.time(), build_ms),
+            )
+
+    def built_at(self):
+        """{normalized head: build time} for every entry."""
+        return dict(self._conn().execute("SELECT head_norm, built_at FROM recommend_index"))
+
+    def claim_refresh(self, head: str) -> bool:
+        """True for the one caller that should rebuild this head now."""
+        key = normalize_name(head)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.refreshes += 1
+            return True
+
+    def release_refresh(self, head: str):
+        with self._lock:
+            self._refreshing.discard(normalize_name(head))
+
+    def stats(self):
+        count, oldest, newest = self._conn().execute(
+            "SELECT COUNT(*), MIN(built_at), MAX(built_at) FROM recommend_index").fetchone()
+        now = time.time()
+        with self._lock:
+            lookups = self.fresh_hits + self.stale_hits + self.misses
+            return {
+                "entries": count,
+                "oldest_age_s": now - oldest if oldest else None,
+                "newest_age_s": now - newest if newest else None,
+                "fresh_hits": self.fresh_hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": (self.fresh_hits + self.stale_hits) / lookups if lookups else 0.0,
+                "refreshes": self.refreshes,
+                "refreshing": len(self._refreshing),
+            }
+
+
+_recommend_index = None
+_recommend_index_lock = threading.Lock()
+
+
+def get_recommend_index():
+    global _recommend_index
+    if not RECOMMEND_INDEX_ENABLED:
+        return None
+    with _recommend_index_lock:
+        if _recommend_index is None:
+            _recommend_index = RecommendIndex()
+        return _recommend_index
+
+
+def recommend_index_stats():
+    index = get_recommend_index()
+    return index.stats() if index is not None else {"enabled": False}
+
+
+def _read_heads(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Precompute /api/recommend results for frequent heads")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="score and store suggestions for a head list or the top heads by KG degree")
+    b.add_argument("--heads", help="file with one head per line")
+    b.add_argument("--top", type=int, default=300, help="without --heads: this many heads by KG out-degree")
+    b.add_argument("--stale-only", action="store_true", help="skip heads whose entry is still fresh")
+    b.add_argument("--out", default=RECOMMEND_INDEX_PATH)
+    sub.add_parser("stats", help="entry count and ages")
+    args = ap.parse_args()
+
+    if args.cmd == "stats":
+        print(json.dumps(RecommendIndex().stats(), indent=2))
+        raise SystemExit(0)
+
+    from dotenv import load_dotenv
+    from pathlib import Path
+    load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+    from flask import Flask
+    from kg_backend import get_kg_backend
+    from recommend import index_suggestions
+    from outbound import background_calls
+
+    keys = server_keys()
+    if keys is None:
+        raise SystemExit("SERPER_API_KEY is required to build the recommendation index")
+    serper_key, openai_key = keys
+
+    if args.heads:
+        heads = _read_heads(args.heads)
+    else:
+        with get_kg_backend().session() as session:
+            heads = [h["name"] for h in session.top_heads(args.top)]
+
+    index = RecommendIndex(args.out)
+    built = index.built_at() if args.stale_only else {}
+    # recommend's helpers log through current_app; the build queues behind serving traffic
+    with Flask(__name__).app_context(), background_calls():
+        for i, head in enumerate(heads, 1):
+            if time.time() - built.get(normalize_name(head), 0) <= index.ttl:
+                continue
+            t0 = time.time()
+            suggestions = index_suggestions(serper_key, openai_key, head)
+            build_ms = int((time.time() - t0) * 1000)
+            index.put(head, suggestions, build_ms)
+            print(f"[{i}/{len(heads)}] {head}: {len(suggestions)} suggestions in {build_ms}ms")
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# Persistent cache of Serper search results for /api/recommend. Entries are
+# keyed on the normalized query string, expire after a TTL and are trimmed
+# least-recently-used first once the file passes its size limits; SQLite in
+# WAL mode lets every gunicorn worker share one file. The limits are checked
+# every SERPER_CACHE_EVICT_EVERY puts, or sooner once this worker's running
+# estimate crosses one, rather than with a full-table scan per write.
+#
+# Identical searches that are already in flight in this process are not sent
+# twice: the first caller makes the request and the others wait for its
+# result (single flight), for threads and for the asyncio app alike.
+
+SERPER_CACHE_ENABLED = os.getenv("SERPER_CACHE", "1") != "0"
+SERPER_CACHE_PATH = os.getenv("SERPER_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "serper.sqlite3"))
+SERPER_CACHE_TTL = float(os.getenv("SERPER_CACHE_TTL", str(3 * 24 * 3600)))
+SERPER_CACHE_MAX_ENTRIES = int(os.getenv("SERPER_CACHE_MAX_ENTRIES", "50000"))
+SERPER_CACHE_MAX_BYTES = int(os.getenv("SERPER_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SERPER_CACHE_EVICT_EVERY = int(os.getenv("SERPER_CACHE_EVICT_EVERY", "100"))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(str(query or "").split()).lower()
+
+
+def serper_cache_key(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+class SerperCache:
+    def __init__(self, path=SERPER_CACHE_PATH, ttl=SERPER_CACHE_TTL,
+                 max_entries=SERPER_CACHE_MAX_ENTRIES, max_bytes=SERPER_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.calls = 0
+        self.shared = 0  # callers that joined an identical in-flight search
+        self._lock = threading.Lock()
+        self._inflight = {}   # key -> concurrent.futures.Future
+        self._ainflight = {}  # key -> asyncio.Future
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS searches (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS searches_accessed ON searches(accessed_at)")
+        self._conn.commit()
+        self._puts = 0
+        self._count, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM searches").fetchone()
+
+    def _lookup(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT result, created_at FROM searches WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM searches WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE searches SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def peek(self, query: str):
+        """Stored result without counting a hit or miss (used to plan which searches are free)."""
+        return self._lookup(serper_cache_key(query))
+
+    def get(self, query: str):
+        result = self._lookup(serper_cache_key(query))
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def put(self, query: str, result):
+        data = json.dumps(result, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (key, result, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (serper_cache_key(query), data, len(data), now, now),
+            )
+            self._puts += 1
+            self._count += 1
+            self._bytes += len(data)
+            if (self._puts >= SERPER_CACHE_EVICT_EVERY or self._count > self.max_entries
+                    or self._bytes > self.max_bytes):
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM searches WHERE created_at < ?", (now - self.ttl,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM searches").fetchone()
+        freed = 0
+        drop = []
+        if count > self.max_entries or total > self.max_bytes:
+            # Trim to 90% of the limits so a full cache is not scanned again on the next put
+            for key, size in self._conn.execute("SELECT key, size FROM searches ORDER BY accessed_at ASC"):
+                if count - len(drop) <= 0.9 * self.max_entries and total - freed <= 0.9 * self.max_bytes:
+                    break
+                drop.append((key,))
+                freed += size
+            self._conn.executemany("DELETE FROM searches WHERE key = ?", drop)
+        self._puts = 0
+        self._count, self._bytes = count - len(drop), total - freed
+
+    def fetch(self, query: str, search):
+        """Cached result for query, else search() once per identical in-flight query."""
+        cached = self.get(query)
+        if cached is not None:
+            return cached
+        key = serper_cache_key(query)
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return fut.result()
+        try:
+            # Another worker may have stored it since our lookup
+            result = self._lookup(key)
+            if result is None:
+                with self._lock:
+                    self.calls += 1
+                result = search()
+                self.put(query, result)
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def afetch(self, query: str, asearch):
+        """fetch() for the asyncio app; asearch is a coroutine function. SQLite work runs in a thread."""
+        cached = await asyncio.to_thread(self.get, query)
+        if cached is not None:
+            return cached
+        key = serper_cache_key(query)
+        fut = self._ainflight.get(key)
+        if fut is not None:
+            with self._lock:
+                self.shared += 1
+            # shield: one cancelled follower must not cancel the shared search
+            return await asyncio.shield(fut)
+        fut = self._ainflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await asyncio.to_thread(self._lookup, key)
+            if result is None:
+                with self._lock:
+                    self.calls += 1
+                result = await asearch()
+                await asyncio.to_thread(self.put, query, result)
+            fut.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._ainflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM searches").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "bytes": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "calls": self.calls,
+                "shared_in_flight": self.shared,
+            }
+
+
+_serper_cache = None
+_serper_cache_lock = threading.Lock()
+
+
+def get_serper_cache():
+    global _serper_cache
+    if not SERPER_CACHE_ENABLED:
+        return None
+    with _serper_cache_lock:
+        if _serper_cache is None:
+            _serper_cache = SerperCache()
+        return _serper_cache
+
+
+def serper_cache_stats():
+    cache = get_serper_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
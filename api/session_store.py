@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Per-user recommendation space for /api/data. Rows live in a SQLite file in
+# WAL mode so every gunicorn worker sees the same sessions; (user_id, rec_id)
+# is the primary key, so lookups by recommendId are index seeks. Entries
+# expire after SESSION_TTL and each user keeps at most SESSION_MAX_ENTRIES.
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(os.path.dirname(__file__), ".cache", "sessions.sqlite3"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "200"))
+SESSION_PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL", "300"))
+
+
+class RecommendationStore:
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._last_purge = 0.0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._shared = sqlite3.connect(path, check_same_thread=False) if path == ":memory:" else None
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS recommendations (
+                    user_id TEXT NOT NULL,
+                    rec_id INTEGER NOT NULL,
+                    entity TEXT NOT NULL,
+                    neighbor TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, rec_id),
+                    UNIQUE (user_id, entity, neighbor)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS recommendations_created ON recommendations(created_at);
+                CREATE TABLE IF NOT EXISTS rec_counters (
+                    user_id TEXT PRIMARY KEY,
+                    next_id INTEGER NOT NULL
+                ) WITHOUT ROWID;
+            """)
+
+    def _conn(self):
+        # One connection per thread (sqlite3 connections are not thread-safe)
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _maybe_purge(self, conn, now):
+        if now - self._last_purge < SESSION_PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        conn.execute("DELETE FROM recommendations WHERE created_at < ?", (now - self.ttl,))
+        conn.execute("DELETE FROM rec_counters WHERE user_id NOT IN (SELECT DISTINCT user_id FROM recommendations)")
+
+    def add(self, user_id: str, entity: str, neighbor: str) -> int:
+        """Add (entity, neighbor) to the user's space and return its recommendation id."""
+        now = time.time()
+        with self._conn() as conn:
+            self._maybe_purge(conn, now)
+            row = conn.execute(
+                "SELECT rec_id FROM recommendations WHERE user_id = ? AND entity = ? AND neighbor = ?",
+                (user_id, entity, neighbor),
+            ).fetchone()
+            if row is not None:
+                return row[0]
+            conn.execute(
+                "INSERT INTO rec_counters (user_id, next_id) VALUES (?, 1) "
+                "ON CONFLICT(user_id) DO UPDATE SET next_id = next_id + 1",
+                (user_id,),
+            )
+            rec_id = conn.execute("SELECT next_id FROM rec_counters WHERE user_id = ?", (user_id,)).fetchone()[0]
+            conn.execute(
+                "INSERT INTO recommendations (user_id, rec_id, entity, neighbor, created_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, rec_id, entity, neighbor, now),
+            )
+            # Keep only the newest max_entries for this user
+            conn.execute(
+                "DELETE FROM recommendations WHERE user_id = ? AND rec_id <= ?",
+                (user_id, rec_id - self.max_entries),
+            )
+            return rec_id
+
+    def pop(self, user_id: str, rec_id: int):
+        """Remove and return {"id", "entity", "neighbor"} for rec_id, or None."""
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT entity, neighbor, created_at FROM recommendations WHERE user_id = ? AND rec_id = ?",
+                (user_id, rec_id),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM recommendations WHERE user_id = ? AND rec_id = ?", (user_id, rec_id))
+            if now - row[2] > self.ttl:
+                return None
+            return {"id": rec_id, "entity": row[0], "neighbor": row[1]}
+
+    def items(self, user_id: str):
+        cutoff = time.time() - self.ttl
+        rows = self._conn().execute(
+            "SELECT rec_id, entity, neighbor FROM recommendations "
+            "WHERE user_id = ? AND created_at >= ? ORDER BY rec_id",
+            (user_id, cutoff),
+        ).fetchall()
+        return [{"id": r[0], "entity": r[1], "neighbor": r[2]} for r in rows]
+
+    def clear(self, user_id: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM recommendations WHERE user_id = ?", (user_id,))
@@ -0,0 +1,101 @@
+import pytest
+
+from annotations import AnnotationStreamParser, sse_event
+
+ANSWER = (
+    "[Fish Oil|Dietary Supplement]($N1) may [reduce]($R1, $N1, $N2) "
+    "[cognitive decline]($N2), see [this review](https://example.org/a). "
+    '|| ["Fish Oil", "cognitive decline"]'
+)
+
+
+def parse(chunks):
+    parser = AnnotationStreamParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.close())
+    return parser, events
+
+
+def text_of(events):
+    return "".join(data["text"] for kind, data in events if kind == "text")
+
+
+def kinds(events):
+    return [kind for kind, _ in events if kind != "text"]
+
+
+def test_whole_answer():
+    parser, events = parse([ANSWER])
+    assert kinds(events) == ["entity", "relation", "entity", "triple", "question_entities"]
+    assert parser.entities["$N1"] == {"id": "$N1", "name": "Fish Oil", "category": "Dietary Supplement"}
+    assert parser.entities["$N2"]["category"] is None
+    assert [(t["head"], t["relation"], t["tail"]) for t in parser.triples] == \
+        [("Fish Oil", "reduce", "cognitive decline")]
+    assert events[-1] == ("question_entities", {"entities": ["Fish Oil", "cognitive decline"]})
+    # Markdown links are left in the text run
+    assert text_of(events) == " may  , see [this review](https://example.org/a). "
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 13])
+def test_chunk_boundaries_do_not_change_the_events(size):
+    _, whole = parse([ANSWER])
+    _, events = parse([ANSWER[i:i + size] for i in range(0, len(ANSWER), size)])
+    assert kinds(events) == kinds(whole)
+    assert [data for kind, data in events if kind != "text"] == [data for kind, data in whole if kind != "text"]
+    assert text_of(events) == text_of(whole)
+
+
+def test_separator_split_across_chunks():
+    _, events = parse(["no tags here |", '| ["Omega-3"]'])
+    assert text_of(events) == "no tags here "
+    assert events[-1] == ("question_entities", {"entities": ["Omega-3"]})
+
+
+def test_single_pipe_stays_text():
+    _, events = parse(["a |", " b"])
+    assert text_of(events) == "a | b"
+    assert kinds(events) == []
+
+
+def test_open_tag_is_held_until_it_closes():
+    parser = AnnotationStreamParser()
+    assert parser.feed("see [Fish") == [("text", {"text": "see "})]
+    assert parser.feed(" Oil]($N") == []
+    events = parser.feed("1) now")
+    assert events == [("entity", {"id": "$N1", "name": "Fish Oil", "category": None}), ("text", {"text": " now"})]
+
+
+def test_triple_waits_for_a_later_entity():
+    parser, events = parse(["[Fish Oil]($N1) [lowers]($R1, $N1, $N2) ", "[triglycerides]($N2)"])
+    assert kinds(events) == ["entity", "relation", "entity", "triple"]
+    assert parser.triples[0]["tail"] == "triglycerides"
+
+
+def test_triple_with_an_unknown_entity_is_flushed_on_close():
+    parser, events = parse(["[Fish Oil]($N1) [lowers]($R1, $N1, $N9)"])
+    assert kinds(events) == ["entity", "relation", "triple"]
+    assert parser.triples[0]["head"] == "Fish Oil" and parser.triples[0]["tail"] is None
+
+
+def test_relation_with_several_links():
+    parser, events = parse(["[A]($N1) [B]($N2) [C]($N3) [slow]($R2, $N1, $N3; $R3, $N2, $N3)"])
+    relation = next(data for kind, data in events if kind == "relation")
+    assert relation["links"] == [{"id": "$R2", "head": "$N1", "tail": "$N3"},
+                                 {"id": "$R3", "head": "$N2", "tail": "$N3"}]
+    assert [(t["head"], t["tail"]) for t in parser.triples] == [("A", "C"), ("B", "C")]
+
+
+def test_unclosed_bracket_is_text_on_close():
+    _, events = parse(["an [unclosed bracket"])
+    assert text_of(events) == "an [unclosed bracket"
+
+
+def test_question_entities_without_json():
+    _, events = parse(['answer || "Fish Oil", "EPA"'])
+    assert events[-1] == ("question_entities", {"entities": ["Fish Oil", "EPA"]})
+
+
+def test_sse_event():
+    assert sse_event("entity", {"id": "$N1"}) == 'event: entity\ndata: {"id": "$N1"}\n\n'
@@ -0,0 +1,128 @@
+import sqlite3
+
+import pytest
+
+import graph_state
+from graph_state import ConversationGraphStore, triple_key
+
+
+def turn(head, rel, tail, head_label=None):
+    """One added triple as index.py builds it: (tkey, nodes, edges, name mapping)."""
+    nodes = [{"id": head, "label": head_label or head}, {"id": tail, "label": tail}]
+    edges = [{"source": head, "target": tail, "category": rel}]
+    return triple_key((head, rel, tail)), nodes, edges, {head: head, tail: tail}
+
+
+def ids(items):
+    return sorted(item.get("id") or (item["source"], item["target"]) for item in items)
+
+
+@pytest.fixture
+def store():
+    return ConversationGraphStore(":memory:")
+
+
+def test_apply_bumps_the_version(store):
+    delta = store.apply("u", 0, [turn("fish oil", "reduces", "inflammation")], [])
+    assert delta["version"] == 1 and store.version("u") == 1
+    assert ids(delta["added"]["nodes"]) == ["fish oil", "inflammation"]
+    assert len(delta["added"]["edges"]) == 1
+    assert store.known_triples("u", [triple_key(("Fish Oil", "reduces", "inflammation")), "other"]) == \
+        {triple_key(("fish oil", "reduces", "inflammation"))}
+
+
+def test_stale_version_is_a_conflict(store):
+    store.apply("u", 0, [turn("a", "r", "b")], [])
+    assert store.apply("u", 0, [turn("a", "r", "c")], []) is None
+    # The losing update left nothing behind
+    assert store.version("u") == 1
+    assert ids(store.snapshot("u")["added"]["nodes"]) == ["a", "b"]
+
+
+def test_users_are_independent(store):
+    store.apply("u", 0, [turn("a", "r", "b")], [])
+    assert store.apply("v", 0, [turn("a", "r", "b")], [])["version"] == 1
+    assert store.snapshot("v")["added"]["nodes"]
+
+
+def test_shared_node_is_removed_with_its_last_triple(store):
+    ab, ac = turn("a", "r", "b"), turn("a", "r", "c")
+    store.apply("u", 0, [ab, ac], [])
+
+    delta = store.apply("u", 1, [], [ab[0]])
+    assert ids(delta["removed"]["nodes"]) == ["b"]
+    assert ids(delta["removed"]["edges"]) == [("a", "b")]
+
+    delta = store.apply("u", 2, [], [ac[0]])
+    assert ids(delta["removed"]["nodes"]) == ["a", "c"]
+    assert store.snapshot("u")["added"] == {"nodes": [], "edges": []}
+
+
+def test_repeated_triple_adds_nothing(store):
+    store.apply("u", 0, [turn("a", "r", "b")], [])
+    delta = store.apply("u", 1, [turn("a", "r", "b")], [])
+    assert delta["added"] == {"nodes": [], "edges": []} and delta["version"] == 2
+
+
+def test_changed_node_data_is_reported(store):
+    store.apply("u", 0, [turn("a", "r", "b")], [])
+    delta = store.apply("u", 1, [turn("a", "r", "c", head_label="A")], [])
+    assert delta["changed"]["nodes"] == [{"id": "a", "label": "A"}]
+    assert ids(delta["added"]["nodes"]) == ["c"]
+
+
+def test_reset_keeps_counting_up(store):
+    store.apply("u", 0, [turn("a", "r", "b")], [])
+    store.reset("u")
+    assert store.version("u") == 2
+    assert store.apply("u", 1, [turn("a", "r", "b")], []) is None
+    assert store.snapshot("u")["added"]["nodes"] == []
+
+
+def test_max_triples_drops_the_oldest():
+    store = ConversationGraphStore(":memory:", max_triples=2)
+    store.apply("u", 0, [turn("a", "r", "b")], [])
+    store.apply("u", 1, [turn("c", "r", "d")], [])
+    delta = store.apply("u", 2, [turn("e", "r", "f")], [])
+    assert ids(delta["removed"]["nodes"]) == ["a", "b"]
+    assert ids(store.snapshot("u")["added"]["nodes"]) == ["c", "d", "e", "f"]
+
+
+def test_turn_larger_than_the_cap_is_kept_whole():
+    store = ConversationGraphStore(":memory:", max_triples=1)
+    delta = store.apply("u", 0, [turn("a", "r", "b"), turn("c", "r", "d")], [])
+    assert delta["removed"] == {"nodes": [], "edges": []}
+    assert len(store.snapshot("u")["added"]["edges"]) == 2
+
+
+def test_idle_graphs_expire(monkeypatch):
+    store = ConversationGraphStore(":memory:", ttl=2 * graph_state.SESSION_PURGE_INTERVAL)
+    now = [1000.0]
+    monkeypatch.setattr(graph_state.time, "time", lambda: now[0])
+    store.apply("old", 0, [turn("a", "r", "b")], [])
+    store.apply("kept", 0, [turn("a", "r", "b")], [])
+
+    now[0] += 1.5 * graph_state.SESSION_PURGE_INTERVAL
+    store.touch("kept")
+    now[0] += graph_state.SESSION_PURGE_INTERVAL
+    store.apply("new", 0, [turn("c", "r", "d")], [])
+
+    assert store.version("old") == 0 and store.snapshot("old")["added"]["nodes"] == []
+    assert store.version("kept") == 1
+
+
+def test_old_schema_is_migrated(tmp_path):
+    path = str(tmp_path / "graph.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE graph_versions (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID;
+        CREATE TABLE graph_triples (user_id TEXT NOT NULL, tkey TEXT NOT NULL, contrib TEXT NOT NULL,
+                                    PRIMARY KEY (user_id, tkey)) WITHOUT ROWID;
+        INSERT INTO graph_versions VALUES ('u', 3);
+    """)
+    conn.close()
+
+    store = ConversationGraphStore(path, ttl=60)
+    # Purging straight away must not drop the migrated graph
+    store.apply("v", 0, [turn("a", "r", "b")], [])
+    assert store.version("u") == 3
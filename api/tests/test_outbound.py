@@ -0,0 +1,183 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+import outbound
+from outbound import (BACKGROUND, INTERACTIVE, NORMAL, BucketStore, OutboundBusy, OutboundScheduler, RateLimited,
+                      retry_after_seconds)
+
+LIMITS = {"test": {"rpm": 6000, "tpm": 0, "key_rpm": 6000, "key_tpm": 0}}
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(outbound.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(outbound, "OUTBOUND_ENABLED", True)
+    monkeypatch.setattr(outbound, "OUTBOUND_BACKOFF_BASE", 0.01)
+    return OutboundScheduler(BucketStore(":memory:"), limits=LIMITS, max_wait=5)
+
+
+def test_bucket_refills_at_its_rate(clock):
+    store = BucketStore(":memory:", burst_seconds=10)
+    bucket = [("p", 60, 0)]  # one request per second, ten in a full bucket
+    for _ in range(10):
+        assert store.take(bucket, 0) == 0
+    assert store.take(bucket, 0) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert store.take(bucket, 0) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert store.take(bucket, 0) == 0
+    # Refill stops at the burst size
+    clock.now += 3600
+    for _ in range(10):
+        assert store.take(bucket, 0) == 0
+    assert store.take(bucket, 0) > 0
+
+
+def test_token_limit(clock):
+    store = BucketStore(":memory:", burst_seconds=60)
+    bucket = [("p", 0, 600)]  # 10 tokens a second, 600 in a full bucket
+    assert store.take(bucket, 500) == 0
+    assert store.take(bucket, 200) == pytest.approx(10.0)
+    clock.now += 10
+    assert store.take(bucket, 200) == 0
+
+
+def test_take_is_all_or_nothing(clock):
+    store = BucketStore(":memory:", burst_seconds=60)
+    assert store.take([("a", 1, 0)], 0) == 0
+    # "a" is empty, so "b" must not be charged either
+    assert store.take([("b", 1, 0), ("a", 1, 0)], 0) > 0
+    assert store.take([("b", 1, 0)], 0) == 0
+
+
+def test_reserve_is_left_for_interactive_calls(clock):
+    store = BucketStore(":memory:", burst_seconds=60)
+    bucket = [("p", 10, 0)]
+    for _ in range(8):
+        assert store.take(bucket, 0, reserve=0.2) == 0
+    assert store.take(bucket, 0, reserve=0.2) > 0
+    assert store.take(bucket, 0) == 0
+
+
+def test_block_pauses_a_bucket(clock):
+    store = BucketStore(":memory:")
+    store.block("p", 600, 0, clock.now + 5)
+    assert store.take([("p", 600, 0)], 0) == pytest.approx(5.0)
+    clock.now += 5
+    assert store.take([("p", 600, 0)], 0) == 0
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds({"retry-after-ms": "250"}) == pytest.approx(0.25)
+    assert retry_after_seconds({"Retry-After": "3"}) == 3.0
+    assert retry_after_seconds({"Retry-After": formatdate(time.time() + 30, usegmt=True)}) == \
+        pytest.approx(30, abs=2)
+    assert retry_after_seconds({}) == outbound.OUTBOUND_DEFAULT_RETRY_AFTER
+    assert retry_after_seconds({"Retry-After": "soon"}) == outbound.OUTBOUND_DEFAULT_RETRY_AFTER
+
+
+def flaky(*errors, result="ok"):
+    errors = list(errors)
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_retry_after_blocks_the_next_attempt(scheduler):
+    fn, calls = flaky(RateLimited(429, {"Retry-After-Ms": "200"}))
+    assert scheduler.call("test", "key", fn) == "ok"
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.18
+    assert scheduler.rate_limited == 1 and scheduler.retries == 1
+
+
+def test_429_pauses_only_the_key(scheduler):
+    fn, _ = flaky(RateLimited(429, {"Retry-After": "60"}))
+    with pytest.raises(OutboundBusy):
+        scheduler.call("test", "key", fn)
+    # Another key on the same provider is not held back
+    t0 = time.monotonic()
+    assert scheduler.call("test", "other", lambda: "ok") == "ok"
+    assert time.monotonic() - t0 < 1
+
+
+def test_503_pauses_the_provider(scheduler):
+    fn, _ = flaky(RateLimited(503, {"Retry-After": "60"}))
+    with pytest.raises(OutboundBusy):
+        scheduler.call("test", "key", fn)
+    with pytest.raises(OutboundBusy):
+        scheduler.call("test", "other", lambda: "ok")
+
+
+def test_transport_errors_back_off_and_retry(scheduler):
+    fn, calls = flaky(ConnectionError("reset"), TimeoutError("slow"))
+    assert scheduler.call("test", "key", fn) == "ok"
+    assert len(calls) == 3 and scheduler.transient_errors == 2
+
+
+def test_other_errors_are_not_retried(scheduler):
+    fn, calls = flaky(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        scheduler.call("test", "key", fn)
+    assert len(calls) == 1 and scheduler.retries == 0
+
+
+def test_attempts_are_bounded(scheduler):
+    fn, calls = flaky(*[RateLimited(429, {"Retry-After-Ms": "1"})] * 10)
+    with pytest.raises(RateLimited):
+        scheduler.call("test", "key", fn)
+    assert len(calls) == scheduler.max_attempts
+
+
+def test_async_call_waits_for_retry_after(scheduler):
+    errors = [RateLimited(429, {"Retry-After-Ms": "200"})]
+
+    async def afn():
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    t0 = time.monotonic()
+    assert asyncio.run(scheduler.acall("test", "key", afn)) == "ok"
+    assert time.monotonic() - t0 >= 0.18
+
+
+def test_waiting_calls_on_a_key_are_ordered_by_priority(scheduler):
+    for priority in (BACKGROUND, NORMAL, INTERACTIVE, NORMAL):
+        scheduler._enqueue("test:key", priority)
+    queue = scheduler._queues["test:key"]
+    order = []
+    while queue:
+        order.append(queue[0][0])
+        scheduler._leave("test:key", queue[0])
+    assert order == [INTERACTIVE, NORMAL, NORMAL, BACKGROUND]
+
+
+def test_background_calls_are_demoted(scheduler, monkeypatch):
+    seen = []
+    monkeypatch.setattr(scheduler, "acquire", lambda provider, key, tokens, priority: seen.append(priority))
+    scheduler.call("test", "key", lambda: None, priority=INTERACTIVE)
+    with outbound.background_calls():
+        scheduler.call("test", "key", lambda: None, priority=INTERACTIVE)
+    assert seen == [INTERACTIVE, BACKGROUND]
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("flask", "requests", "httpx", "openai"):
+    pytest.importorskip(module)
+
+import recommend  # noqa: E402
+from serper_cache import SerperCache  # noqa: E402
+
+HEAD = "fish oil"
+
+
+def evidence(hint):
+    weight = {"strong": 6.0, "weak": 1.0, "missing": 0.0}[hint]
+    return {"weighted_count": weight, "count": int(weight), "confidence": 0.5, "ui_hint": hint,
+            "papers": [], "sources": []}
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Stub out Serper: .hints maps tails to a ui_hint (default "weak"), .tails records the searches in order."""
+    searches = SimpleNamespace(hints={}, tails=[], cache=SerperCache(":memory:"))
+
+    def verify_pair(serper_key, head, rel, tail, use_cache=True):
+        searches.tails.append(tail)
+        return evidence(searches.hints.get(tail, "weak"))
+
+    monkeypatch.setattr(recommend, "_verify_pair", verify_pair)
+    monkeypatch.setattr(recommend, "get_serper_cache", lambda: searches.cache)
+    return searches
+
+
+def cache_result(cache, tail, rel="associated_with"):
+    cache.put(recommend._pair_query(HEAD, rel, tail), {"organic": [{"link": "https://pubmed.ncbi.nlm.nih.gov/1/"}]})
+
+
+def candidates(*tails):
+    return [("associated_with", t) for t in tails]
+
+
+def run(cands, prior, k, budget, deadline=5.0):
+    report = {}
+    entries = list(recommend._iter_by_evidence("key", HEAD, cands, prior, k, budget, deadline, True, report))
+    return [e["tail"] for e in entries], report
+
+
+def test_next_wave_fills_only_the_missing_top_k():
+    queue = list("abcdef")
+    report = {"calls": 0, "skipped": 6}
+    assert recommend._next_wave(queue, strong=1, k=3, budget=10, report=report) == ["a", "b"]
+    assert report == {"calls": 2, "skipped": 4}
+    assert recommend._next_wave(queue, strong=3, k=3, budget=10, report=report) == []
+    # The budget caps the wave, then stops it
+    assert recommend._next_wave(queue, strong=0, k=3, budget=3, report=report) == ["c"]
+    assert recommend._next_wave(queue, strong=0, k=3, budget=3, report=report) == []
+    assert queue == ["d", "e", "f"] and report == {"calls": 3, "skipped": 3}
+
+
+def test_cached_searches_are_free_and_come_first(searches):
+    cache_result(searches.cache, "cognition")
+    tails, report = run(candidates("triglycerides", "cognition"), {}, k=1, budget=5)
+    assert tails[0] == "cognition"
+    assert report["cached"] == 1
+    assert "cognition" not in searches.tails
+
+
+def test_searches_follow_the_prior(searches):
+    searches.hints.update(a="strong", b="strong", c="strong")
+    tails, report = run(candidates("a", "b", "c", "d"), {"c": 40, "b": 10, "d": 10}, k=2, budget=10)
+    # Highest prior first; equal priors keep the generator's order. One wave runs concurrently.
+    assert set(searches.tails) == {"c", "b"}
+    assert report == {"calls": 2, "cached": 0, "skipped": 2, "timed_out": 0}
+
+
+def test_weak_results_trigger_another_wave(searches):
+    searches.hints.update(b="strong", c="strong")
+    tails, report = run(candidates("a", "b", "c", "d"), {}, k=2, budget=10)
+    assert set(searches.tails[:2]) == {"a", "b"} and searches.tails[2:] == ["c"]
+    assert report["calls"] == 3 and report["skipped"] == 1
+
+
+def test_budget_bounds_the_searches(searches):
+    tails, report = run(candidates(*"abcdefgh"), {}, k=5, budget=3)
+    assert len(searches.tails) == 3
+    assert report["calls"] == 3 and report["skipped"] == 5
+
+
+def test_cached_results_are_counted_before_searching(searches):
+    searches.hints["a"] = "strong"
+    for tail in ("x", "y"):
+        cache_result(searches.cache, tail)
+    # The cached results score "weak" (one source), so one search is still needed for k=1
+    tails, report = run(candidates("x", "y", "a", "b"), {}, k=1, budget=10)
+    assert searches.tails == ["a"]
+    assert report == {"calls": 1, "cached": 2, "skipped": 1, "timed_out": 0}
+
+
+def test_iter_all_searches_everything(searches):
+    cache_result(searches.cache, "x")
+    report = {}
+    tails = [e["tail"] for e in recommend._iter_all("key", HEAD, candidates("x", "a", "b"), 5.0, True, report)]
+    assert tails[0] == "x" and sorted(tails[1:]) == ["a", "b"]
+    assert report == {"calls": 2, "cached": 1, "skipped": 0, "timed_out": 0}
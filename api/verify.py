@@ -1,14 +1,29 @@
-from flask import Blueprint, request, jsonify
-from neo4j import GraphDatabase
+from flask import Blueprint, Response, request, jsonify
 from flask_cors import cross_origin
-import traceback, os, re
+import traceback, os, re, time, json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from kg_backend import (
+    Q_BATCH_DIRECT, Q_BATCH_TWO_HOP, kg_query,
+    get_kg_backend, name_params, normalize_name,
+)
+from verify_cache import get_verify_cache, verify_cache_key
+from kg_snapshot import get_kg_snapshot
+from annotations import sse_event
 
 verify_bp = Blueprint("verify_bp", __name__)
 
-NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "passwordknow")
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+# All lookups go through the configured KG backend (kg_backend.py): Neo4j
+# by default, or the embedded SQLite copy with KG_BACKEND=sqlite.
+
+# Background verification for /api/chat "verify" mode
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", "4"))
+VERIFY_DRAIN_TIMEOUT = float(os.getenv("VERIFY_DRAIN_TIMEOUT", "15"))
+_verify_pool = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix="verify")
+
+# Streaming /api/verify: at most VERIFY_STREAM_WORKERS triples (one Neo4j
+# session each) in flight per process, separate from the chat pool above
+VERIFY_STREAM_WORKERS = int(os.getenv("VERIFY_STREAM_WORKERS", "8"))
+_stream_pool = ThreadPoolExecutor(max_workers=VERIFY_STREAM_WORKERS, thread_name_prefix="verify-stream")
 
 # Natural phrasing → canonical KG relation
 REL_MAP = {
@@ -51,6 +66,321 @@ def normalize_relation(rel: str) -> str:
         return REL_MAP[s[:-1]]
     return s.upper().replace(" ", "_")  # fallback e.g. "associated with" → "ASSOCIATED_WITH"
 
+VERIFY_BATCH = os.getenv("VERIFY_BATCH", "0") == "1"
+
+INVALID_RESULT = {"head": None, "relation": None, "tail": None,
+                  "status": "unsure", "count": 0, "papers": [], "ui_hint": "missing"}
+
+
+def parse_triple(triple):
+    """Return (head, rel, tail, rel_norm), or None for a malformed triple."""
+    if not isinstance(triple, (list, tuple)) or len(triple) != 3:
+        return None
+    head, rel, tail = (triple[0] or "").strip(), (triple[1] or "").strip(), (triple[2] or "").strip()
+    return head, rel, tail, normalize_relation(rel)
+
+
+def triple_result(head, rel, tail, rel_norm, status, count=0, papers=None):
+    ui_hint = {"supported": "solid", "relevant": "weak"}.get(status, "missing")
+    return {
+        "head": head, "relation": rel, "tail": tail,
+        "rel_norm": rel_norm,
+        "status": status, "count": count, "papers": papers or [], "ui_hint": ui_hint
+    }
+
+
+def _check_triple(session, parsed, h, t):
+    """verify_triple's lookups for the KG names h and t; the result reports the parsed names."""
+    head, rel, tail, rel_norm = parsed
+
+    snapshot = get_kg_snapshot()
+    if snapshot is not None:
+        status, _ = snapshot.check(normalize_name(h), rel_norm, normalize_name(t))
+        if status != "supported":
+            return triple_result(head, rel, tail, rel_norm, status)
+        # Papers are not held in the snapshot; this lookup is anchored on a known edge
+
+    edge = session.exact_edge(h, t, rel_norm)
+    if edge:
+        return triple_result(head, rel, tail, rel_norm, "supported", edge["count"], edge["papers"])
+
+    if session.alternate_relation(h, t, rel_norm):
+        return triple_result(head, rel, tail, rel_norm, "relevant")
+
+    if session.two_hop(h, t):
+        return triple_result(head, rel, tail, rel_norm, "relevant")
+
+    # 4) Nothing → unsure
+    return triple_result(head, rel, tail, rel_norm, "unsure")
+
+
+def alias_names(aliases, head, tail):
+    """(head, tail) with synonyms replaced by their canonical names, or None if neither is an alias."""
+    h, t = aliases.get(normalize_name(head), head), aliases.get(normalize_name(tail), tail)
+    return (h, t) if (h, t) != (head, tail) else None
+
+
+def verify_triple(session, triple):
+    """Check one [head, relation, tail] against the KG: supported → relevant → unsure."""
+    parsed = parse_triple(triple)
+    if parsed is None:
+        return dict(INVALID_RESULT)
+    head, tail = parsed[0], parsed[2]
+    result = _check_triple(session, parsed, head, tail)
+    if result["status"] == "unsure":
+        # 5) Retry once with synonyms resolved to their canonical entities
+        names = alias_names(session.resolve_aliases([head, tail]), head, tail)
+        if names is not None:
+            result = _check_triple(session, parsed, *names)
+    return result
+
+
+def verify_triples_batched(session, triples):
+    """Same results as [verify_triple(session, t) for t in triples] (Neo4j only): two queries, plus
+    one alias lookup and two more queries when some triple is unsure."""
+    results = [None] * len(triples)
+    params = []
+    parsed = {}
+    for i, triple in enumerate(triples):
+        p = parse_triple(triple)
+        if p is None:
+            results[i] = dict(INVALID_RESULT)
+            continue
+        parsed[i] = p
+        params.append({"idx": i, **name_params(p[0], p[2]), "relCanon": p[3]})
+    _verify_params(session, params, parsed, results)
+
+    unsure = [q for q in params if results[q["idx"]]["status"] == "unsure"]
+    if unsure:
+        aliases = session.resolve_aliases([n for q in unsure for n in (q["head"], q["tail"])])
+        retry = []
+        for q in unsure:
+            names = alias_names(aliases, q["head"], q["tail"])
+            if names is not None:
+                retry.append({**q, **name_params(*names)})
+        _verify_params(session, retry, parsed, results)
+
+    return results
+
+
+def _verify_params(session, params, parsed, results):
+    """Fill results for the batched query rows in params: direct edges first, then two-hop paths."""
+    unresolved = []
+    if params:
+        for rec in session.run(kg_query(Q_BATCH_DIRECT), triples=params):
+            i = rec["idx"]
+            exact = rec["exact"]
+            if exact:
+                results[i] = triple_result(*parsed[i], "supported",
+                                           int(exact["count"] or 0), exact["papers"] or [])
+            elif rec["linked"]:
+                results[i] = triple_result(*parsed[i], "relevant")
+            else:
+                unresolved.append(i)
+
+    if unresolved:
+        unresolved = set(unresolved)
+        pending = [q for q in params if q["idx"] in unresolved]
+        for rec in session.run(kg_query(Q_BATCH_TWO_HOP), triples=pending):
+            i = rec["idx"]
+            results[i] = triple_result(*parsed[i], "relevant" if rec["two_hop"] else "unsure")
+
+
+def _verify_each(session, triples):
+    return [verify_triple(session, triple) for triple in triples]
+
+
+def cache_split(cache, triples):
+    """Look triples up in the verify cache: (results with hits filled in, miss indices, miss keys)."""
+    results = [None] * len(triples)
+    misses, keys = [], []
+    for i, triple in enumerate(triples):
+        parsed = parse_triple(triple)
+        if parsed is None:
+            results[i] = dict(INVALID_RESULT)
+            continue
+        head, rel, tail, rel_norm = parsed
+        key = verify_cache_key(head, rel_norm, tail)
+        hit = cache.get(key)
+        if hit is not None:
+            # Cached under the lowercased key; echo this request's spelling
+            results[i] = {**hit, "head": head, "relation": rel, "tail": tail}
+        else:
+            misses.append(i)
+            keys.append(key)
+    return results, misses, keys
+
+
+def cache_fill(cache, results, misses, keys, computed, elapsed):
+    per_triple = elapsed / len(misses) if misses else 0.0
+    for i, key, result in zip(misses, keys, computed):
+        cache.put(key, result, per_triple)
+        results[i] = result
+    return results
+
+
+def verify_with_cache(session, triples, compute=_verify_each):
+    """compute(session, triples) for the triples the verify cache cannot answer."""
+    cache = get_verify_cache()
+    if cache is None:
+        return compute(session, triples)
+    if cache.version_due():
+        cache.set_version(session.version_stamp())
+    results, misses, keys = cache_split(cache, triples)
+    if misses:
+        t0 = time.perf_counter()
+        computed = compute(session, [triples[i] for i in misses])
+        cache_fill(cache, results, misses, keys, computed, time.perf_counter() - t0)
+    return results
+
+
+def verify_one(triple):
+    with get_kg_backend().session() as session:
+        return verify_with_cache(session, [triple])[0]
+
+
+def verify_list(triples, batch=False, use_cache=True):
+    """Verify a whole /api/verify request on the configured backend."""
+    kg = get_kg_backend()
+    # With a KG snapshot the checks run in process and only supported triples reach the backend
+    batched = batch and kg.supports_batch and get_kg_snapshot() is None
+    compute = verify_triples_batched if batched else _verify_each
+    with kg.session() as session:
+        if use_cache:
+            return verify_with_cache(session, triples, compute)
+        return compute(session, triples)
+
+
+class SpeculativeVerifier:
+    """Verify triples on the background pool while the chat answer is still streaming.
+
+    submit() takes the "triple" events of AnnotationStreamParser; ready() and
+    drain() return the matching "verification" event payloads.
+    """
+
+    def __init__(self, pool=None):
+        self._pool = pool or _verify_pool
+        self._futures = {}   # (head, rel_norm, tail) -> Future, so repeats are checked once
+        self._pending = []   # (triple event, Future) not yet reported
+
+    def submit(self, triple):
+        if not triple.get("head") or not triple.get("tail"):
+            return
+        key = (triple["head"].lower(), normalize_relation(triple["relation"]), triple["tail"].lower())
+        fut = self._futures.get(key)
+        if fut is None:
+            fut = self._start([triple["head"], triple["relation"], triple["tail"]])
+            self._futures[key] = fut
+        self._pending.append((triple, fut))
+
+    def _start(self, triple):
+        return self._pool.submit(verify_one, triple)
+
+    def ready(self):
+        done = [(t, f) for t, f in self._pending if f.done()]
+        if done:
+            self._pending = [(t, f) for t, f in self._pending if not f.done()]
+        return [self._event(t, f) for t, f in done]
+
+    def drain(self, timeout=VERIFY_DRAIN_TIMEOUT):
+        """Yield the remaining results as they finish, giving up after timeout seconds."""
+        futures = {f for _, f in self._pending}
+        deadline = time.monotonic() + timeout
+        while self._pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            for event in self.ready():
+                yield event
+            futures = {f for _, f in self._pending}
+        for triple, fut in self._pending:
+            fut.cancel()
+            yield self._error_event(triple, "verification timed out")
+        self._pending = []
+
+    @staticmethod
+    def _event(triple, fut):
+        try:
+            result = dict(fut.result())
+        except Exception as e:
+            return SpeculativeVerifier._error_event(triple, str(e))
+        return {"relation_id": triple["relation_id"], "head_id": triple["head_id"],
+                "tail_id": triple["tail_id"], **result}
+
+    @staticmethod
+    def _error_event(triple, message):
+        parsed = parse_triple([triple["head"], triple["relation"], triple["tail"]])
+        return {"relation_id": triple["relation_id"], "head_id": triple["head_id"],
+                "tail_id": triple["tail_id"], **triple_result(*parsed, "unsure"), "error": message}
+
+
+def stream_verify(triples, pool=None, window=VERIFY_STREAM_WORKERS):
+    """Yield (index, result) in completion order, keeping at most `window` triples in flight."""
+    pool = pool or _stream_pool
+    queue = iter(enumerate(triples))
+    inflight = {}
+
+    def fill():
+        for i, triple in queue:
+            inflight[pool.submit(verify_one, triple)] = i
+            if len(inflight) >= window:
+                return
+
+    fill()
+    try:
+        while inflight:
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = inflight.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    result = stream_error(triples[i], str(e))
+                yield i, result
+            fill()
+    finally:
+        # Client went away: drop the triples that have not started yet
+        for fut in inflight:
+            fut.cancel()
+
+
+def stream_error(triple, message):
+    parsed = parse_triple(triple)
+    result = triple_result(*parsed, "unsure") if parsed else dict(INVALID_RESULT)
+    return {**result, "error": message}
+
+
+class StreamSummary:
+    """Counts for the closing record of a streamed /api/verify response."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_result_ms = None
+        self.counts = {"supported": 0, "relevant": 0, "unsure": 0, "errors": 0}
+
+    def add(self, result):
+        if self.first_result_ms is None:
+            self.first_result_ms = (time.perf_counter() - self.started) * 1e3
+        self.counts[result["status"]] += 1
+        if "error" in result:
+            self.counts["errors"] += 1
+
+    def record(self):
+        return {"total": sum(v for k, v in self.counts.items() if k != "errors"), **self.counts,
+                "first_result_ms": self.first_result_ms,
+                "elapsed_ms": (time.perf_counter() - self.started) * 1e3}
+
+
+def stream_line(fmt, event, data):
+    if fmt == "sse":
+        return sse_event(event, data)
+    return json.dumps(data if event == "result" else {event: data}) + "\n"
+
+
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
 @verify_bp.route("/api/verify", methods=["POST"])
 @cross_origin(origins="*", methods=["POST"], allow_headers=["Content-Type"])
 def verify_triples():
@@ -60,88 +390,31 @@ def verify_triples():
         if not isinstance(triples, list):
             return jsonify({"error": "triples must be a list of [head, relation, tail]"}), 400
 
-        results = []
-        with driver.session() as session:
-            for triple in triples:
-                if not isinstance(triple, (list, tuple)) or len(triple) != 3:
-                    results.append({"head": None, "relation": None, "tail": None,
-                                    "status": "unsure", "count": 0, "papers": [], "ui_hint": "missing"})
-                    continue
-
-                head, rel, tail = (triple[0] or "").strip(), (triple[1] or "").strip(), (triple[2] or "").strip()
-                rel_norm = normalize_relation(rel)
-
-                # 1) Exact relation match (align with recommend.py: label :Entity, property .name)
-                q_exact = """
-                MATCH (h:Entity)-[r]->(t:Entity)
-                WHERE toLower(h.name) = toLower($head)
-                  AND toLower(t.name) = toLower($tail)
-                  AND toUpper(type(r)) = toUpper($relCanon)
-                RETURN coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END) AS count,
-                       coalesce(r.papers, []) AS papers
-                LIMIT 1
-                """
-                rec = session.run(q_exact, head=head, tail=tail, relCanon=rel_norm).single()
-                if rec:
-                    count = int(rec["count"] or 0)
-                    papers = rec["papers"] or []
-                    results.append({
-                        "head": head, "relation": rel, "tail": tail,
-                        "rel_norm": rel_norm,
-                        "status": "supported", "count": count, "papers": papers, "ui_hint": "solid"
-                    })
-                    continue
-
-                # 2) Same entities but different relation → relevant
-                q_alt_rel = """
-                MATCH (h:Entity)-[r]->(t:Entity)
-                WHERE toLower(h.name) = toLower($head)
-                  AND toLower(t.name) = toLower($tail)
-                  AND toUpper(type(r)) <> toUpper($relCanon)
-                RETURN type(r) AS alt_rel,
-                       coalesce(r.count, CASE WHEN r.papers IS NULL THEN 0 ELSE size(r.papers) END) AS count
-                ORDER BY count DESC
-                LIMIT 1
-                """
-                alt = session.run(q_alt_rel, head=head, tail=tail, relCanon=rel_norm).single()
-                if alt:
-                    results.append({
-                        "head": head, "relation": rel, "tail": tail,
-                        "rel_norm": rel_norm,
-                        "status": "relevant", "count": 0, "papers": [], "ui_hint": "weak"
-                    })
-                    continue
-
-                # 3) Two-hop head → X → tail → relevant
-                q_two_hop = """
-                MATCH (h:Entity)-[r1]->(m)-[r2]->(t:Entity)
-                WHERE toLower(h.name) = toLower($head)
-                  AND toLower(t.name) = toLower($tail)
-                RETURN m.name AS bridge,
-                       type(r1) AS r1_type, type(r2) AS r2_type,
-                       coalesce(r1.count, CASE WHEN r1.papers IS NULL THEN 0 ELSE size(r1.papers) END) +
-                       coalesce(r2.count, CASE WHEN r2.papers IS NULL THEN 0 ELSE size(r2.papers) END) AS total_weight
-                ORDER BY total_weight DESC
-                LIMIT 1
-                """
-                two_hop = session.run(q_two_hop, head=head, tail=tail).single()
-                if two_hop:
-                    results.append({
-                        "head": head, "relation": rel, "tail": tail,
-                        "rel_norm": rel_norm,
-                        "status": "relevant", "count": 0, "papers": [], "ui_hint": "weak"
-                    })
-                    continue
-
-                # 4) Nothing → unsure
-                results.append({
-                    "head": head, "relation": rel, "tail": tail,
-                    "rel_norm": rel_norm,
-                    "status": "unsure", "count": 0, "papers": [], "ui_hint": "missing"
-                })
+        # "stream": "ndjson" | "sse" writes each result as soon as it is known
+        fmt = data.get("stream")
+        if fmt:
+            if fmt not in STREAM_MIMETYPES:
+                return jsonify({"error": "stream must be 'ndjson' or 'sse'"}), 400
+            return _stream_response(triples, fmt)
+
+        # "batch": resolve every triple in at most two UNWIND queries instead of up to 3 per triple
+        batch = bool(data.get("batch", VERIFY_BATCH))
+        results = verify_list(triples, batch, bool(data.get("cache", True)))
 
         return jsonify({"results": results}), 200
 
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
+
+
+def _stream_response(triples, fmt):
+    def generate():
+        summary = StreamSummary()
+        for i, result in stream_verify(triples):
+            summary.add(result)
+            yield stream_line(fmt, "result", {"index": i, **result})
+        yield stream_line(fmt, "summary", summary.record())
+
+    return Response(generate(), content_type=STREAM_MIMETYPES[fmt],
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
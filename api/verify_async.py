@@ -0,0 +1,237 @@
+from quart import Blueprint, Response, request, jsonify
+from neo4j import AsyncGraphDatabase
+import asyncio
+import time
+import traceback
+
+from kg_backend import (
+    Q_EXACT, Q_ALT_REL, Q_TWO_HOP, Q_ALIASES, KG_BACKEND, logger,
+    alias_lookup_params, kg_query, name_norm_enabled, name_params, neo4j_settings, normalize_name,
+)
+from verify import (
+    INVALID_RESULT, VERIFY_DRAIN_TIMEOUT, VERIFY_STREAM_WORKERS, STREAM_MIMETYPES,
+    alias_names, parse_triple, triple_result, cache_split, cache_fill, SpeculativeVerifier,
+    StreamSummary, stream_error, stream_line, verify_list, verify_one,
+)
+from verify_cache import Q_KG_VERSION, get_verify_cache
+from kg_snapshot import get_kg_snapshot
+
+# asyncio counterpart of verify.py for the ASGI app (asgi.py). With the Neo4j
+# backend the lookups use the async driver; an embedded backend has no
+# network wait, so its sync path runs in a worker thread instead.
+verify_abp = Blueprint("verify_abp", __name__)
+
+adriver = None
+
+
+@verify_abp.before_app_serving
+async def _open_driver():
+    global adriver
+    if KG_BACKEND == "neo4j":
+        uri, auth = neo4j_settings()
+        adriver = AsyncGraphDatabase.driver(uri, auth=auth)
+        # Settle KG_NAME_NORM=auto off the event loop before the first lookup
+        await asyncio.to_thread(name_norm_enabled)
+
+
+@verify_abp.after_app_serving
+async def _close_driver():
+    if adriver is not None:
+        await adriver.close()
+
+
+class AsyncNeo4jSession:
+    """Awaitable kg_backend.Neo4jSession lookups used by verification."""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def _single(self, query, **params):
+        result = await self.session.run(query, **params)
+        return await result.single()
+
+    async def exact_edge(self, head, tail, rel_norm):
+        rec = await self._single(kg_query(Q_EXACT), **name_params(head, tail), relCanon=rel_norm)
+        return {"count": int(rec["count"] or 0), "papers": rec["papers"] or []} if rec else None
+
+    async def alternate_relation(self, head, tail, rel_norm):
+        rec = await self._single(kg_query(Q_ALT_REL), **name_params(head, tail), relCanon=rel_norm)
+        return {"relation": rec["alt_rel"], "count": int(rec["count"] or 0)} if rec else None
+
+    async def two_hop(self, head, tail):
+        rec = await self._single(kg_query(Q_TWO_HOP), **name_params(head, tail))
+        return {"bridge": rec["bridge"], "weight": int(rec["total_weight"] or 0)} if rec else None
+
+    async def resolve_aliases(self, names):
+        # name_norm_enabled() was settled off the loop when the driver was opened
+        if not name_norm_enabled():
+            return {}
+        params = alias_lookup_params(names)
+        if not params:
+            return {}
+        try:
+            result = await self.session.run(Q_ALIASES, names=params)
+            return {r["alias"]: r["canonical"] async for r in result}
+        except Exception as e:
+            logger.warning("alias lookup failed: %s", e)
+            return {}
+
+    async def version_stamp(self):
+        return str((await self._single(Q_KG_VERSION))["stamp"])
+
+
+async def _acheck_triple(session, parsed, h, t):
+    head, rel, tail, rel_norm = parsed
+
+    snapshot = get_kg_snapshot()
+    if snapshot is not None:
+        status, _ = snapshot.check(normalize_name(h), rel_norm, normalize_name(t))
+        if status != "supported":
+            return triple_result(head, rel, tail, rel_norm, status)
+
+    edge = await session.exact_edge(h, t, rel_norm)
+    if edge:
+        return triple_result(head, rel, tail, rel_norm, "supported", edge["count"], edge["papers"])
+
+    if await session.alternate_relation(h, t, rel_norm):
+        return triple_result(head, rel, tail, rel_norm, "relevant")
+
+    if await session.two_hop(h, t):
+        return triple_result(head, rel, tail, rel_norm, "relevant")
+
+    return triple_result(head, rel, tail, rel_norm, "unsure")
+
+
+async def averify_triple(session, triple):
+    """verify.verify_triple for the asyncio app."""
+    parsed = parse_triple(triple)
+    if parsed is None:
+        return dict(INVALID_RESULT)
+    head, tail = parsed[0], parsed[2]
+    result = await _acheck_triple(session, parsed, head, tail)
+    if result["status"] == "unsure":
+        names = alias_names(await session.resolve_aliases([head, tail]), head, tail)
+        if names is not None:
+            result = await _acheck_triple(session, parsed, *names)
+    return result
+
+
+async def _averify_each(session, triples):
+    return [await averify_triple(session, triple) for triple in triples]
+
+
+async def averify_with_cache(session, triples):
+    # The cache's shared tier is SQLite: keep its reads and writes off the event loop
+    cache = await asyncio.to_thread(get_verify_cache)
+    if cache is None:
+        return await _averify_each(session, triples)
+    if cache.version_due():
+        stamp = await session.version_stamp()
+        await asyncio.to_thread(cache.set_version, stamp)
+    results, misses, keys = await asyncio.to_thread(cache_split, cache, triples)
+    if misses:
+        t0 = time.perf_counter()
+        computed = await _averify_each(session, [triples[i] for i in misses])
+        await asyncio.to_thread(cache_fill, cache, results, misses, keys, computed, time.perf_counter() - t0)
+    return results
+
+
+async def _averify_in_session(triple):
+    if adriver is None:
+        return await asyncio.to_thread(verify_one, triple)
+    async with adriver.session() as session:
+        return (await averify_with_cache(AsyncNeo4jSession(session), [triple]))[0]
+
+
+class AsyncSpeculativeVerifier(SpeculativeVerifier):
+    """SpeculativeVerifier running on the event loop with the async driver."""
+
+    def _start(self, triple):
+        return asyncio.create_task(_averify_in_session(triple))
+
+    async def adrain(self, timeout=VERIFY_DRAIN_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while self._pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.wait({f for _, f in self._pending}, timeout=remaining,
+                               return_when=asyncio.FIRST_COMPLETED)
+            for event in self.ready():
+                yield event
+        for triple, fut in self._pending:
+            fut.cancel()
+            yield self._error_event(triple, "verification timed out")
+        self._pending = []
+
+
+async def astream_verify(triples, window=VERIFY_STREAM_WORKERS):
+    """Async stream_verify: (index, result) in completion order, at most `window` sessions open."""
+    queue = iter(enumerate(triples))
+    inflight = {}
+
+    def fill():
+        for i, triple in queue:
+            inflight[asyncio.create_task(_averify_in_session(triple))] = i
+            if len(inflight) >= window:
+                return
+
+    fill()
+    try:
+        while inflight:
+            done, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = inflight.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    result = stream_error(triples[i], str(e))
+                yield i, result
+            fill()
+    finally:
+        for task in inflight:
+            task.cancel()
+
+
+@verify_abp.route("/api/verify", methods=["POST"])
+async def verify_triples():
+    try:
+        data = await request.get_json(force=True) or {}
+        triples = data.get("triples", [])
+        if not isinstance(triples, list):
+            return jsonify({"error": "triples must be a list of [head, relation, tail]"}), 400
+
+        fmt = data.get("stream")
+        if fmt:
+            if fmt not in STREAM_MIMETYPES:
+                return jsonify({"error": "stream must be 'ndjson' or 'sse'"}), 400
+            return _stream_response(triples, fmt)
+
+        use_cache = bool(data.get("cache", True))
+        if adriver is None:
+            results = await asyncio.to_thread(verify_list, triples, False, use_cache)
+        else:
+            async with adriver.session() as neo4j_session:
+                session = AsyncNeo4jSession(neo4j_session)
+                if use_cache:
+                    results = await averify_with_cache(session, triples)
+                else:
+                    results = await _averify_each(session, triples)
+
+        return jsonify({"results": results}), 200
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+def _stream_response(triples, fmt):
+    async def generate():
+        summary = StreamSummary()
+        async for i, result in astream_verify(triples):
+            summary.add(result)
+            yield stream_line(fmt, "result", {"index": i, **result})
+        yield stream_line(fmt, "summary", summary.record())
+
+    return Response(generate(), content_type=STREAM_MIMETYPES[fmt],
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,226 @@
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Result cache for /api/verify.
+#
+# Verification outcomes are keyed on (lower(head), normalize_relation(rel),
+# lower(tail)) and live in an in-process LRU with a TTL. Behind it sits an
+# optional shared tier so gunicorn workers reuse each other's results; the
+# default one is a SQLite file in WAL mode, and any object with
+# get(version, key) / put(version, key, value, expires_at) / clear() can be
+# plugged in with VERIFY_CACHE_SHARED=module:factory.
+#
+# Every entry belongs to a KG version stamp (the :KGMeta node's version, or
+# the node/relationship counts when the graph has none). The stamp is
+# re-read at most every VERIFY_CACHE_VERSION_POLL seconds; when it changes,
+# the LRU is dropped and the shared tier stops returning older entries.
+
+VERIFY_CACHE_ENABLED = os.getenv("VERIFY_CACHE", "1") != "0"
+VERIFY_CACHE_TTL = float(os.getenv("VERIFY_CACHE_TTL", str(6 * 3600)))
+VERIFY_CACHE_MEMORY_ITEMS = int(os.getenv("VERIFY_CACHE_MEMORY_ITEMS", "50000"))
+VERIFY_CACHE_VERSION_POLL = float(os.getenv("VERIFY_CACHE_VERSION_POLL", "60"))
+VERIFY_CACHE_SHARED = os.getenv("VERIFY_CACHE_SHARED", "sqlite")
+VERIFY_CACHE_PATH = os.getenv("VERIFY_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "verify.sqlite3"))
+
+Q_KG_VERSION = """
+OPTIONAL MATCH (m:KGMeta)
+WITH max(m.version) AS version
+CALL { MATCH (n) RETURN count(n) AS nodes }
+CALL { MATCH ()-[r]->() RETURN count(r) AS rels }
+RETURN coalesce(toString(version), toString(nodes) + ":" + toString(rels)) AS stamp
+"""
+
+
+def verify_cache_key(head: str, rel_norm: str, tail: str) -> str:
+    return "\x1f".join((head.lower(), rel_norm, tail.lower()))
+
+
+class SQLiteVerifyTier:
+    """Shared tier in a SQLite file; only rows of the current KG version are served."""
+
+    def __init__(self, path=VERIFY_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._shared = sqlite3.connect(path, check_same_thread=False) if path == ":memory:" else None
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS verify_results (
+                    key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def _conn(self):
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, version: str, key: str):
+        row = self._conn().execute(
+            "SELECT result FROM verify_results WHERE key = ? AND version = ? AND expires_at > ?",
+            (key, version, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, version: str, key: str, value, expires_at: float):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO verify_results (key, version, result, expires_at) VALUES (?, ?, ?, ?)",
+                (key, version, json.dumps(value), expires_at),
+            )
+
+    def drop_other_versions(self, version: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM verify_results WHERE version <> ? OR expires_at <= ?",
+                         (version, time.time()))
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM verify_results")
+
+
+def _load_shared_tier(spec: str):
+    if not spec or spec == "none":
+        return None
+    if spec == "sqlite":
+        return SQLiteVerifyTier()
+    module, _, factory = spec.partition(":")
+    return getattr(importlib.import_module(module), factory or "create_tier")()
+
+
+class VerifyCache:
+    def __init__(self, shared=None, ttl=VERIFY_CACHE_TTL, memory_items=VERIFY_CACHE_MEMORY_ITEMS,
+                 version_poll=VERIFY_CACHE_VERSION_POLL):
+        self.shared = shared
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self.version_poll = version_poll
+        self.version = None
+        self._checked_at = 0.0
+        self._memory = OrderedDict()  # key -> (result, expires_at)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._miss_seconds = 0.0      # time spent computing the results that were stored
+
+    def version_due(self) -> bool:
+        return self.version is None or time.monotonic() - self._checked_at >= self.version_poll
+
+    def set_version(self, stamp: str):
+        """Record the KG version stamp; a change drops every cached result."""
+        stamp = str(stamp)
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if stamp == self.version:
+                return
+            if self.version is not None:
+                self.invalidations += 1
+            self.version = stamp
+            self._memory.clear()
+        if self.shared is not None and hasattr(self.shared, "drop_other_versions"):
+            self.shared.drop_other_versions(stamp)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._memory[key]
+            version = self.version
+        value = None
+        if self.shared is not None and version is not None:
+            try:
+                value = self.shared.get(version, key)
+            except Exception:
+                value = None  # the shared tier is best effort
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            self._remember(key, value, now + self.ttl)
+        return dict(value)
+
+    def put(self, key: str, value, elapsed: float = 0.0):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._miss_seconds += elapsed
+            self._remember(key, value, expires_at)
+            version = self.version
+        if self.shared is not None and version is not None:
+            try:
+                self.shared.put(version, key, value, expires_at)
+            except Exception:
+                pass
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.shared_hits
+            lookups = hits + self.misses
+            avg_miss = self._miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "kg_version": self.version,
+                "memory_hits": self.memory_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "avg_miss_ms": avg_miss * 1e3,
+                # Each hit avoided one KG lookup of average miss cost
+                "latency_saved_s": hits * avg_miss,
+                "invalidations": self.invalidations,
+                "memory_items": len(self._memory),
+                "shared_tier": type(self.shared).__name__ if self.shared is not None else None,
+            }
+
+
+_verify_cache = None
+_verify_cache_lock = threading.Lock()
+
+
+def get_verify_cache() -> Optional[VerifyCache]:
+    global _verify_cache
+    if not VERIFY_CACHE_ENABLED:
+        return None
+    with _verify_cache_lock:
+        if _verify_cache is None:
+            _verify_cache = VerifyCache(shared=_load_shared_tier(VERIFY_CACHE_SHARED))
+        return _verify_cache
+
+
+def verify_cache_stats():
+    cache = get_verify_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
@@ -0,0 +1,83 @@
+"""Measure how many /api/chat streams a running server can hold at once.
+
+Each level opens N streaming requests simultaneously and records time to first
+byte, total stream time and failures. Requests use the answer cache ("cache":
+true) so one warm-up call pays for the model and every measured stream is a
+paced replay: the server has to keep the connection open for the whole replay
+without any OpenAI cost.
+
+Compare the serving setups against the same question, e.g.
+
+    flask --app api/index run -p 5175                           # Flask dev server
+    cd api && gunicorn -w 4 -b :5175 index:app                  # gunicorn, sync workers
+    cd api && hypercorn -w 1 -b :5175 asgi:app                  # ASGI (asgi.py)
+
+    python scripts/bench_concurrent_streams.py --url http://localhost:5175 --levels 10,50,100,200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+QUESTION = "What are the benefits of fish oil?"
+
+
+async def one_stream(client, url, api_key):
+    t0 = time.perf_counter()
+    ttfb = None
+    async with client.stream(
+        "POST", f"{url}/api/chat",
+        headers={"x-openai-key": api_key},
+        json={"messages": [{"role": "user", "content": QUESTION}], "cache": True},
+    ) as resp:
+        resp.raise_for_status()
+        async for _ in resp.aiter_raw():
+            if ttfb is None:
+                ttfb = time.perf_counter() - t0
+    return ttfb or 0.0, time.perf_counter() - t0
+
+
+def _pct(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_level(url, api_key, n, timeout):
+    limits = httpx.Limits(max_connections=n, max_keepalive_connections=n)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(one_stream(client, url, api_key) for _ in range(n)),
+                                       return_exceptions=True)
+        wall = time.perf_counter() - t0
+    ok = [r for r in results if not isinstance(r, Exception)]
+    ttfb = [r[0] for r in ok]
+    total = [r[1] for r in ok]
+    print(f"{n:>6} {len(ok):>6} {n - len(ok):>6} "
+          f"{_pct(ttfb, 0.5):>9.3f} {_pct(ttfb, 0.95):>9.3f} "
+          f"{statistics.mean(total) if total else float('nan'):>9.3f} {wall:>8.2f}")
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:5175")
+    ap.add_argument("--levels", default="1,10,50,100,200")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--api-key", default=os.getenv("OPENAI_API_KEY", ""))
+    args = ap.parse_args()
+
+    # Warm the answer cache so measured streams are replays
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        await one_stream(client, args.url, args.api_key)
+
+    print(f"{'conc':>6} {'ok':>6} {'failed':>6} {'ttfb_p50':>9} {'ttfb_p95':>9} {'mean_s':>9} {'wall_s':>8}")
+    for n in (int(x) for x in args.levels.split(",")):
+        await run_level(args.url, args.api_key, n, args.timeout)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""Per-triple verification latency on the Neo4j and embedded SQLite KG backends.
+
+Samples edges from the SQLite store (build it first with
+`python api/kg_backend.py load-sqlite`), mixes in made-up pairs so every
+outcome is exercised, and verifies the same triples on each backend. With
+--neo4j the Bolt server is measured too and the statuses are compared.
+
+    python scripts/bench_kg_backends.py --triples 500
+    python scripts/bench_kg_backends.py --triples 500 --memory --neo4j
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from kg_backend import KG_SQLITE_PATH, Neo4jKG, SQLiteKG  # noqa: E402
+from verify import verify_triple  # noqa: E402
+
+
+def sample_triples(kg, n, seed):
+    rng = random.Random(seed)
+    with kg.session() as session:
+        edges = [[e["head_name"], e["rel"], e["tail_name"]] for e in session.export_edges()]
+    real = rng.sample(edges, min(n // 2, len(edges)))
+    names = [t[0] for t in edges] + [t[2] for t in edges]
+    fake = [[rng.choice(names), rng.choice(["treats", "prevents", "affects"]), rng.choice(names)]
+            for _ in range(n - len(real))]
+    triples = real + fake
+    rng.shuffle(triples)
+    return triples
+
+
+def run(kg, triples):
+    with kg.session() as session:
+        t0 = time.perf_counter()
+        results = [verify_triple(session, t) for t in triples]
+        return results, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sqlite", default=KG_SQLITE_PATH)
+    ap.add_argument("--memory", action="store_true", help="also measure an in-memory copy of the store")
+    ap.add_argument("--neo4j", action="store_true")
+    ap.add_argument("--triples", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    sqlite_kg = SQLiteKG(args.sqlite)
+    triples = sample_triples(sqlite_kg, args.triples, args.seed)
+    backends = {"sqlite": sqlite_kg}
+    if args.memory:
+        memory_kg = SQLiteKG(":memory:")
+        with sqlite_kg.session() as session:
+            memory_kg.load(session.export_edges(), log=lambda msg: None)
+        backends["sqlite :memory:"] = memory_kg
+    if args.neo4j:
+        backends["neo4j"] = Neo4jKG()
+
+    print(f"{len(triples)} triples\n")
+    print(f"{'backend':>16} {'ms/triple':>10} {'same as sqlite':>15}")
+    baseline = None
+    for name, kg in backends.items():
+        results, seconds = run(kg, triples)
+        statuses = [r["status"] for r in results]
+        baseline = baseline or statuses
+        same = sum(a == b for a, b in zip(statuses, baseline)) / len(statuses)
+        print(f"{name:>16} {seconds * 1e3 / len(triples):>10.3f} {same:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
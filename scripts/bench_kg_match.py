@@ -0,0 +1,87 @@
+"""Recall@k and latency of IVF entity matching against the exact path.
+
+Uses the built KG index when one exists (queries are perturbed KG rows, as
+answer entities are near-duplicates of KG names); otherwise a synthetic,
+clustered float32 matrix of --rows x --dim.
+
+    python scripts/bench_kg_match.py --nprobe 1,4,16,64
+    python scripts/bench_kg_match.py --synthetic --rows 1000000 --dim 1536
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from kg_index import load_kg_index, normalize_rows, topk_inner_product  # noqa: E402
+from kg_ann import IVFIndex  # noqa: E402
+
+
+def synthetic_matrix(rows, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    out = np.empty((rows, dim), dtype=np.float32)
+    step = 100_000
+    for start in range(0, rows, step):
+        n = min(step, rows - start)
+        out[start:start + n] = centers[rng.integers(0, clusters, n)] + \
+            0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows(out)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--synthetic", action="store_true")
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=64, help="query entities per batch (an answer has ~10-40)")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--nlist", type=int, default=None)
+    ap.add_argument("--nprobe", default="1,4,16,64")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    index = None if args.synthetic else load_kg_index(backend="exact")
+    if index is not None:
+        matrix = np.asarray(index.matrix)
+        print(f"KG index: {matrix.shape[0]} x {matrix.shape[1]}")
+    else:
+        matrix = synthetic_matrix(args.rows, args.dim, max(16, args.rows // 2000), args.seed)
+        print(f"synthetic: {matrix.shape[0]} x {matrix.shape[1]}")
+
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.choice(matrix.shape[0], size=args.queries, replace=False)
+    queries = normalize_rows(matrix[picks] + 0.05 * rng.standard_normal((args.queries, matrix.shape[1])).astype(np.float32))
+
+    (truth, _), exact_s = timed(lambda: topk_inner_product(queries, matrix, args.k), args.repeat)
+
+    t0 = time.perf_counter()
+    ivf = IVFIndex.build(matrix, args.nlist, seed=args.seed)
+    build_s = time.perf_counter() - t0
+    print(f"IVF build: {len(ivf.centroids)} lists in {build_s:.1f}s\n")
+
+    print(f"{'backend':>10} {'nprobe':>7} {'recall@k':>9} {'top1':>6} {'ms/batch':>9} {'ms/query':>9} {'speedup':>8}")
+    print(f"{'exact':>10} {'-':>7} {1.0:>9.3f} {1.0:>6.3f} {exact_s * 1e3:>9.2f} {exact_s * 1e3 / args.queries:>9.3f} {1.0:>8.1f}")
+    for nprobe in (int(x) for x in args.nprobe.split(",")):
+        (approx, _), ivf_s = timed(lambda: ivf.search(queries, matrix, args.k, nprobe), args.repeat)
+        recall = np.mean([len(set(a) & set(t)) / len(t) for a, t in zip(approx, truth)])
+        top1 = np.mean(approx[:, 0] == truth[:, 0])
+        print(f"{'ivf':>10} {nprobe:>7} {recall:>9.3f} {top1:>6.3f} {ivf_s * 1e3:>9.2f} "
+              f"{ivf_s * 1e3 / args.queries:>9.3f} {exact_s / ivf_s:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Memory, throughput and top-1 agreement of float16 / int8 KG matching vs float32.
+
+Uses the built KG index when one exists, otherwise a synthetic matrix.
+
+    python scripts/bench_kg_quantized.py
+    python scripts/bench_kg_quantized.py --synthetic --rows 500000 --dim 1536
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from kg_index import (  # noqa: E402
+    KG_RESCORE_CANDIDATES, load_kg_index, normalize_rows, quantize_matrix, rescored_topk, topk_inner_product,
+)
+from bench_kg_match import synthetic_matrix, timed  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--synthetic", action="store_true")
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=256)
+    ap.add_argument("--candidates", type=int, default=KG_RESCORE_CANDIDATES)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    index = None if args.synthetic else load_kg_index(backend="exact", dtype="float32")
+    if index is not None:
+        matrix = np.asarray(index.matrix)
+        print(f"KG index: {matrix.shape[0]} x {matrix.shape[1]}")
+    else:
+        matrix = synthetic_matrix(args.rows, args.dim, max(16, args.rows // 2000), args.seed)
+        print(f"synthetic: {matrix.shape[0]} x {matrix.shape[1]}")
+
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.choice(matrix.shape[0], size=args.queries, replace=False)
+    queries = normalize_rows(matrix[picks] + 0.05 * rng.standard_normal((args.queries, matrix.shape[1])).astype(np.float32))
+
+    (truth, _), base_s = timed(lambda: topk_inner_product(queries, matrix, 1), args.repeat)
+    print(f"\n{'dtype':>8} {'resident MiB':>13} {'bytes/node':>11} {'queries/s':>10} {'top1 agree':>11}")
+    print(f"{'float32':>8} {matrix.nbytes / 2**20:>13.1f} {matrix.nbytes // len(matrix):>11} "
+          f"{args.queries / base_s:>10.0f} {1.0:>11.4f}")
+
+    for dtype in ("float16", "int8"):
+        compact, scales = quantize_matrix(matrix, dtype)
+        nbytes = compact.nbytes + (scales.nbytes if scales is not None else 0)
+        (got, _), s = timed(lambda: rescored_topk(queries, compact, scales, matrix, 1, args.candidates), args.repeat)
+        agree = float(np.mean(got[:, 0] == truth[:, 0]))
+        print(f"{dtype:>8} {nbytes / 2**20:>13.1f} {nbytes // len(matrix):>11} "
+              f"{args.queries / s:>10.0f} {agree:>11.4f}")
+    print("\n(float16/int8 re-score their top candidates from the float32 file, which stays memory-mapped)")
+
+
+if __name__ == "__main__":
+    main()
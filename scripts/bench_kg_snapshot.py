@@ -0,0 +1,87 @@
+"""Memory and check latency of the in-process KG snapshot (api/kg_snapshot.py).
+
+Builds a synthetic graph with a power-law degree distribution, so a few hub
+entities have thousands of neighbours, and times exact / alternate-relation /
+two-hop checks for random pairs and for pairs anchored on the largest hubs.
+Pass --kg to load the configured KG backend instead.
+
+    python scripts/bench_kg_snapshot.py --nodes 200000 --edges 2000000
+    python scripts/bench_kg_snapshot.py --kg
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from kg_snapshot import KGSnapshot  # noqa: E402
+
+
+def synthetic_edges(nodes, edges, rel_types, seed):
+    rng = np.random.default_rng(seed)
+    # Zipf-like endpoints: low ids are hubs
+    heads = np.minimum(rng.zipf(1.3, edges) - 1, nodes - 1)
+    tails = rng.integers(0, nodes, edges)
+    rels = rng.integers(0, rel_types, edges)
+    counts = rng.integers(1, 50, edges)
+    for h, r, t, c in zip(heads, rels, tails, counts):
+        yield f"e{h}", f"REL_{r}", f"e{t}", int(c)
+
+
+def bench(snapshot, pairs, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for head, rel, tail in pairs:
+            snapshot.check(head, rel, tail)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(pairs)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--kg", action="store_true")
+    ap.add_argument("--nodes", type=int, default=200_000)
+    ap.add_argument("--edges", type=int, default=2_000_000)
+    ap.add_argument("--rel-types", type=int, default=40)
+    ap.add_argument("--pairs", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    if args.kg:
+        from dotenv import load_dotenv
+        from pathlib import Path
+        load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / "api" / ".env")
+        from kg_backend import get_kg_backend
+        snapshot = KGSnapshot.load(get_kg_backend())
+    else:
+        snapshot = KGSnapshot.from_edges(synthetic_edges(args.nodes, args.edges, args.rel_types, args.seed))
+    load_s = time.perf_counter() - t0
+
+    report = snapshot.memory_report()
+    print(f"{report['nodes']} nodes, {report['edges']} edges, {report['relation_types']} relation types "
+          f"loaded in {load_s:.1f}s")
+    print(f"memory: {report['total_mb']:.1f} MiB ({report['array_mb']:.1f} arrays + {report['names_mb']:.1f} names), "
+          f"{report['bytes_per_edge']:.1f} B/edge\n")
+
+    rng = np.random.default_rng(args.seed + 1)
+    names, rels = snapshot.names, snapshot.rel_types
+    degree = np.diff(snapshot.out_ptr)
+    hubs = np.argsort(degree)[::-1][:50]
+    random_pairs = [(names[rng.integers(len(names))], rels[rng.integers(len(rels))], names[rng.integers(len(names))])
+                    for _ in range(args.pairs)]
+    hub_pairs = [(names[rng.choice(hubs)], rels[rng.integers(len(rels))], names[rng.choice(hubs)])
+                 for _ in range(args.pairs)]
+
+    print(f"{'pairs':>8} {'max degree':>11} {'us/check':>9}")
+    print(f"{'random':>8} {int(degree.max()):>11} {bench(snapshot, random_pairs, args.repeat) * 1e6:>9.1f}")
+    print(f"{'hubs':>8} {int(degree[hubs].min()):>11} {bench(snapshot, hub_pairs, args.repeat) * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Throughput and 429s against a rate-capped stand-in provider: per-call backoff vs the shared scheduler.
+
+Starts a local HTTP server that allows --cap requests per second (429 with
+Retry-After beyond that), then runs --workers processes (like gunicorn
+workers) of --threads callers each for --seconds. "backoff" retries each 429
+on its own with random exponential backoff (the old tenacity policy);
+"scheduler" sends every call through outbound.py with one SQLite state file.
+
+    python scripts/bench_outbound.py --cap 50 --workers 4 --threads 8
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+
+def serve(cap):
+    window, lock = deque(), threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            now = time.time()
+            with lock:
+                while window and now - window[0] > 1.0:
+                    window.popleft()
+                allowed = len(window) < cap
+                if allowed:
+                    window.append(now)
+            self.send_response(200 if allowed else 429)
+            if not allowed:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *a):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 256
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def post(url):
+    req = urllib.request.Request(url, data=b"{}", method="POST")
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return resp.read()
+
+
+def run_worker(mode, url, threads, seconds, out):
+    import outbound
+
+    stats = {"ok": 0, "429": 0, "failed": 0}
+    lock = threading.Lock()
+    stop = time.time() + seconds
+
+    def count(name):
+        with lock:
+            stats[name] += 1
+
+    def attempt():
+        try:
+            return post(url)
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                count("429")
+                raise outbound.RateLimited(429, dict(e.headers))
+            raise
+
+    def backoff_caller():
+        while time.time() < stop:
+            for n in range(6):
+                try:
+                    attempt()
+                    count("ok")
+                    break
+                except outbound.RateLimited:
+                    time.sleep(random.uniform(0, min(20, 2 ** n)))
+                except OSError:
+                    count("failed")
+                    break
+            else:
+                count("failed")
+
+    def scheduled_caller():
+        while time.time() < stop:
+            try:
+                outbound.outbound_call("serper", "bench", attempt)
+                count("ok")
+            except Exception:
+                count("failed")
+
+    target = scheduled_caller if mode == "scheduler" else backoff_caller
+    pool = [threading.Thread(target=target) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    out.put(stats)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cap", type=int, default=50, help="provider limit, requests per second")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=10)
+    args = ap.parse_args()
+
+    server = serve(args.cap)
+    url = f"http://127.0.0.1:{server.server_port}/search"
+    print(f"cap {args.cap}/s, {args.workers} workers x {args.threads} callers, {args.seconds:.0f}s\n")
+    print(f"{'mode':>10} {'ok/s':>7} {'of cap':>7} {'429s':>6} {'failed':>7}")
+    for mode in ("backoff", "scheduler"):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ.update({
+                "OUTBOUND_STATE_PATH": os.path.join(tmp, "outbound.sqlite3"),
+                "OUTBOUND_SERPER_RPM": str(args.cap * 60), "OUTBOUND_SERPER_KEY_RPM": str(args.cap * 60),
+                "OUTBOUND_BURST_SECONDS": "1",  # the stand-in counts a one-second window
+            })
+            out = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=run_worker, args=(mode, url, args.threads, args.seconds, out))
+                     for _ in range(args.workers)]
+            t0 = time.time()
+            for p in procs:
+                p.start()
+            totals = {"ok": 0, "429": 0, "failed": 0}
+            for _ in procs:
+                for k, v in out.get().items():
+                    totals[k] += v
+            for p in procs:
+                p.join()
+            # backoff callers overrun --seconds while sleeping, so divide by wall time
+            rate = totals["ok"] / (time.time() - t0)
+        print(f"{mode:>10} {rate:>7.1f} {rate / args.cap:>7.0%} {totals['429']:>6} {totals['failed']:>7}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
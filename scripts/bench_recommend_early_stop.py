@@ -0,0 +1,91 @@
+"""Serper calls and top-k agreement: verify-everything vs evidence-ordered early stopping.
+
+Starts a local HTTP server that answers like Serper, with a fixed number of
+result links per candidate (its "true" evidence), and gives the scheduler a
+noisy copy of that evidence as the KG prior (--noise). For each trial the
+candidates are scored both ways; the report shows searches per
+recommendation and how often the top-k sets match.
+
+    python scripts/bench_recommend_early_stop.py --candidates 20 --k 5 --trials 20
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+os.environ.setdefault("SERPER_CACHE", "0")  # every search must reach the stand-in
+os.environ.setdefault("OUTBOUND_SCHEDULER", "0")  # the stand-in has no rate limit to respect
+
+
+def serve(evidence):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            m = re.search(r"Target (\d+)", body.get("q", ""))
+            links = evidence.get(int(m.group(1)), 0) if m else 0
+            payload = json.dumps({"organic": [{"link": f"https://example{i}.org/{self.path}"}
+                                              for i in range(links)]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *a):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--candidates", type=int, default=20)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--budget", type=int, default=10)
+    ap.add_argument("--noise", type=float, default=1.5, help="std-dev of the prior around the true evidence")
+    ap.add_argument("--trials", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    evidence = {}
+    server = serve(evidence)
+    os.environ["SERPER_URL"] = f"http://127.0.0.1:{server.server_port}/search"
+    from flask import Flask
+    import recommend  # noqa: E402 (reads SERPER_URL at import)
+
+    rng = random.Random(args.seed)
+    app = Flask(__name__)
+    full_calls = early_calls = same_topk = 0
+    with app.app_context():
+        for _ in range(args.trials):
+            evidence.clear()
+            evidence.update({i: rng.choice([0, 1, 2, 3, 5, 6, 8]) for i in range(args.candidates)})
+            candidates = [("AFFECTS", f"Target {i}") for i in range(args.candidates)]
+            prior = {f"target {i}": max(0.0, n + rng.gauss(0, args.noise)) for i, n in evidence.items()}
+
+            scored, _ = recommend._verify_candidates("bench", "Fish oil", candidates, 30, use_cache=False)
+            full = {s["tail"]["name"] for s in recommend._rank_and_shape("Fish oil", scored, args.k)}
+            full_calls += len(candidates)
+
+            scored, report = recommend._verify_by_evidence("bench", "Fish oil", candidates, prior, args.k,
+                                                           args.budget, 30, use_cache=False)
+            early = {s["tail"]["name"] for s in recommend._rank_and_shape("Fish oil", scored, args.k)}
+            early_calls += report["calls"]
+            same_topk += full == early
+
+    print(f"{'mode':>11} {'calls/rec':>10} {'top-k match':>12}")
+    print(f"{'all':>11} {full_calls / args.trials:>10.1f} {1.0:>12.2f}")
+    print(f"{'early stop':>11} {early_calls / args.trials:>10.1f} {same_topk / args.trials:>12.2f}")
+    print("\n(top-k compared as sets of tails; ties in evidence can swap equal-scored members)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
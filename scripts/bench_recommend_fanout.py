@@ -0,0 +1,94 @@
+"""Sequential vs concurrent Serper scoring in /api/recommend against a local stand-in.
+
+Starts a local HTTP server that answers like Serper after a random delay
+(--min-ms..--max-ms, with --slow of the calls taking --slow-ms), points
+SERPER_URL at it and scores the same candidates one by one and through
+recommend._verify_candidates. The concurrent time should track the slowest
+single search (or the deadline), not the sum. The "first result" row is what
+a streamed ("stream": "sse") request waits before its first suggestion event.
+
+    python scripts/bench_recommend_fanout.py --candidates 20 --deadline 2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+RESPONSE = json.dumps({"organic": [{"link": "https://pubmed.ncbi.nlm.nih.gov/12345/"},
+                                   {"link": "https://www.nature.com/articles/x"}]}).encode()
+
+
+def serve(args):
+    rng = random.Random(args.seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            with lock:
+                slow = rng.random() < args.slow
+                delay = args.slow_ms if slow else rng.uniform(args.min_ms, args.max_ms)
+            time.sleep(delay / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(RESPONSE)))
+            self.end_headers()
+            self.wfile.write(RESPONSE)
+
+        def log_message(self, *a):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--candidates", type=int, default=20)
+    ap.add_argument("--min-ms", type=float, default=300)
+    ap.add_argument("--max-ms", type=float, default=900)
+    ap.add_argument("--slow", type=float, default=0.05, help="fraction of searches that stall")
+    ap.add_argument("--slow-ms", type=float, default=6000)
+    ap.add_argument("--deadline", type=float, default=2.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    server = serve(args)
+    os.environ["SERPER_URL"] = f"http://127.0.0.1:{server.server_port}/search"
+    from flask import Flask
+    import recommend  # noqa: E402 (reads SERPER_URL at import)
+
+    candidates = [("AFFECTS", f"Target {i}") for i in range(args.candidates)]
+    app = Flask(__name__)
+    with app.app_context():
+        t0 = time.perf_counter()
+        for rel, tail in candidates:
+            recommend._verify_pair("bench", "Fish oil", rel, tail)
+        sequential = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        scored, timed_out = recommend._verify_candidates("bench", "Fish oil", candidates, args.deadline)
+        concurrent = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        first = None
+        for _ in recommend._iter_verified("bench", "Fish oil", candidates, args.deadline):
+            first = time.perf_counter() - t0 if first is None else first
+
+    print(f"{'mode':>11} {'seconds':>8} {'scored':>7} {'timed out':>10}")
+    print(f"{'sequential':>11} {sequential:>8.2f} {len(candidates):>7} {0:>10}")
+    print(f"{'concurrent':>11} {concurrent:>8.2f} {len(scored):>7} {timed_out:>10}")
+    if first is not None:
+        print(f"{'first result':>11} {first:>8.2f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
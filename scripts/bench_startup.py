@@ -0,0 +1,55 @@
+"""Cold-start cost of the serving app: import time, peak RSS and heavy modules loaded.
+
+Each run imports the app module in a fresh interpreter (so nothing is cached
+in sys.modules) and reports the median over --runs. A module listed under
+"heavy" means the request path pulled in analysis tooling it does not need.
+
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --modules index,asgi --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api")
+HEAVY = ["matplotlib", "plotly", "pandas", "scipy", "sklearn"]
+
+PROBE = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024
+print(json.dumps({{"seconds": elapsed, "rss_mb": rss_kb / 1024,
+                   "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                         cwd=API_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--modules", default="index")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'module':>10} {'import s':>9} {'peak RSS MiB':>13}  heavy modules loaded")
+    for module in args.modules.split(","):
+        runs = [probe(module) for _ in range(args.runs)]
+        seconds = statistics.median(r["seconds"] for r in runs)
+        rss = statistics.median(r["rss_mb"] for r in runs)
+        heavy = ", ".join(runs[-1]["heavy"]) or "none"
+        print(f"{module:>10} {seconds:>9.2f} {rss:>13.1f}  {heavy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Latency of /api/verify per-triple vs batched (UNWIND) Cypher against triple count.
+
+Needs a reachable Neo4j (NEO4J_URI / NEO4J_USER / NEO4J_PASSWORD). Half of the
+triples are sampled from real KG edges, half are made-up pairs, so all three
+outcomes (supported / relevant / unsure) are exercised.
+
+    python scripts/bench_verify_batch.py --sizes 1,5,10,25,50,100
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from kg_backend import Neo4jKG, neo4j_driver  # noqa: E402
+from verify import verify_triple, verify_triples_batched  # noqa: E402
+
+Q_SAMPLE = """
+MATCH (h:Entity)-[r]->(t:Entity)
+WITH h, r, t, rand() AS x ORDER BY x LIMIT $n
+RETURN h.name AS head, type(r) AS rel, t.name AS tail
+"""
+
+
+def sample_triples(session, n, seed):
+    rng = random.Random(seed)
+    real = [[r["head"], r["rel"], r["tail"]] for r in session.run(Q_SAMPLE, n=n)]
+    names = [t[0] for t in real] + [t[2] for t in real]
+    fake = [[rng.choice(names), rng.choice(["treats", "prevents", "affects"]), rng.choice(names)]
+            for _ in range(n)]
+    triples = real[: n // 2] + fake[: n - n // 2]
+    rng.shuffle(triples)
+    return triples
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1,5,10,25,50,100")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    print(f"{'triples':>8} {'per-triple ms':>14} {'batched ms':>11} {'speedup':>8} {'same':>5}")
+    with Neo4jKG().session() as session:
+        for n in (int(x) for x in args.sizes.split(",")):
+            triples = sample_triples(session, n, args.seed)
+            seq, seq_s = best_of(lambda: [verify_triple(session, t) for t in triples], args.repeat)
+            bat, bat_s = best_of(lambda: verify_triples_batched(session, triples), args.repeat)
+            same = [r["status"] for r in seq] == [r["status"] for r in bat]
+            print(f"{n:>8} {seq_s * 1e3:>14.1f} {bat_s * 1e3:>11.1f} {seq_s / bat_s:>8.1f} {str(same):>5}")
+    neo4j_driver().close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Time to first result of streamed /api/verify against the buffered response.
+
+Needs a running server and a reachable Neo4j (triples are sampled like
+bench_verify_batch.py). For each size the script posts the same triples once
+buffered and once with "stream": "ndjson"; the buffered first result arrives
+with the last, the streamed one should stay flat as the list grows. Pass
+"cache": false so the verify cache does not hide the KG lookups.
+
+    python scripts/bench_verify_stream.py --url http://localhost:5175 --sizes 10,50,200,1000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from kg_backend import Neo4jKG, neo4j_driver  # noqa: E402
+from bench_verify_batch import sample_triples  # noqa: E402
+
+
+def buffered(client, url, triples):
+    t0 = time.perf_counter()
+    resp = client.post(f"{url}/api/verify", json={"triples": triples, "cache": False})
+    resp.raise_for_status()
+    elapsed = time.perf_counter() - t0
+    return elapsed, elapsed
+
+
+def streamed(client, url, triples):
+    t0 = time.perf_counter()
+    first = None
+    summary = None
+    with client.stream("POST", f"{url}/api/verify",
+                       json={"triples": triples, "cache": False, "stream": "ndjson"}) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            if first is None:
+                first = time.perf_counter() - t0
+            record = json.loads(line)
+            if "summary" in record:
+                summary = record["summary"]
+    assert summary is not None and summary["total"] == len(triples), "stream ended without a full summary"
+    return first, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:5175")
+    ap.add_argument("--sizes", default="10,50,200,1000")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    print(f"{'triples':>8} {'buffered first ms':>18} {'streamed first ms':>18} {'buffered total ms':>18} "
+          f"{'streamed total ms':>18}")
+    with Neo4jKG().session() as session, httpx.Client(timeout=None) as client:
+        for n in (int(x) for x in args.sizes.split(",")):
+            triples = sample_triples(session, n, args.seed)
+            b_first, b_total = buffered(client, args.url, triples)
+            s_first, s_total = streamed(client, args.url, triples)
+            print(f"{n:>8} {b_first * 1e3:>18.1f} {s_first * 1e3:>18.1f} {b_total * 1e3:>18.1f} "
+                  f"{s_total * 1e3:>18.1f}")
+    neo4j_driver().close()
+
+
+if __name__ == "__main__":
+    main()